@@ -0,0 +1,119 @@
+import gzip
+import os
+import re
+import zipfile
+
+from edi_parser_charset import read_edi_file
+from edi_parser_incremental import IncrementalParser
+from edi_parser_main import parse_content
+
+# Decompressed bytes handed to the tokenizer at a time
+STREAM_CHUNK = 1024 * 1024
+
+# A file inside a zip archive is addressed as "archive.zip!member"
+MEMBER_SEPARATOR = '!'
+ZIP_MEMBER = re.compile(r'^(.*?\.zip)!(.+)$', re.IGNORECASE)
+
+ARCHIVE_FILETYPES = [("Archivy", "*.zip *.gz")]
+
+
+def is_zip(filepath):
+    return filepath.lower().endswith('.zip')
+
+
+def is_gzip(filepath):
+    return filepath.lower().endswith('.gz')
+
+
+def split_member(filepath):
+    """(archive, member) of an "archive.zip!member" path, None for other paths"""
+    match = ZIP_MEMBER.match(filepath)
+    return (match.group(1), match.group(2)) if match else None
+
+
+def member_name(filepath):
+    """Name of the EDI file itself: the zip member, or a .gz file without its suffix.
+
+    Partner detection looks at this name, never at the archive's name, which
+    usually says nothing (or something misleading) about the partner."""
+    member = split_member(filepath)
+    if member:
+        return member[1]
+    if is_gzip(filepath):
+        return filepath[:-3]
+    return filepath
+
+
+def input_name(filepath):
+    """Short name for reports: the file name, for a zip member prefixed with the archive's"""
+    member = split_member(filepath)
+    if member:
+        return f"{os.path.basename(member[0])}{MEMBER_SEPARATOR}{os.path.basename(member[1])}"
+    return os.path.basename(filepath)
+
+
+def zip_members(archive):
+    """Files in a zip archive in their stored order (directories left out)"""
+    with zipfile.ZipFile(archive) as zf:
+        return [info.filename for info in zf.infolist() if not info.is_dir()]
+
+
+def expand_inputs(filepaths):
+    """Input paths with every zip archive replaced by its members.
+
+    A member is a separate input, so a process pool parses the members of
+    one archive in parallel; each worker opens the archive and decompresses
+    only its own member. A .gz file holds a single EDI file and stays as it is."""
+    inputs = []
+    for filepath in filepaths:
+        if is_zip(filepath) and os.path.isfile(filepath):
+            inputs.extend(f"{filepath}{MEMBER_SEPARATOR}{name}" for name in zip_members(filepath))
+        else:
+            inputs.append(filepath)
+    return inputs
+
+
+def is_streamed(filepath):
+    return split_member(filepath) is not None or is_gzip(filepath)
+
+
+def open_input(filepath):
+    """Binary stream of an input; zip members and .gz files are decompressed while read"""
+    member = split_member(filepath)
+    if member:
+        zf = zipfile.ZipFile(member[0])
+        try:
+            stream = zf.open(member[1])
+        except BaseException:
+            zf.close()
+            raise
+        # The member stream keeps its own reference to the archive file;
+        # closing the ZipFile here only drops ours
+        zf.close()
+        return stream
+    if is_gzip(filepath):
+        return gzip.open(filepath, 'rb')
+    return open(filepath, 'rb')
+
+
+def parse_stream(name, stream, chunk_size=STREAM_CHUNK, parse_filter=None):
+    """Parse a binary stream chunk by chunk; returns (file_type, parser).
+
+    The partner is detected from `name` and the header at the start of the
+    stream, then the decompressed chunks go straight to the partner parser's
+    segment generator. The whole file is never held in memory or on disk."""
+    incremental = IncrementalParser(name, parse_filter=parse_filter)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        incremental.feed(chunk)
+    return incremental.finish()
+
+
+def parse_input(filepath, parse_filter=None):
+    """(file_type, parser) of a plain EDI file, a zip member or a .gz file"""
+    if not is_streamed(filepath):
+        return parse_content(filepath, read_edi_file(filepath), parse_filter)
+    with open_input(filepath) as stream:
+        return parse_stream(member_name(filepath), stream, parse_filter=parse_filter)
@@ -0,0 +1,454 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from edi_parser_archive import expand_inputs, input_name, member_name, open_input, parse_input, split_member
+from edi_parser_charset import HEADER_SCAN_BYTES
+from edi_parser_columnar import ColumnarDeliveries
+from edi_parser_cummins import build_release_workbook
+from edi_parser_duplicates import UNB_SEGMENT
+from edi_parser_filter import add_filter_arguments, filter_from_args
+from edi_parser_watch import export_parsed
+from edi_parser_workspace import DemandWorkspace, reduce_parsed
+
+PENDING = 'Čeká'
+PARSING = 'Zpracovává se'
+DONE = 'Hotovo'
+FAILED = 'Chyba'
+
+# A job in PARSING longer than this belongs to a worker that died and is taken again
+DEFAULT_LEASE = 600.0
+
+# Throughput is measured over the jobs finished in this last period
+RATE_WINDOW = 300.0
+
+SHARD_KEYS = ('path', 'control')
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def encode_result(result):
+    """Workspace result as JSON for the ledger.
+
+    The ledger may sit on a shared filesystem, so it only ever holds plain
+    data: whoever can write it must not be able to run code in `merge`."""
+    data = dict(result)
+    data['Záznamy'] = result['Záznamy'].to_deliveries()
+    data['Týdny'] = [[partner, part_number, list(week), quantity]
+                     for (partner, part_number, week), quantity in result['Týdny'].items()]
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def decode_result(blob):
+    """Workspace result from encode_result(); ValueError if the blob is not one"""
+    data = json.loads(blob)
+    data['Záznamy'] = ColumnarDeliveries.from_deliveries(data['Záznamy'])
+    data['Týdny'] = {(partner, part_number, tuple(week)): quantity
+                     for partner, part_number, week, quantity in data['Týdny']}
+    return data
+
+
+class JobLedger:
+    """SQLite ledger of a batch run: one row per input with its state, timing and error.
+
+    Workers (processes on one machine or on several machines with the ledger
+    on a shared filesystem) take jobs with `claim`, which picks and marks a
+    job in one transaction, so no input is ever processed twice at the same
+    time. Finished jobs stay DONE, so running the batch again with the same
+    ledger only processes what an interrupted run left unfinished."""
+
+    def __init__(self, path, lease=DEFAULT_LEASE):
+        self.path = path
+        self.lease = lease
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS ulohy ("
+            " poradi INTEGER PRIMARY KEY AUTOINCREMENT, vstup TEXT UNIQUE, stav TEXT,"
+            " pracovnik TEXT, pokusy INTEGER DEFAULT 0, zacatek REAL, konec REAL, doba REAL, chyba TEXT,"
+            " vysledek BLOB)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ulohy_stav ON ulohy (stav)")
+        # Ledgers from before partial results were kept
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(ulohy)")]
+        if 'vysledek' not in columns:
+            self.connection.execute("ALTER TABLE ulohy ADD COLUMN vysledek BLOB")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, inputs):
+        """Register inputs as PENDING; inputs already in the ledger keep their state.
+
+        Returns the number of new jobs."""
+        before = self.connection.total_changes
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO ulohy (vstup, stav) VALUES (?, ?)",
+                ((filepath, PENDING) for filepath in inputs))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return self.connection.total_changes - before
+
+    def retry_failed(self):
+        """Put FAILED jobs back to PENDING; returns their number"""
+        return self.connection.execute(
+            "UPDATE ulohy SET stav = ?, chyba = NULL WHERE stav = ?", (PENDING, FAILED)).rowcount
+
+    def claim(self, worker):
+        """Next job to process (its input), or None when nothing is left to take.
+
+        Picking and marking happen in one transaction, so two workers never
+        get the same job. A job stuck in PARSING for longer than the lease is
+        taken again: its worker was killed together with the run."""
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.connection.execute(
+                "SELECT poradi, vstup FROM ulohy WHERE stav = ? OR (stav = ? AND zacatek < ?)"
+                " ORDER BY poradi LIMIT 1", (PENDING, PARSING, now - self.lease)).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE ulohy SET stav = ?, pracovnik = ?, pokusy = pokusy + 1,"
+                    " zacatek = ?, konec = NULL, doba = NULL, chyba = NULL WHERE poradi = ?",
+                    (PARSING, worker, now, row[0]))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return row[1] if row else None
+
+    def _finish(self, filepath, worker, state, error=None, result=None):
+        now = time.time()
+        # Only the worker holding the job may finish it (the lease may have been taken over)
+        self.connection.execute(
+            "UPDATE ulohy SET stav = ?, konec = ?, doba = ? - zacatek, chyba = ?, vysledek = ?"
+            " WHERE vstup = ? AND pracovnik = ? AND stav = ?",
+            (state, now, now, error, result, filepath, worker, PARSING))
+
+    def done(self, filepath, worker, result=None):
+        """Mark a job done; `result` is its workspace result, kept for the merge step"""
+        self._finish(filepath, worker, DONE,
+                     result=encode_result(result) if result is not None else None)
+
+    def fail(self, filepath, worker, error):
+        self._finish(filepath, worker, FAILED, str(error))
+
+    def results(self):
+        """Workspace results of the done jobs, in the order the inputs were added.
+
+        A result that is not readable JSON (e.g. written by an older version)
+        is skipped, so its job counts as unfinished in the merge."""
+        for (blob,) in self.connection.execute(
+                "SELECT vysledek FROM ulohy WHERE stav = ? AND vysledek IS NOT NULL ORDER BY poradi", (DONE,)):
+            try:
+                yield decode_result(blob)
+            except (ValueError, TypeError, KeyError):
+                continue
+
+    def done_inputs(self):
+        """Inputs of the done jobs, in the order they were added"""
+        return [filepath for (filepath,) in self.connection.execute(
+            "SELECT vstup FROM ulohy WHERE stav = ? ORDER BY poradi", (DONE,))]
+
+    def failures(self):
+        """(input, error) of the failed jobs"""
+        return self.connection.execute(
+            "SELECT vstup, chyba FROM ulohy WHERE stav = ? ORDER BY poradi", (FAILED,)).fetchall()
+
+    def summary(self, now=None):
+        """Job counts per state, throughput over the last minutes and the estimated time left"""
+        now = now or time.time()
+        counts = dict.fromkeys((PENDING, PARSING, DONE, FAILED), 0)
+        counts.update(self.connection.execute("SELECT stav, COUNT(*) FROM ulohy GROUP BY stav").fetchall())
+        finished, first_start, average = self.connection.execute(
+            "SELECT COUNT(*), MIN(zacatek), AVG(doba) FROM ulohy WHERE stav IN (?, ?) AND konec >= ?",
+            (DONE, FAILED, now - RATE_WINDOW)).fetchone()
+        # Jobs per second of all workers together, not the time of one parse
+        rate = finished / (now - first_start) if finished and now > first_start else 0.0
+        remaining = counts[PENDING] + counts[PARSING]
+        return {
+            'Celkem': sum(counts.values()),
+            **counts,
+            'Souborů/s': round(rate, 2),
+            'Průměrná doba (s)': round(average, 3) if average else 0.0,
+            'Zbývá (s)': round(remaining / rate) if rate else None,
+        }
+
+
+def format_summary(summary):
+    eta = summary['Zbývá (s)']
+    return (f"{summary[DONE]}/{summary['Celkem']} hotovo, {summary[FAILED]} chyb, "
+            f"{summary[PENDING] + summary[PARSING]} zbývá, {summary['Souborů/s']} souborů/s"
+            + (f", odhad dokončení za {eta // 3600}:{eta % 3600 // 60:02d}:{eta % 60:02d}" if eta else ""))
+
+
+def stable_name(filepath):
+    """Input name without the directory it is mounted under, the same on every node"""
+    member = split_member(filepath)
+    if member:
+        return f"{os.path.basename(member[0])}!{member[1]}"
+    return os.path.basename(filepath)
+
+
+def shard_key(filepath, by='path'):
+    """What an input is sharded by: its stable name, or the UNB sender and control reference"""
+    if by == 'control':
+        with open_input(filepath) as stream:
+            unb = UNB_SEGMENT.search(stream.read(HEADER_SCAN_BYTES))
+        elements = unb.group(1).split(b'+') if unb else []
+        if len(elements) > 4:
+            sender = elements[1].split(b':')[0]
+            control = elements[4].split(b':')[0]
+            return (sender + b':' + control).decode('latin-1')
+    return stable_name(filepath)
+
+
+def shard_of(filepath, count, by='path'):
+    """Shard (0 .. count-1) of an input; a stable hash, so every node computes the same split"""
+    digest = hashlib.blake2b(shard_key(filepath, by).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count
+
+
+def parse_shard(value):
+    """'i/N' with 1 <= i <= N, as (i - 1, N)"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Očekáváno i/N, např. 1/4: {value}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"Část musí být mezi 1 a {count}: {value}")
+    return index - 1, count
+
+
+def export_name(filepath):
+    """File name the export is saved under; members of different archives often share names"""
+    member = split_member(filepath)
+    if member:
+        archive = os.path.splitext(os.path.basename(member[0]))[0]
+        return f"{archive}_{os.path.basename(member[1])}"
+    return member_name(filepath)
+
+
+def process_input(filepath, output_dir, include_pivot=False, strict=False, parse_filter=None):
+    """Parse one input (file, zip member or .gz file) and save its Excel export.
+
+    Returns (summary, workspace result); the result holds the deliveries and
+    weekly totals the merge step combines without parsing again. A file of
+    which nothing passes `parse_filter` is done too, just without an export."""
+    started = time.perf_counter()
+    file_type, parser = parse_input(filepath, parse_filter)
+    if parse_filter is not None and not parser.delivery_schedules:
+        summary = {'Typ': file_type, 'Počet dodávek': 0, 'Export': None,
+                   'Doba (s)': round(time.perf_counter() - started, 3)}
+    else:
+        summary = export_parsed(export_name(filepath), file_type, parser, output_dir, include_pivot, strict, started)
+    summary['Soubor'] = input_name(filepath)
+    return summary, reduce_parsed(filepath, file_type, parser, started)
+
+
+def work(ledger_path, output_dir, include_pivot=False, strict=False, lease=DEFAULT_LEASE, on_result=None,
+         parse_filter=None):
+    """Claim and process jobs until the ledger has none left; returns (done, failed).
+
+    Runs in every worker process; `on_result(filepath, summary, error)` is
+    called after each job."""
+    worker = worker_id()
+    done = failed = 0
+    with JobLedger(ledger_path, lease) as ledger:
+        while True:
+            filepath = ledger.claim(worker)
+            if filepath is None:
+                return done, failed
+            try:
+                summary, result = process_input(filepath, output_dir, include_pivot, strict, parse_filter)
+            except Exception as e:
+                ledger.fail(filepath, worker, e)
+                failed += 1
+                if on_result:
+                    on_result(filepath, None, e)
+            else:
+                ledger.done(filepath, worker, result)
+                done += 1
+                if on_result:
+                    on_result(filepath, summary, None)
+
+
+def _report(filepath, summary, error):
+    if error is not None:
+        print(f"CHYBA {input_name(filepath)}: {error}", flush=True)
+    else:
+        print(f"OK   {summary['Soubor']}: {summary['Typ']}, {summary['Počet dodávek']} dodávek, "
+              f"{summary['Doba (s)']} s", flush=True)
+
+
+def run_batch(ledger_path, output_dir, workers=1, include_pivot=False, strict=False,
+              lease=DEFAULT_LEASE, on_result=None, parse_filter=None):
+    """Process the ledger's unfinished jobs with `workers` processes; returns (done, failed)"""
+    os.makedirs(output_dir, exist_ok=True)
+    if workers < 2:
+        return work(ledger_path, output_dir, include_pivot, strict, lease, on_result, parse_filter)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(work, ledger_path, output_dir, include_pivot, strict, lease, on_result, parse_filter)
+                   for _ in range(workers)]
+        results = [future.result() for future in futures]
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="edi_parser_main.py batch",
+        description="Dávkově vyexportuje EDI soubory do Excelu. Stav každého vstupu se vede v evidenci "
+                    "(SQLite), přerušený běh pokračuje jen nedokončenými soubory. Evidence zároveň "
+                    "uchovává mezivýsledky pro krok 'merge'.")
+    arg_parser.add_argument("ledger", help="Soubor evidence úloh (SQLite); může být sdílený více stroji")
+    arg_parser.add_argument("files", nargs='*', help="EDI soubory nebo archivy (.zip, .gz) k přidání do evidence")
+    arg_parser.add_argument("-o", "--output", help="Výstupní složka pro exporty")
+    arg_parser.add_argument("--workers", type=int, default=None,
+                            help="Počet paralelních procesů (výchozí: počet jader)")
+    arg_parser.add_argument("--pivot", action="store_true",
+                            help="Přidat do exportu list s maticí položka × týden")
+    arg_parser.add_argument("--strict", action="store_true",
+                            help="Odmítnout soubory s chybnou obálkou (UNT/UNZ počty, řídicí reference)")
+    arg_parser.add_argument("--retry-failed", action="store_true", help="Zkusit znovu soubory, které skončily chybou")
+    arg_parser.add_argument("--lease", type=float, default=DEFAULT_LEASE,
+                            help="Po kolika sekundách se rozpracovaný soubor považuje za opuštěný")
+    arg_parser.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                            help="Zpracovat jen i-tou z N částí vstupů (každý stroj jinou, např. 1/4 až 4/4)")
+    arg_parser.add_argument("--shard-by", choices=SHARD_KEYS, default='path',
+                            help="Rozdělení podle názvu souboru, nebo podle odesílatele a řídicí reference UNB")
+    arg_parser.add_argument("--status", action="store_true", help="Jen vypsat stav evidence")
+    add_filter_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+    try:
+        parse_filter = filter_from_args(args)
+    except ValueError as e:
+        arg_parser.error(str(e))
+
+    with JobLedger(args.ledger, args.lease) as ledger:
+        if args.files:
+            inputs = expand_inputs(args.files)
+            if args.shard:
+                index, count = args.shard
+                inputs = [filepath for filepath in inputs if shard_of(filepath, count, args.shard_by) == index]
+            added = ledger.add(inputs)
+            print(f"Přidáno {added} nových souborů do evidence")
+        if args.retry_failed:
+            print(f"Znovu zařazeno {ledger.retry_failed()} souborů s chybou")
+        if args.status or not args.output:
+            print(format_summary(ledger.summary()))
+            for filepath, error in ledger.failures():
+                print(f"CHYBA {input_name(filepath)}: {error}")
+            return 0
+
+    started = time.time()
+    done, failed = run_batch(args.ledger, args.output, workers=args.workers or os.cpu_count() or 1,
+                             include_pivot=args.pivot, strict=args.strict, lease=args.lease, on_result=_report,
+                             parse_filter=parse_filter)
+    with JobLedger(args.ledger, args.lease) as ledger:
+        print(f"Tento běh: {done} hotovo, {failed} chyb za {time.time() - started:.1f} s")
+        print(format_summary(ledger.summary()))
+    return 1 if failed else 0
+
+
+def merge_ledgers(ledger_paths):
+    """DemandWorkspace with the results of all done jobs of several (shard) ledgers, without parsing.
+
+    Returns (workspace, unfinished), unfinished being the number of inputs
+    without a result: pending, parsing, failed, or done before results were kept."""
+    workspace = DemandWorkspace()
+    unfinished = 0
+    for ledger_path in ledger_paths:
+        with JobLedger(ledger_path) as ledger:
+            merged = 0
+            for result in ledger.results():
+                workspace.add_result(result)
+                merged += 1
+            unfinished += ledger.summary()['Celkem'] - merged
+    return workspace, unfinished
+
+
+def export_release(ledger_paths, release, output, include_pivot=False, on_error=None):
+    """Save one Cummins release collected from the done inputs of several ledgers.
+
+    The ledger results do not keep releases, so the inputs are parsed again;
+    returns (files of the release, deliveries)."""
+    parsers = []
+    for ledger_path in ledger_paths:
+        with JobLedger(ledger_path) as ledger:
+            inputs = ledger.done_inputs()
+        for filepath in inputs:
+            try:
+                file_type, parser = parse_input(filepath)
+            except (OSError, ValueError) as e:
+                if on_error is None:
+                    raise
+                on_error(filepath, e)
+                continue
+            if file_type == 'cummins' and parser.release_index.get(release):
+                parsers.append(parser)
+    build_release_workbook(parsers, release, include_pivot).save(output)
+    return len(parsers), sum(len(parser.release_index[release]) for parser in parsers)
+
+
+def merge_main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="edi_parser_main.py merge",
+        description="Sloučí mezivýsledky dávkových běhů (evidence jednotlivých částí) do jednoho souhrnu "
+                    "bez nového parsování (kromě exportu --release).")
+    arg_parser.add_argument("ledgers", nargs='+', help="Soubory evidence (SQLite) z běhů batch")
+    arg_parser.add_argument("-o", "--output", help="Uložit souhrn do Excelu")
+    arg_parser.add_argument("--release", help="Vyexportovat dodávky jednoho release Cummins ze všech hotových souborů "
+                                              "(soubory se kvůli tomu parsují znovu)")
+    arg_parser.add_argument("--release-output", help="Excel pro export release (s --release)")
+    arg_parser.add_argument("--pivot", action="store_true",
+                            help="Přidat do exportu release list s maticí položka × týden")
+    args = arg_parser.parse_args(argv)
+    if bool(args.release) != bool(args.release_output):
+        arg_parser.error("--release a --release-output se zadávají společně")
+
+    workspace, unfinished = merge_ledgers(args.ledgers)
+    partners = {}
+    for result in workspace.files.values():
+        stats = partners.setdefault(result['Partner'], {'souborů': 0, 'dodávek': 0, 'poptávka': 0})
+        stats['souborů'] += 1
+        stats['dodávek'] += len(result['Záznamy'])
+        stats['poptávka'] += sum(result['Týdny'].values())
+    for partner, stats in sorted(partners.items()):
+        print(f"{partner}: {stats['souborů']} souborů, {stats['dodávek']} dodávek, "
+              f"poptávka {stats['poptávka']:,} kusů")
+    print(f"Celkem {len(workspace)} souborů, {len(workspace.row_refs)} položek, {len(workspace.week_refs)} týdnů")
+    if unfinished:
+        print(f"Nedokončeno (chybí v souhrnu): {unfinished} souborů")
+    if args.output:
+        workspace.build_workbook().save(args.output)
+        print(f"Souhrn uložen do {args.output}")
+    failed = []
+    if args.release:
+        def report_error(filepath, e):
+            failed.append(filepath)
+            print(f"CHYBA {input_name(filepath)}: {e}")
+
+        files, deliveries = export_release(args.ledgers, args.release, args.release_output,
+                                           include_pivot=args.pivot, on_error=report_error)
+        print(f"Release {args.release}: {deliveries} dodávek z {files} souborů uloženo do {args.release_output}")
+    return 1 if unfinished or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
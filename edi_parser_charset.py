@@ -0,0 +1,69 @@
+import codecs
+
+# Python codec for each UNB syntax identifier (character repertoire)
+SYNTAX_ENCODINGS = {
+    'UNOA': 'ascii',
+    'UNOB': 'ascii',
+    'UNOC': 'latin-1',
+    'UNOD': 'iso-8859-2',
+    'UNOE': 'iso-8859-5',
+    'UNOF': 'iso-8859-7',
+    'UNOW': 'utf-8',
+}
+
+# Files without a (known) syntax identifier are read the way they always were
+DEFAULT_ENCODING = 'utf-8'
+
+# UNA/UNB are at the very start; leave room for a BOM or leading whitespace
+HEADER_SCAN_BYTES = 512
+
+
+def syntax_identifier(data):
+    """Syntax identifier from the UNB segment (e.g. 'UNOA'), None if there is none"""
+    head = data[:HEADER_SCAN_BYTES]
+    element_separator = b'+'
+    una = head.find(b'UNA')
+    if una != -1 and len(head) >= una + 9:
+        # UNA:+.? ' - the element separator is the second service character
+        element_separator = head[una + 4:una + 5]
+    unb = head.find(b'UNB' + element_separator)
+    if unb == -1:
+        return None
+    identifier = head[unb + 4:unb + 8]
+    try:
+        identifier = identifier.decode('ascii')
+    except UnicodeDecodeError:
+        return None
+    return identifier if identifier in SYNTAX_ENCODINGS else None
+
+
+def detect_encoding(data):
+    """Codec for the interchange as declared in UNB"""
+    return SYNTAX_ENCODINGS.get(syntax_identifier(data), DEFAULT_ENCODING)
+
+
+def decode_edi(data, encoding=None):
+    """Decode a whole EDI buffer according to its UNB syntax identifier.
+
+    The buffer is checked once: pure ASCII (all UNOA/UNOB and most other
+    interchanges) takes the fast ASCII decode whatever the declaration says.
+    Single-byte repertoires such as UNOC decode as declared and cannot fail.
+    A UNOA/UNOB file that still carries 8-bit bytes is decoded as UTF-8 if it
+    is valid UTF-8 and as Latin-1 otherwise, instead of aborting the load."""
+    try:
+        return data.decode('ascii')
+    except UnicodeDecodeError:
+        pass
+    encoding = encoding or detect_encoding(data)
+    if codecs.lookup(encoding).name == 'ascii':
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            return data.decode('latin-1')
+    return data.decode(encoding, errors='replace')
+
+
+def read_edi_file(filepath):
+    """Read an EDI file as text, decoded according to its UNB syntax identifier"""
+    with open(filepath, 'rb') as f:
+        return decode_edi(f.read())
@@ -0,0 +1,264 @@
+import pickle
+import re
+
+import numpy as np
+
+# 'DD.MM.YYYY' or 'DD.MM.YYYY HH:MM:SS' as produced by the parsers
+DATE_PATTERN = re.compile(r'(\d\d)\.(\d\d)\.(\d{4})(?: (\d\d):(\d\d):(\d\d))?')
+
+# Columns exported as integer arrays by to_numpy(); all other non-date columns
+# (part, SCC, type, release, order ...) become categorical codes
+QUANTITY_COLUMNS = ('Množství', 'Čisté množství')
+
+
+def _int_value(value):
+    """Number for an int or a canonical digit string, None if the value would not round-trip"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isdigit() and (value == '0' or value[0] != '0') and len(value) < 19:
+        return int(value)
+    return None
+
+
+def _date_value(value):
+    """(YYYYMMDD[hhmmss], has_time) for a parser date string, None otherwise"""
+    match = DATE_PATTERN.fullmatch(value) if isinstance(value, str) else None
+    if match is None:
+        return None
+    day, month, year, hour, minute, second = match.groups()
+    if hour is None:
+        return int(year + month + day), False
+    return int(year + month + day + hour + minute + second), True
+
+
+def _encode_column(values):
+    """Encode one column as (kind, data, meta, present).
+
+    The values are dictionary-encoded first, so the int/date checks only run
+    on the distinct values and the typed array is a single lookup."""
+    distinct = {}
+    codes = np.fromiter((distinct.setdefault(value, len(distinct)) for value in values),
+                        dtype=np.int64, count=len(values))
+    keys = list(distinct)
+    present = codes != distinct[None] if None in distinct else None
+    known = [key for key in keys if key is not None]
+
+    numbers = [_int_value(key) for key in known]
+    kinds = {type(key) for key in known}
+    if known and None not in numbers and len(kinds) == 1:
+        lookup = np.array([0 if key is None else _int_value(key) for key in keys], dtype=np.int64)
+        return 'int', lookup[codes], kinds == {str}, present
+
+    dates = [_date_value(key) for key in known]
+    if known and None not in dates and len({has_time for _, has_time in dates}) == 1:
+        lookup = np.array([0 if key is None else _date_value(key)[0] for key in keys], dtype=np.int64)
+        return 'date', lookup[codes], dates[0][1], present
+
+    # Few distinct values per column, so the codes fit a narrow type
+    return 'text', codes.astype(np.min_scalar_type(max(len(keys) - 1, 0))), keys, present
+
+
+def _format_date(number, with_time):
+    if with_time:
+        number, time_part = divmod(number, 1000000)
+        hour, rest = divmod(time_part, 10000)
+        minute, second = divmod(rest, 100)
+    year, rest = divmod(number, 10000)
+    month, day = divmod(rest, 100)
+    text = f"{day:02d}.{month:02d}.{year:04d}"
+    return f"{text} {hour:02d}:{minute:02d}:{second:02d}" if with_time else text
+
+
+def _datetime_array(data, with_time):
+    """datetime64 array from YYYYMMDD[hhmmss] numbers, computed on whole arrays"""
+    if with_time:
+        data, time_part = np.divmod(data, 1000000)
+    year, rest = np.divmod(data, 10000)
+    month, day = np.divmod(rest, 100)
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    if not with_time:
+        return days
+    hour, rest = np.divmod(time_part, 10000)
+    minute, second = np.divmod(rest, 100)
+    return days.astype('datetime64[s]') + (hour * 3600 + minute * 60 + second).astype('timedelta64[s]')
+
+
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class ColumnarDeliveries:
+    """Column-wise form of a delivery list for transfer between processes.
+
+    Dates and quantities become int64 arrays, everything else is
+    dictionary-encoded (narrow integer codes plus the distinct values), and rows
+    without a key are marked in a presence mask. Every array pickles as one
+    buffer, with protocol 5 out of band (see `dumps`/`loads`), so a worker
+    hands over a handful of buffers instead of one dict per delivery."""
+
+    def __init__(self, length, columns):
+        self.length = length
+        # key -> (kind, data, meta, present); kind is 'int', 'date' or 'text'
+        self.columns = columns
+
+    def __len__(self):
+        return self.length
+
+    @classmethod
+    def from_deliveries(cls, deliveries):
+        names = {}
+        for delivery in deliveries:
+            for name in delivery:
+                names.setdefault(name, None)
+        columns = {}
+        for name in names:
+            columns[name] = _encode_column([delivery.get(name) for delivery in deliveries])
+        return cls(len(deliveries), columns)
+
+    def column(self, name):
+        """Python values of one column (None where the key was missing)"""
+        kind, data, meta, present = self.columns[name]
+        if kind == 'text':
+            table, codes = meta, data
+        else:
+            # Format every distinct number once, then expand through the codes
+            numbers, codes = np.unique(data, return_inverse=True)
+            if kind == 'int':
+                table = [str(number) for number in numbers.tolist()] if meta else numbers.tolist()
+            else:
+                table = [_format_date(number, meta) for number in numbers.tolist()]
+        values = np.array(table, dtype=object)[codes]
+        if present is not None:
+            values[~present] = None
+        return values.tolist()
+
+    def to_deliveries(self):
+        """Rebuild the list of delivery dicts"""
+        if not self.columns:
+            return [{} for _ in range(self.length)]
+        names = list(self.columns)
+        rows = zip(*(self.column(name) for name in names))
+        if all(column[3] is None for column in self.columns.values()):
+            return [dict(zip(names, row)) for row in rows]
+        return [{name: value for name, value in zip(names, row) if value is not None} for row in rows]
+
+    def categorical(self, name):
+        """(codes, categories) of a column; code -1 marks a missing value.
+
+        Text columns already are codes plus their distinct values; numeric
+        columns are coded through their sorted distinct numbers."""
+        kind, data, meta, present = self.columns[name]
+        if kind == 'text':
+            if None not in meta:
+                return _read_only(data), list(meta)
+            # Missing values are one of the distinct values; move them to -1
+            missing = meta.index(None)
+            lookup = np.arange(len(meta), dtype=np.min_scalar_type(-len(meta)))
+            lookup[missing] = -1
+            lookup[missing + 1:] -= 1
+            return lookup[data], [value for value in meta if value is not None]
+        numbers = np.unique(data if present is None else data[present])
+        codes = np.searchsorted(numbers, data).astype(np.min_scalar_type(-max(len(numbers), 1)))
+        if present is not None:
+            codes[~present] = -1
+        if kind == 'int':
+            categories = [str(number) for number in numbers.tolist()] if meta else numbers.tolist()
+        else:
+            categories = [_format_date(number, meta) for number in numbers.tolist()]
+        return codes, categories
+
+    def is_date(self, name):
+        """True for a date column, also one that mixes dates with and without time (stored as text)"""
+        kind, _, meta, _ = self.columns[name]
+        if kind == 'text':
+            known = [value for value in meta if value is not None]
+            return bool(known) and all(_date_value(value) for value in known)
+        return kind == 'date'
+
+    def dates(self, name):
+        """datetime64 values of a date column, NaT where missing"""
+        kind, data, meta, present = self.columns[name]
+        if kind == 'text':
+            # Only the distinct values are converted, the rows take them through the codes
+            table = np.zeros(len(meta), dtype=np.int64)
+            for i, value in enumerate(meta):
+                if value is not None:
+                    number, has_time = _date_value(value)
+                    table[i] = number if has_time else number * 1000000
+            values = _datetime_array(table, True)[data]
+            present = np.array([value is not None for value in meta])[data]
+        else:
+            values = _datetime_array(data, meta)
+        if present is not None:
+            values[~present] = np.datetime64('NaT')
+        return values
+
+    def quantity(self, name):
+        """(int64 values, present mask or None) of a quantity column; non-numeric values count as missing"""
+        kind, data, meta, present = self.columns[name]
+        if kind == 'int':
+            return _read_only(data), present
+        if kind == 'date':
+            return np.zeros(self.length, dtype=np.int64), np.zeros(self.length, dtype=bool)
+        # Mixed or partly non-numeric text: only the distinct values are converted
+        numbers = [int(key) if isinstance(key, str) and key.isdigit() else _int_value(key) for key in meta]
+        lookup = np.array([number or 0 for number in numbers], dtype=np.int64)
+        valid = np.array([number is not None for number in numbers], dtype=bool)
+        return lookup[data], valid[data]
+
+    def to_numpy(self):
+        """Dict of NumPy arrays, one per column, built from the stored arrays without per-row objects.
+
+        Dates are datetime64 (NaT where missing), quantities (QUANTITY_COLUMNS)
+        int64 (a masked array where values are missing) and all other columns
+        categorical codes (-1 where missing) whose values `categorical` returns.
+        Stored arrays are handed out as read-only views, not copies."""
+        arrays = {}
+        for name in self.columns:
+            if self.is_date(name):
+                arrays[name] = self.dates(name)
+            elif name in QUANTITY_COLUMNS:
+                values, valid = self.quantity(name)
+                arrays[name] = values if valid is None or valid.all() else np.ma.MaskedArray(values, mask=~valid)
+            else:
+                arrays[name] = self.categorical(name)[0]
+        return arrays
+
+    def to_dataframe(self):
+        """pandas DataFrame of the columns (pandas is only imported here).
+
+        Categorical columns become pandas Categoricals straight from the codes,
+        quantities nullable Int64 where values are missing."""
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError("Pro to_dataframe() je potřeba balíček pandas") from None
+        frame = {}
+        for name in self.columns:
+            if self.is_date(name):
+                frame[name] = self.dates(name)
+            elif name in QUANTITY_COLUMNS:
+                values, valid = self.quantity(name)
+                frame[name] = values if valid is None or valid.all() else pd.arrays.IntegerArray(values, ~valid)
+            else:
+                codes, categories = self.categorical(name)
+                frame[name] = pd.Categorical.from_codes(codes, categories=categories)
+        return pd.DataFrame(frame, copy=False)
+
+    def nbytes(self):
+        return sum(column[1].nbytes + (column[3].nbytes if column[3] is not None else 0)
+                   for column in self.columns.values())
+
+
+def dumps(obj):
+    """Pickle with protocol 5; returns (header, buffers) with the array data out of band"""
+    buffers = []
+    header = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    return header, [buffer.raw() for buffer in buffers]
+
+
+def loads(header, buffers):
+    return pickle.loads(header, buffers=buffers)
@@ -1,21 +1,60 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import re
+import sys
+import threading
 from datetime import datetime, date
 import os
 import openpyxl
-from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
+from edi_parser_pivot import ForecastPivot
+from edi_parser_table import DeliveryTable
+from edi_parser_charset import read_edi_file
+from edi_parser_envelope import EnvelopeValidator
+from edi_parser_export import WorkbookPrerender, write_rows
+from edi_parser_messages import DESPATCH_TYPE, message_type, split_datetime
 
 class EDIDelforCumminsParser:
-    def __init__(self, filepath=None):
-        self.root = tk.Tk()
-        self.root.title("EDI Cummins Parser")
-        self.root.geometry("1200x800")
+    ALL_RELEASES = 'Všechny release'
+    ALL_PARTS = 'Všechny položky'
+    ALL_TYPES = 'Všechny typy'
+    ALL_SCC = 'Všechna SCC'
+    # The table is sorted by date until the user clicks another column
+    DEFAULT_SORT = 'Datum'
+    # Everything a parse produces; parse_edi_file takes it over from its context in one step
+    PARSE_STATE = ('header_info', 'partner_info', 'delivery_schedules', 'line_items', 'forecast_pivot',
+                   'release_index', 'scc_index', 'envelope_report')
+
+    def __init__(self, filepath=None, headless=False, parse_filter=None):
+        # Optional ParseFilter (edi_parser_filter), applied while parsing
+        self.parse_filter = parse_filter
+        # Held while adopt() replaces the PARSE_STATE attributes
+        self._state_lock = threading.Lock()
         self.header_info = {}
         self.partner_info = {}
         self.delivery_schedules = []
         self.line_items = []
+        self.forecast_pivot = ForecastPivot()
+        self.release_index = {}
+        self.scc_index = {}
+        # Envelope check result (segment and message counts, control references)
+        self.envelope_report = {}
+        # Sorting and quick filters of the delivery table
+        self.delivery_table = None
+        self.sort_column = self.DEFAULT_SORT
+        self.sort_descending = False
+        
+        # Headless mode (folder watcher, batch runs) never creates a Tk window
+        self.root = None
+        if headless:
+            if filepath:
+                self.parse_file(filepath)
+            return
+        
+        self.root = tk.Tk()
+        self.root.title("EDI Cummins Parser")
+        self.root.geometry("1200x800")
+        # The export workbook is built on a worker as soon as the data is shown
+        self.prerender = WorkbookPrerender()
         
         # Handle window close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -32,6 +71,9 @@ class EDIDelforCumminsParser:
         # Add buttons
         ttk.Button(btn_frame, text="Zpět na hlavní okno", command=self.back_to_main).pack(side=tk.LEFT, padx=(10, 0))
         ttk.Button(btn_frame, text="Export do Excelu", command=self.export_to_excel).pack(side=tk.LEFT, padx=5)
+        self.pivot_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(btn_frame, text="Export s maticí položka × týden",
+                        variable=self.pivot_var).pack(side=tk.LEFT, padx=5)
         self.notebook = ttk.Notebook(main_frame)
         self.notebook.pack(fill=tk.BOTH, expand=True)
         self.info_frame = ttk.Frame(self.notebook)
@@ -54,13 +96,51 @@ class EDIDelforCumminsParser:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
     def setup_delivery_tab(self):
+        # Release selector - the table and the export show one release or all of them
+        filter_frame = ttk.Frame(self.delivery_frame)
+        filter_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
+        ttk.Label(filter_frame, text="Release:").pack(side=tk.LEFT)
+        self.release_var = tk.StringVar(value=self.ALL_RELEASES)
+        self.release_combo = ttk.Combobox(filter_frame, textvariable=self.release_var, state='readonly',
+                                          values=(self.ALL_RELEASES,), width=20)
+        self.release_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.release_combo.bind('<<ComboboxSelected>>', lambda event: self.show_deliveries())
+        # Quick filters by part, type, SCC and date range (Enter applies the dates)
+        ttk.Label(filter_frame, text="Položka:").pack(side=tk.LEFT, padx=(10, 0))
+        self.part_var = tk.StringVar(value=self.ALL_PARTS)
+        self.part_combo = ttk.Combobox(filter_frame, textvariable=self.part_var, state='readonly',
+                                       values=(self.ALL_PARTS,), width=20)
+        self.part_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.part_combo.bind('<<ComboboxSelected>>', lambda event: self.show_deliveries())
+        ttk.Label(filter_frame, text="Typ:").pack(side=tk.LEFT, padx=(10, 0))
+        self.type_var = tk.StringVar(value=self.ALL_TYPES)
+        self.type_combo = ttk.Combobox(filter_frame, textvariable=self.type_var, state='readonly',
+                                       values=(self.ALL_TYPES,), width=15)
+        self.type_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.type_combo.bind('<<ComboboxSelected>>', lambda event: self.show_deliveries())
+        ttk.Label(filter_frame, text="SCC:").pack(side=tk.LEFT, padx=(10, 0))
+        self.scc_var = tk.StringVar(value=self.ALL_SCC)
+        self.scc_combo = ttk.Combobox(filter_frame, textvariable=self.scc_var, state='readonly',
+                                      values=(self.ALL_SCC,), width=12)
+        self.scc_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.scc_combo.bind('<<ComboboxSelected>>', lambda event: self.show_deliveries())
+        ttk.Label(filter_frame, text="Od:").pack(side=tk.LEFT, padx=(10, 0))
+        self.date_from_var = tk.StringVar()
+        date_from_entry = ttk.Entry(filter_frame, textvariable=self.date_from_var, width=12)
+        date_from_entry.pack(side=tk.LEFT, padx=(5, 0))
+        date_from_entry.bind('<Return>', lambda event: self.show_deliveries())
+        ttk.Label(filter_frame, text="Do:").pack(side=tk.LEFT, padx=(10, 0))
+        self.date_to_var = tk.StringVar()
+        date_to_entry = ttk.Entry(filter_frame, textvariable=self.date_to_var, width=12)
+        date_to_entry.pack(side=tk.LEFT, padx=(5, 0))
+        date_to_entry.bind('<Return>', lambda event: self.show_deliveries())
         tree_frame = ttk.Frame(self.delivery_frame)
         tree_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         # Removed 'Jednotka' column as requested
         columns = ('Položka', 'Popis', 'Datum', 'Množství', 'Typ', 'SCC', 'Release')
         self.delivery_tree = ttk.Treeview(tree_frame, columns=columns, show='headings', height=15)
         for col in columns:
-            self.delivery_tree.heading(col, text=col)
+            self.delivery_tree.heading(col, text=col, command=lambda c=col: self.sort_deliveries(c))
             if col == 'Popis':
                 self.delivery_tree.column(col, width=200)
             elif col == 'Položka':
@@ -112,12 +192,135 @@ class EDIDelforCumminsParser:
         }
         return scc_map.get(scc_code, f'SCC-{scc_code}')
 
+    def get_scc_code(self, scc_description):
+        """Inverse of get_scc_description"""
+        scc_codes = {
+            'Backlog': '10',
+            'Firm': '1',
+            'Forecast': '4'
+        }
+        if scc_description.startswith('SCC-'):
+            return scc_description[4:]
+        return scc_codes.get(scc_description, scc_description)
+
+    def add_delivery(self, delivery, scc_code):
+        """Append a copy of a delivery and keep the release/SCC indexes and the weekly matrix up to date"""
+        # Part, description, type, SCC, dates... repeat, so deliveries share one object per value.
+        # The stored record is a new dict, the caller's one is left as it was
+        delivery = {key: sys.intern(value) if isinstance(value, str) else value for key, value in delivery.items()}
+        position = len(self.delivery_schedules)
+        self.delivery_schedules.append(delivery)
+        self.release_index.setdefault(delivery.get('Release', ''), []).append(position)
+        self.scc_index.setdefault(scc_code, []).append(position)
+        # Cumulative and despatched quantities are not weekly demand
+        if delivery['Typ'] not in ('Kumulativní', DESPATCH_TYPE):
+            self.forecast_pivot.add(delivery['Položka'], delivery['Datum'], delivery['SCC'], delivery['Množství'])
+
+    def set_release(self, position, release):
+        """Change the release of an already added delivery and move it in the release index"""
+        delivery = self.delivery_schedules[position]
+        old_positions = self.release_index.get(delivery.get('Release', ''), [])
+        # The delivery was just added, so it is normally the last position
+        if old_positions and old_positions[-1] == position:
+            old_positions.pop()
+        elif position in old_positions:
+            old_positions.remove(position)
+        if not old_positions:
+            self.release_index.pop(delivery.get('Release', ''), None)
+        delivery['Release'] = sys.intern(release)
+        positions = self.release_index.setdefault(release, [])
+        positions.append(position)
+        # Keep positions ascending if an older delivery was moved
+        if len(positions) > 1 and positions[-2] > position:
+            positions.sort()
+
+    def get_deliveries(self, release=None, scc_code=None):
+        """Deliveries of one release and/or SCC code, looked up through the indexes"""
+        if release is None and scc_code is None:
+            return list(self.delivery_schedules)
+        candidates = []
+        if release is not None:
+            candidates.append(self.release_index.get(release, []))
+        if scc_code is not None:
+            candidates.append(self.scc_index.get(scc_code, []))
+        # Walk the shorter list and check membership in the other one
+        candidates.sort(key=len)
+        positions = candidates[0]
+        if len(candidates) > 1:
+            other = set(candidates[1])
+            positions = [p for p in positions if p in other]
+        return [self.delivery_schedules[p] for p in positions]
+
+    def get_releases(self):
+        """Known release numbers, numerically sorted where possible"""
+        return sorted((r for r in self.release_index if r), key=lambda r: (not r.isdigit(), r.zfill(20)))
+
     def parse_edi_file(self, content):
-        lines = content.strip().split("'")
+        # All parse state goes into a fresh headless context, so one instance can
+        # parse on several threads and the data it shows is only replaced when complete
+        context = type(self)(headless=True, parse_filter=self.parse_filter)
+        segments = context.segment_parser()
+        next(segments)
+        for line in content.strip().split("'"):
+            segments.send(line)
+        try:
+            segments.send(None)
+        except StopIteration:
+            pass
+        self.adopt(context)
+
+    def adopt(self, context):
+        """Take over the parse state of a finished context parser.
+
+        The attributes are replaced one by one, under the state lock: parses
+        on one instance take turns, and a reader on another thread gets a
+        consistent state only through snapshot()."""
+        with self._state_lock:
+            for name in self.PARSE_STATE:
+                setattr(self, name, getattr(context, name))
+
+    def snapshot(self):
+        """Headless parser sharing the current parse state, taken as a whole under the state lock"""
+        snapshot = type(self)(headless=True)
+        with self._state_lock:
+            for name in self.PARSE_STATE:
+                setattr(snapshot, name, getattr(self, name))
+        return snapshot
+
+    def preview(self, content):
+        """Header and partner data only.
+
+        Tokenizing stops at the first LIN or UNS segment, so `content` only needs
+        to be the start of the file (see edi_parser_preview.read_head)."""
+        context = type(self)(headless=True)
+        segments = context.segment_parser()
+        next(segments)
+        for line in content.split("'"):
+            if line.lstrip()[:3] in ('LIN', 'UNS'):
+                break
+            segments.send(line)
+        # Without the closing None the generator never reaches its final steps
+        segments.close()
+        return context.header_info, context.partner_info
+
+    def segment_parser(self):
+        """Generator fed one segment at a time with send(); None ends the input.
+
+        All parsing state (header, LIN context, pending deliveries) lives in
+        the generator, so parsing can stop at any segment and continue later."""
         self.header_info = {}
         self.partner_info = {}
         self.delivery_schedules = []
         self.line_items = []
+        # Part x week matrix, filled together with the deliveries
+        self.forecast_pivot = ForecastPivot()
+        # Release number / SCC code -> positions in delivery_schedules
+        self.release_index = {}
+        self.scc_index = {}
+        # The envelope is checked in the same pass, with counters and references only
+        envelope = EnvelopeValidator()
+        # Dates repeat on many lines, each one is converted only once
+        parsed_dates = {}
         
         # Current parsing state
         current_part_number = ''
@@ -126,6 +329,14 @@ class EDIDelforCumminsParser:
         current_po = ''
         current_scc = ''
         current_release = ''
+        # DELFOR, DELJIT or DESADV, from the UNH of the current message
+        current_message = 'DELFOR'
+        # DELJIT sequence (SEQ), DESADV packing level (CPS) and packages (PAC)
+        current_sequence = ''
+        current_package = ''
+        current_packaging = ''
+        despatch_date = ''
+        arrival_date = ''
         
         # Track current line item details
         current_line_item = None
@@ -133,6 +344,12 @@ class EDIDelforCumminsParser:
         # Temporary storage for quantity waiting for date
         pending_quantities = []
         
+        # Positions of the deliveries created by the last DTM+2, an RFF+RE right after it belongs to them
+        last_created = []
+        # The last DTM+2 dated some quantities, even if the filter kept none of them
+        last_dated = False
+        parse_filter = self.parse_filter
+        
         def create_or_update_line_item():
             nonlocal current_line_item
             if not current_part_number:
@@ -155,10 +372,29 @@ class EDIDelforCumminsParser:
             current_line_item = line_item
             return line_item
 
-        for line in lines:
+        def quantity_wanted(qty_info, delivery_date):
+            # Checked when the DTM dates the quantity, before the delivery is built
+            return parse_filter is None or (parse_filter.type_wanted(qty_info['type'], qty_info['qualifier'])
+                                            and parse_filter.line_wanted(current_scc, delivery_date))
+
+        def add_call_off_details(delivery, delivery_time):
+            # DELJIT only: time of the call-off, its sequence and packaging
+            if delivery_time:
+                delivery['Čas'] = delivery_time
+            if current_sequence:
+                delivery['Sekvence'] = current_sequence
+            if current_packaging:
+                delivery['Balení'] = current_packaging
+
+        while True:
+            line = yield
+            # None marks the end of the input
+            if line is None:
+                break
             line = line.strip()
             if not line:
                 continue
+            envelope.feed(line)
 
             if line.startswith('UNB'):
                 parts = line.split('+')
@@ -171,6 +407,9 @@ class EDIDelforCumminsParser:
                 parts = line.split('+')
                 if len(parts) >= 2:
                     self.header_info['ID zprávy'] = parts[1]
+                current_message = message_type(line) or 'DELFOR'
+                self.header_info['Typ zprávy'] = current_message
+                current_sequence = current_package = current_packaging = despatch_date = arrival_date = ''
 
             elif line.startswith('BGM'):
                 parts = line.split('+')
@@ -183,14 +422,23 @@ class EDIDelforCumminsParser:
                     dtm_parts = parts[1].split(':')
                     if len(dtm_parts) >= 3:
                         code = dtm_parts[0]
-                        value = dtm_parts[1]
-                        fmt = dtm_parts[2]
-                        formatted_date = self.parse_date(value, fmt)
+                        # JIT call-offs are timed (format 203), the time is kept apart from the date
+                        value, fmt, delivery_time = split_datetime(dtm_parts[1], dtm_parts[2])
+                        formatted_date = parsed_dates.get((value, fmt))
+                        if formatted_date is None:
+                            formatted_date = parsed_dates[(value, fmt)] = self.parse_date(value, fmt)
                         if code == '137':
                             self.header_info['Datum dokumentu'] = formatted_date
-                        elif code == '2':
+                        elif code == '11' and current_message == 'DESADV':
+                            despatch_date = formatted_date
+                            self.header_info['Datum odeslání'] = formatted_date
+                        elif code == '132' and current_message == 'DESADV':
+                            arrival_date = formatted_date
+                            self.header_info['Předpokládaný příjezd'] = formatted_date
+                        elif code == '2' or (code == '10' and current_message == 'DELJIT'):
                             # This is a delivery date - match with pending quantities
                             # Only create entries if we have quantities to process
+                            first_position = len(self.delivery_schedules)
                             if pending_quantities:
                                 # For SCC 10 (Backlog), we only take the first quantity
                                 if current_scc == '10' and len(pending_quantities) > 0:
@@ -206,20 +454,24 @@ class EDIDelforCumminsParser:
                                         }
                                         self.line_items.append(line_item)
                                     
-                                    delivery = {
-                                        'Položka': current_part_number,
-                                        'Popis': current_description,
-                                        'Datum': formatted_date,
-                                        'Množství': qty_info['quantity'],
-                                        'Typ': qty_info['type'],
-                                        'SCC': self.get_scc_description(current_scc),
-                                        'Release': current_release,
-                                        'Objednávka': current_po
-                                    }
-                                    self.delivery_schedules.append(delivery)
+                                    if quantity_wanted(qty_info, formatted_date):
+                                        delivery = {
+                                            'Položka': current_part_number,
+                                            'Popis': current_description,
+                                            'Datum': formatted_date,
+                                            'Množství': qty_info['quantity'],
+                                            'Typ': qty_info['type'],
+                                            'SCC': self.get_scc_description(current_scc),
+                                            'Release': current_release,
+                                            'Objednávka': current_po
+                                        }
+                                        add_call_off_details(delivery, delivery_time)
+                                        self.add_delivery(delivery, current_scc)
                                 else:
                                     # For other SCCs, process all quantities
                                     for qty_info in pending_quantities:
+                                        if not quantity_wanted(qty_info, formatted_date):
+                                            continue
                                         delivery = {
                                             'Položka': current_part_number,
                                             'Popis': current_description,
@@ -229,8 +481,11 @@ class EDIDelforCumminsParser:
                                             'SCC': self.get_scc_description(current_scc),
                                             'Release': current_release
                                         }
-                                        self.delivery_schedules.append(delivery)
+                                        add_call_off_details(delivery, delivery_time)
+                                        self.add_delivery(delivery, current_scc)
+                            last_dated = bool(pending_quantities)
                             pending_quantities.clear()
+                            last_created = list(range(first_position, len(self.delivery_schedules)))
                             # Don't reset release here to maintain it for next entries
 
             elif line.startswith('NAD'):
@@ -261,6 +516,11 @@ class EDIDelforCumminsParser:
                     current_release = ''
                     current_line_item = None
                     pending_quantities = []
+                    last_created = []
+                    last_dated = False
+                    # DELJIT packaging belongs to its LIN, DESADV packages (PAC before LIN) to the CPS level
+                    if current_message != 'DESADV':
+                        current_packaging = ''
                     
                     # Try to find part number in the LIN segment
                     for i, part in enumerate(parts[3:], 3):  # Skip the first 3 parts (LIN, line number, action code)
@@ -338,9 +598,18 @@ class EDIDelforCumminsParser:
                                 current_line_item['Objednávka'] = current_po
                                 # Order number set
                             elif ref_type == 'RE':
-                                current_release = ref_value
-                                # Clear any pending quantities to ensure release number is applied to new quantities
-                                pending_quantities = []
+                                if last_dated and not pending_quantities:
+                                    # RFF+RE follows the QTY/DTM of its own delivery
+                                    for position in last_created:
+                                        self.set_release(position, ref_value)
+                                    last_created = []
+                                    last_dated = False
+                                    # Deliveries without their own RFF+RE have no release
+                                    current_release = ''
+                                else:
+                                    current_release = ref_value
+                                    # Clear any pending quantities to ensure release number is applied to new quantities
+                                    pending_quantities = []
                                 # Release number set
                         else:
                             # No line item available for RFF
@@ -350,13 +619,21 @@ class EDIDelforCumminsParser:
                 parts = line.split('+')
                 if len(parts) >= 2:
                     current_scc = parts[1]
-                    # Clear pending quantities when new SCC starts to prevent duplicates
-                    pending_quantities = []
+                    # DELJIT sends QTY, SCC, DTM: the SCC belongs to the quantity before it
+                    if current_message != 'DELJIT':
+                        # Clear pending quantities when new SCC starts to prevent duplicates
+                        pending_quantities = []
+                    last_created = []
+                    last_dated = False
                     # Only reset release for backlog (SCC 10)
                     if current_scc == '10':
                         current_release = ''
 
             elif line.startswith('QTY'):
+                # Quantities of a part the filter excludes are never stored. The rest of
+                # its LIN group is still read: order and location carry over to the next one
+                if parse_filter is not None and not parse_filter.part_wanted(current_part_number):
+                    continue
                 parts = line.split('+')
                 if len(parts) >= 2:
                     qty_parts = parts[1].split(':')
@@ -373,13 +650,58 @@ class EDIDelforCumminsParser:
                             qty_type_desc = 'Kumulativní'
                         elif qty_type == '48':
                             qty_type_desc = 'Plánované'
+                        elif qty_type == '12' and current_message == 'DESADV':
+                            # Despatched quantity, dated by the despatch date of the advice (DTM+11)
+                            if parse_filter is not None and not (parse_filter.type_wanted(DESPATCH_TYPE, qty_type)
+                                                                 and parse_filter.line_wanted('', despatch_date)):
+                                continue
+                            delivery = {
+                                'Položka': current_part_number,
+                                'Popis': current_description,
+                                'Datum': despatch_date,
+                                'Množství': quantity,
+                                'Typ': DESPATCH_TYPE,
+                                'SCC': '',
+                                'Release': '',
+                                'Objednávka': current_po,
+                                'Dodací list': self.header_info.get('Číslo zprávy', ''),
+                                'Zásilka': current_package
+                            }
+                            if current_packaging:
+                                delivery['Balení'] = current_packaging
+                            if arrival_date:
+                                delivery['Příjezd'] = arrival_date
+                            self.add_delivery(delivery, '')
+                            continue
                         
                         # Store quantity info waiting for corresponding date
                         pending_quantities.append({
                             'quantity': quantity,
-                            'type': qty_type_desc
+                            'type': qty_type_desc,
+                            'qualifier': qty_type
                         })
 
+            elif line.startswith('SEQ'):
+                # DELJIT delivery sequence, the LIN groups after it belong to it
+                parts = line.split('+')
+                current_sequence = parts[2].split(':')[0] if len(parts) >= 3 else ''
+                pending_quantities = []
+
+            elif line.startswith('CPS'):
+                # DESADV packing level (consignment, pallet, ...)
+                parts = line.split('+')
+                current_package = parts[1] if len(parts) >= 2 else ''
+                current_packaging = ''
+
+            elif line.startswith('PAC'):
+                # Number and type of packages, e.g. PAC+4++BOX
+                parts = line.split('+')
+                if len(parts) >= 2 and parts[1]:
+                    package_type = parts[3].split(':')[0] if len(parts) >= 4 else ''
+                    current_packaging = f"{parts[1]} {package_type}".strip()
+
+        self.envelope_report = envelope.finish()
+
         # Store line items for reference
         unique_parts = {}
         for delivery in self.delivery_schedules:
@@ -392,12 +714,14 @@ class EDIDelforCumminsParser:
         
         self.line_items = list(unique_parts.values())
 
+    def parse_file(self, filepath):
+        """Read and parse the EDI file without touching the UI; errors propagate"""
+        self.parse_edi_file(read_edi_file(filepath))
+
     def load_file(self, filepath=None):
         if filepath:
             try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                self.parse_edi_file(content)
+                self.parse_file(filepath)
                 self.display_data()
                 return True
             except Exception as e:
@@ -415,32 +739,18 @@ class EDIDelforCumminsParser:
         info_content += "\n=== INFORMACE O PARTNERECH ===\n"
         for key, value in self.partner_info.items():
             info_content += f"{key}: {value}\n"
+        # Envelope check (UNB/UNZ, UNH/UNT) from the parse pass
+        if self.envelope_report:
+            info_content += "\n=== KONTROLA OBÁLKY ===\n"
+            info_content += "\n".join(self.envelope_report['Chyby']) if self.envelope_report['Chyby'] else "OK"
+            info_content += "\n"
         self.info_text.insert(1.0, info_content)
 
         # Display delivery schedules
-        for item in self.delivery_tree.get_children():
-            self.delivery_tree.delete(item)
-
-        # Sort deliveries by date
-        def date_sort_key(delivery):
-            date_str = delivery.get('Datum', '')
-            try:
-                return datetime.strptime(date_str, '%d.%m.%Y') if date_str else datetime.max
-            except:
-                return datetime.max
-
-        sorted_deliveries = sorted(self.delivery_schedules, key=date_sort_key)
-        
-        for delivery in sorted_deliveries:
-            self.delivery_tree.insert('', tk.END, values=(
-                delivery.get('Položka', ''),
-                delivery.get('Popis', ''),
-                delivery.get('Datum', ''),
-                delivery.get('Množství', ''),
-                delivery.get('Typ', ''),
-                delivery.get('SCC', ''),
-                delivery.get('Release', '')
-            ))
+        self.release_combo.configure(values=(self.ALL_RELEASES,) + tuple(self.get_releases()))
+        self.release_var.set(self.ALL_RELEASES)
+        self.build_delivery_table()
+        self.show_deliveries()
 
         # Display statistics
         self.stats_text.delete(1.0, tk.END)
@@ -468,15 +778,112 @@ class EDIDelforCumminsParser:
         stats_content += "=== STATISTIKY PO SCC ===\n"
         for scc, stats in scc_stats.items():
             stats_content += f"{scc}: {stats['count']} dodávek, {stats['total_qty']:,} kusů\n"
+
+        # Release subtotals straight from the release index
+        releases = self.get_releases()
+        if releases:
+            stats_content += "\n=== STATISTIKY PO RELEASE ===\n"
+            for release in releases:
+                deliveries = self.get_deliveries(release=release)
+                qty = sum(int(d['Množství']) for d in deliveries if d['Množství'].isdigit())
+                stats_content += f"Release {release}: {len(deliveries)} dodávek, {qty:,} kusů\n"
+
+        # Backlog (SCC 10) per part
+        backlog = self.get_deliveries(scc_code='10')
+        if backlog:
+            backlog_by_part = {}
+            for delivery in backlog:
+                if delivery['Množství'].isdigit():
+                    part = delivery['Položka']
+                    backlog_by_part[part] = backlog_by_part.get(part, 0) + int(delivery['Množství'])
+            stats_content += "\n=== BACKLOG PO POLOŽKÁCH ===\n"
+            for part, qty in backlog_by_part.items():
+                stats_content += f"{part}: {qty:,} kusů\n"
         
         self.stats_text.insert(1.0, stats_content)
+        self.prerender.start(*self.export_job())
+
+    def get_selected_release(self):
+        """Selected release number, or None when all releases are shown"""
+        release = self.release_var.get() if hasattr(self, 'release_var') else self.ALL_RELEASES
+        return None if release == self.ALL_RELEASES else release
+
+    def build_delivery_table(self):
+        """Prepare sorting and filtering for freshly loaded data and fill the filter lists"""
+        self.delivery_table = DeliveryTable(self.delivery_schedules, date_columns=('Datum',),
+                                            number_columns=('Množství', 'Release'))
+        self.sort_column = self.DEFAULT_SORT
+        self.sort_descending = False
+        self.update_sort_headings()
+        for combo, var, all_value, column in ((self.part_combo, self.part_var, self.ALL_PARTS, 'Položka'),
+                                              (self.type_combo, self.type_var, self.ALL_TYPES, 'Typ'),
+                                              (self.scc_combo, self.scc_var, self.ALL_SCC, 'SCC')):
+            combo.configure(values=(all_value,) + tuple(self.delivery_table.distinct(column)))
+            var.set(all_value)
+        self.date_from_var.set('')
+        self.date_to_var.set('')
+
+    def sort_deliveries(self, column):
+        """Sort the table by a column, clicking the same column again reverses the order"""
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self.update_sort_headings()
+        self.show_deliveries()
+
+    def update_sort_headings(self):
+        for col in self.delivery_tree['columns']:
+            arrow = (' ▼' if self.sort_descending else ' ▲') if col == self.sort_column else ''
+            self.delivery_tree.heading(col, text=col + arrow)
+
+    def get_filtered_deliveries(self):
+        """Deliveries of the selected release, narrowed by the quick filters and sorted"""
+        if self.delivery_table is None or self.delivery_table.deliveries is not self.delivery_schedules:
+            self.build_delivery_table()
+        release = self.get_selected_release()
+        values = {}
+        for var, all_value, column in ((self.part_var, self.ALL_PARTS, 'Položka'),
+                                       (self.type_var, self.ALL_TYPES, 'Typ'),
+                                       (self.scc_var, self.ALL_SCC, 'SCC')):
+            if var.get() != all_value:
+                values[column] = {var.get()}
+        return self.delivery_table.rows(
+            self.sort_column, self.sort_descending,
+            within=self.release_index.get(release, []) if release else None,
+            values=values, date_column='Datum',
+            date_from=self.date_from_var.get().strip(), date_to=self.date_to_var.get().strip())
+
+    def show_deliveries(self):
+        try:
+            deliveries = self.get_filtered_deliveries()
+        except ValueError as e:
+            # An unreadable date bound in the quick filter; the table stays as it was
+            messagebox.showwarning("Upozornění", str(e))
+            return
+        for item in self.delivery_tree.get_children():
+            self.delivery_tree.delete(item)
+
+        for delivery in deliveries:
+            self.delivery_tree.insert('', tk.END, values=(
+                delivery.get('Položka', ''),
+                delivery.get('Popis', ''),
+                delivery.get('Datum', ''),
+                delivery.get('Množství', ''),
+                delivery.get('Typ', ''),
+                delivery.get('SCC', ''),
+                delivery.get('Release', '')
+            ))
 
     def on_closing(self):
         """Handle window close event"""
+        self.prerender.shutdown()
         self.root.destroy()  # Close the current window
         
     def back_to_main(self):
         """Closes the current window"""
+        self.prerender.shutdown()
         self.root.destroy()
 
     def get_week_number(self, date_str):
@@ -492,122 +899,114 @@ class EDIDelforCumminsParser:
             print(f"Error parsing date {date_str}: {e}")
             return ""
 
+    def build_workbook(self, include_pivot=False, release=None):
+        """Build the delivery and weekly summary workbook (does not save it), optionally for one release"""
+        deliveries = self.get_deliveries(release=release) if release else self.delivery_schedules
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Dodávky"
+
+        # Headers with week number
+        headers = ["Týden", "Datum", "Položka", "Popis", "Množství", "Typ", "SCC", "Release"]
+
+        # Add data - sort by date from oldest to newest
+        def parse_date(date_str):
+            try:
+                if '.' in date_str:
+                    return datetime.strptime(date_str, '%d.%m.%Y').date()
+                else:
+                    return datetime.strptime(date_str, '%Y%m%d').date()
+            except:
+                return datetime.min.date()
+
+        sorted_deliveries = sorted(deliveries, key=lambda x: parse_date(x.get('Datum', '')))
+        # Week number and date in the first two columns; column widths are fitted while writing
+        write_rows(ws, headers, ([self.get_week_number(item.get('Datum', '')), item.get('Datum', ''),
+                                  item.get('Položka', ''), item.get('Popis', ''), item.get('Množství', ''),
+                                  item.get('Typ', ''), item.get('SCC', ''), item.get('Release', '')]
+                                 for item in sorted_deliveries))
+
+        # Add a summary sheet with just week and quantity
+        ws_summary = wb.create_sheet("Přehled")
+
+        # Group quantities by week (sorted by week number)
+        weekly_totals = {}
+        for item in sorted_deliveries:
+            week_num = self.get_week_number(item.get('Datum', ''))
+            if week_num:
+                try:
+                    qty = int(item.get('Množství', 0))
+                    if week_num in weekly_totals:
+                        weekly_totals[week_num] += qty
+                    else:
+                        weekly_totals[week_num] = qty
+                except (ValueError, TypeError):
+                    pass
+
+        # Weekly totals, the summary headers are bold only
+        write_rows(ws_summary, ["Týden", "Množství"], sorted(weekly_totals.items()), max_width=15,
+                   header_alignment=None)
+
+        # Part x week matrix sheet from the index built while parsing
+        if include_pivot and self.forecast_pivot:
+            if release:
+                pivot = ForecastPivot()
+                for item in deliveries:
+                    if item['Typ'] not in ('Kumulativní', DESPATCH_TYPE):
+                        pivot.add(item['Položka'], item['Datum'], item['SCC'], item['Množství'])
+            else:
+                pivot = self.forecast_pivot
+            pivot.write_sheet(wb)
+
+        return wb
+
     def export_to_excel(self):
         """Export delivery data to Excel with calendar weeks"""
         if not self.delivery_schedules:
             messagebox.showwarning("Upozornění", "Žádná data k exportu")
             return
 
-        try:
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Dodávky"
-
-            # Headers with week number
-            headers = ["Týden", "Datum", "Položka", "Popis", "Množství", "Typ", "SCC", "Release"]
-            for col_num, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col_num, value=header)
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-
-            # Add data - sort by date from oldest to newest
-            def parse_date(date_str):
-                try:
-                    if '.' in date_str:
-                        return datetime.strptime(date_str, '%d.%m.%Y').date()
-                    else:
-                        return datetime.strptime(date_str, '%Y%m%d').date()
-                except:
-                    return datetime.min.date()
-            
-            row_num = 2
-            for item in sorted(self.delivery_schedules, key=lambda x: parse_date(x.get('Datum', ''))):
-                # Get week number from date
-                week_num = self.get_week_number(item.get('Datum', ''))
-                
-                # Add week number and date in the first two columns
-                ws.cell(row=row_num, column=1, value=week_num)
-                ws.cell(row=row_num, column=2, value=item.get('Datum', ''))
-                
-                # Add other data
-                ws.cell(row=row_num, column=3, value=item.get('Položka', ''))
-                ws.cell(row=row_num, column=4, value=item.get('Popis', ''))
-                ws.cell(row=row_num, column=5, value=item.get('Množství', ''))
-                ws.cell(row=row_num, column=6, value=item.get('Typ', ''))
-                ws.cell(row=row_num, column=7, value=item.get('SCC', ''))
-                ws.cell(row=row_num, column=8, value=item.get('Release', ''))
-                row_num += 1
-
-            # Auto-adjust column widths
-            for col in ws.columns:
-                max_length = 0
-                column = col[0].column_letter
-                for cell in col:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)
-                ws.column_dimensions[column].width = min(adjusted_width, 30)
-
-            # Add a summary sheet with just week and quantity
-            ws_summary = wb.create_sheet("Přehled")
-            ws_summary.cell(row=1, column=1, value="Týden").font = Font(bold=True)
-            ws_summary.cell(row=1, column=2, value="Množství").font = Font(bold=True)
-            
-            # Group quantities by week (sorted by week number)
-            weekly_totals = {}
-            for item in sorted(self.delivery_schedules, key=lambda x: parse_date(x.get('Datum', ''))):
-                week_num = self.get_week_number(item.get('Datum', ''))
-                if week_num:
-                    try:
-                        qty = int(item.get('Množství', 0))
-                        if week_num in weekly_totals:
-                            weekly_totals[week_num] += qty
-                        else:
-                            weekly_totals[week_num] = qty
-                    except (ValueError, TypeError):
-                        pass
-            
-            # Add weekly totals to summary
-            row = 2
-            for week, total in sorted(weekly_totals.items()):
-                ws_summary.cell(row=row, column=1, value=week)
-                ws_summary.cell(row=row, column=2, value=total)
-                row += 1
-
-            # Auto-adjust summary columns
-            for col in ws_summary.columns:
-                max_length = 0
-                column = col[0].column_letter
-                for cell in col:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)
-                ws_summary.column_dimensions[column].width = min(adjusted_width, 15)
-
-            # Save the file
-            filename = f"dodavky_cummins_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            filepath = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
-                initialfile=filename
-            )
-            
-            if filepath:
-                wb.save(filepath)
-                messagebox.showinfo("Hotovo", f"Data byla úspěšně exportována do souboru:\n{filepath}")
-
-        except Exception as e:
-            messagebox.showerror("Chyba", f"Chyba při exportu do Excelu: {str(e)}")
+        # Export what is shown - all releases or just the selected one. The workbook
+        # keeps building in the background while the save dialog is open.
+        release = self.get_selected_release()
+        key, build = self.export_job()
+        self.prerender.start(key, build)
+
+        release_suffix = f"_release_{release}" if release else ""
+        filename = f"dodavky_cummins{release_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
+            initialfile=filename
+        )
+        if filepath:
+            self.prerender.save(
+                self.root, key, build, filepath,
+                on_saved=lambda path: messagebox.showinfo(
+                    "Hotovo", f"Data byla úspěšně exportována do souboru:\n{path}"),
+                on_error=lambda e: messagebox.showerror("Chyba", f"Chyba při exportu do Excelu: {str(e)}"))
+
+    def export_job(self):
+        """(key, build) of the export with the options currently shown"""
+        release = self.get_selected_release()
+        include_pivot = self.pivot_var.get()
+        # The build runs on the prerender thread, from a consistent copy of the state
+        snapshot = self.snapshot()
+        key = (id(snapshot.delivery_schedules), release, include_pivot)
+        return key, lambda: snapshot.build_workbook(include_pivot=include_pivot, release=release)
 
     def run(self):
         self.root.mainloop()
 
+def build_release_workbook(parsers, release, include_pivot=False):
+    """Workbook with the deliveries of one release collected from several parsed files"""
+    combined = EDIDelforCumminsParser(headless=True)
+    for parser in parsers:
+        for delivery in parser.get_deliveries(release=release):
+            # A copy, the deliveries stay owned by their own parser
+            combined.add_delivery(dict(delivery), combined.get_scc_code(delivery['SCC']))
+    return combined.build_workbook(include_pivot=include_pivot)
+
 if __name__ == "__main__":
     # When run directly, use the main parser to handle file selection
     from edi_parser_main import EDIUnifiedParser
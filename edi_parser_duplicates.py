@@ -0,0 +1,146 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+
+# Default index file in the watcher's output folder
+INDEX_NAME = '.edi_prenosy.sqlite'
+
+NEW = 'Nový'
+DUPLICATE = 'Duplikát'
+NEAR_DUPLICATE = 'Podobný'
+
+UNB_SEGMENT = re.compile(rb"UNB\+([^']*)")
+UNH_SEGMENT = re.compile(rb"'\s*UNH\+([^'+]*)")
+BGM_SEGMENT = re.compile(rb"'\s*BGM\+([^']*)")
+
+# Envelope segments differ between resends (date/time, control references) and are not fingerprinted
+ENVELOPE_TAGS = (b'UNA', b'UNB', b'UNG', b'UNH', b'UNT', b'UNE', b'UNZ')
+
+
+def transmission_key(data):
+    """(sender, document numbers, UNH references, fingerprint, UNB control reference) from the raw bytes.
+
+    Only regex scans and one hash over the message content, no EDI parsing.
+    The fingerprint ignores the envelope and line breaks, so a resend with a
+    new UNB date or new control references still has the same fingerprint."""
+    unb = UNB_SEGMENT.search(data)
+    elements = unb.group(1).split(b'+') if unb else []
+    sender = elements[1].split(b':')[0] if len(elements) > 1 else b''
+    control = elements[4].split(b':')[0] if len(elements) > 4 else b''
+    references = [reference.split(b':')[0] for reference in UNH_SEGMENT.findall(data)]
+    documents = []
+    for bgm in BGM_SEGMENT.findall(data):
+        parts = bgm.split(b'+')
+        documents.append(parts[1].split(b':')[0] if len(parts) > 1 else b'')
+
+    digest = hashlib.blake2b(digest_size=16)
+    for segment in data.split(b"'"):
+        segment = b''.join(segment.split())
+        if segment and segment[:3] not in ENVELOPE_TAGS:
+            digest.update(segment)
+            digest.update(b"'")
+    return (sender.decode('latin-1'), ','.join(d.decode('latin-1') for d in documents),
+            ','.join(r.decode('latin-1') for r in references), digest.hexdigest(), control.decode('latin-1'))
+
+
+class TransmissionIndex:
+    """Persistent index of received transmissions (SQLite, safe for several worker processes).
+
+    An exact resend has the same sender, document number, UNH reference and
+    fingerprint as a known transmission. A near duplicate shares either the
+    sender and document number or the fingerprint, but not all of them."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS prenosy ("
+            " odesilatel TEXT, doklad TEXT, reference TEXT, otisk TEXT, ridici_reference TEXT,"
+            " soubor TEXT, prijato REAL,"
+            " PRIMARY KEY (odesilatel, doklad, reference, otisk))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS prenosy_otisk ON prenosy (otisk)")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _matches(self, key):
+        sender, document, reference, fingerprint, _ = key
+        rows = self.connection.execute(
+            "SELECT odesilatel, doklad, reference, otisk, soubor FROM prenosy"
+            " WHERE (odesilatel = ? AND doklad = ?) OR otisk = ?",
+            (sender, document, fingerprint)).fetchall()
+        exact = [row[4] for row in rows if row[:4] == (sender, document, reference, fingerprint)]
+        near = [row[4] for row in rows if row[:4] != (sender, document, reference, fingerprint)]
+        return exact, near
+
+    def check(self, key):
+        """(status, files) without recording anything; files are the earlier transmissions"""
+        exact, near = self._matches(key)
+        if exact:
+            return DUPLICATE, exact
+        return (NEAR_DUPLICATE, near) if near else (NEW, [])
+
+    def claim(self, key, filename):
+        """Check and record in one transaction, so two workers never both take the same resend"""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            status, files = self.check(key)
+            if status != DUPLICATE:
+                self.connection.execute(
+                    "INSERT INTO prenosy VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    key + (filename, time.time()))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return status, files
+
+    def forget(self, key):
+        """Drop a claimed transmission again (its processing failed, a resend must not be skipped)"""
+        sender, document, reference, fingerprint, _ = key
+        self.connection.execute(
+            "DELETE FROM prenosy WHERE odesilatel = ? AND doklad = ? AND reference = ? AND otisk = ?",
+            (sender, document, reference, fingerprint))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM prenosy").fetchone()[0]
+
+
+def read_transmission_key(filepath):
+    with open(filepath, 'rb') as f:
+        return transmission_key(f.read())
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="edi_parser_main.py duplicates",
+        description="Zkontroluje soubory proti indexu přijatých přenosů a nové do něj zapíše.")
+    arg_parser.add_argument("index", help="Soubor indexu (SQLite)")
+    arg_parser.add_argument("files", nargs='+', help="EDI soubory")
+    arg_parser.add_argument("--dry-run", action="store_true", help="Jen zkontrolovat, nic nezapisovat")
+    args = arg_parser.parse_args(argv)
+
+    duplicates = 0
+    with TransmissionIndex(args.index) as index:
+        for filepath in args.files:
+            key = read_transmission_key(filepath)
+            name = os.path.basename(filepath)
+            status, files = index.check(key) if args.dry_run else index.claim(key, name)
+            duplicates += status == DUPLICATE
+            print(f"{status:9} {name}: odesílatel {key[0]}, doklad {key[1]}, UNH {key[2]}"
+                  + (f" (dříve {', '.join(files)})" if files else ""))
+    return 1 if duplicates else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import re
+
+# Service segments the byte scan needs to see (the rest is only counted)
+SERVICE_SEGMENT = re.compile(rb"(?:^|')\s*(UNB|UNG|UNH|UNT|UNE|UNZ)\+([^']*)")
+
+
+class EnvelopeValidator:
+    """Interchange / message envelope check fed from the parser's own segment loop.
+
+    `feed` only looks at the tag and keeps counters and control references,
+    it never walks the content again. `finish` returns the report:
+    {'Platné': bool, 'Chyby': [...], 'Výměny': [{..., 'Zprávy': [...]}]}."""
+
+    def __init__(self):
+        self.interchanges = []
+        self.errors = []
+        self._interchange = None
+        self._group = None
+        self._message = None
+
+    def _error(self, text, *owners):
+        self.errors.append(text)
+        for owner in owners:
+            if owner is not None:
+                owner['Chyby'].append(text)
+
+    def skip(self, count):
+        """Account for `count` ordinary segments without looking at them"""
+        if self._message is not None:
+            self._message['Segmenty'] += count
+        elif count and self._interchange is not None:
+            self._interchange['Segmenty mimo zprávy'] += count
+
+    def feed(self, segment):
+        tag = segment[:3]
+        if tag not in ('UNB', 'UNG', 'UNH', 'UNT', 'UNE', 'UNZ'):
+            self.skip(1)
+            return
+        elements = segment.split('+')
+        # Control reference: UNB/UNG element 5, UNH element 1, UNT/UNE/UNZ element 2
+        position = {'UNB': 5, 'UNG': 5, 'UNH': 1}.get(tag, 2)
+        reference = elements[position].split(':')[0] if len(elements) > position else ''
+
+        if tag == 'UNB':
+            if self._interchange is not None:
+                self._close_interchange()
+            self._interchange = {
+                'Řídicí reference': reference,
+                'Odesílatel': elements[2].split(':')[0] if len(elements) > 2 else '',
+                'Příjemce': elements[3].split(':')[0] if len(elements) > 3 else '',
+                'Počet zpráv': 0,
+                'Počet skupin': 0,
+                'Segmenty mimo zprávy': 0,
+                'Zprávy': [],
+                'Chyby': [],
+            }
+            self.interchanges.append(self._interchange)
+        elif tag == 'UNH':
+            if self._message is not None:
+                self._error(f"Zpráva {self._message['Reference']}: chybí UNT", self._message, self._interchange)
+                self._message = None
+            if self._interchange is None:
+                self._error(f"Zpráva {reference}: chybí UNB")
+            self._message = {
+                'Reference': reference,
+                'Typ': elements[2].split(':')[0] if len(elements) > 2 else '',
+                'Segmenty': 1,
+                'Chyby': [],
+            }
+            if self._interchange is not None:
+                self._interchange['Zprávy'].append(self._message)
+                self._interchange['Počet zpráv'] += 1
+            if self._group is not None:
+                self._group['Počet zpráv'] += 1
+        elif tag == 'UNT':
+            message = self._message
+            if message is None:
+                self._error(f"UNT {reference}: bez odpovídajícího UNH", self._interchange)
+                return
+            message['Segmenty'] += 1
+            declared = elements[1] if len(elements) > 1 else ''
+            if declared != str(message['Segmenty']):
+                self._error(f"Zpráva {message['Reference']}: UNT uvádí {declared or '?'} segmentů, "
+                            f"nalezeno {message['Segmenty']}", message, self._interchange)
+            if reference != message['Reference']:
+                self._error(f"Zpráva {message['Reference']}: UNT má referenci {reference or '?'}",
+                            message, self._interchange)
+            self._message = None
+        elif tag == 'UNG':
+            self._group = {'Reference': reference, 'Počet zpráv': 0}
+            if self._interchange is not None:
+                self._interchange['Počet skupin'] += 1
+        elif tag == 'UNE':
+            group = self._group
+            if group is None:
+                self._error(f"UNE {reference}: bez odpovídajícího UNG", self._interchange)
+                return
+            declared = elements[1] if len(elements) > 1 else ''
+            if declared != str(group['Počet zpráv']):
+                self._error(f"Skupina {group['Reference']}: UNE uvádí {declared or '?'} zpráv, "
+                            f"nalezeno {group['Počet zpráv']}", self._interchange)
+            if reference != group['Reference']:
+                self._error(f"Skupina {group['Reference']}: UNE má referenci {reference or '?'}",
+                            self._interchange)
+            self._group = None
+        else:
+            self._close_interchange(elements)
+
+    def _close_interchange(self, unz_elements=None):
+        interchange = self._interchange
+        if self._message is not None:
+            self._error(f"Zpráva {self._message['Reference']}: chybí UNT (soubor je zřejmě neúplný)",
+                        self._message, interchange)
+            self._message = None
+        if interchange is None:
+            self._error("UNZ bez odpovídajícího UNB")
+            return
+        if unz_elements is None:
+            self._error(f"Výměna {interchange['Řídicí reference']}: chybí UNZ (soubor je zřejmě neúplný)",
+                        interchange)
+        else:
+            declared = unz_elements[1] if len(unz_elements) > 1 else ''
+            reference = unz_elements[2] if len(unz_elements) > 2 else ''
+            # UNZ counts functional groups when the interchange has any, messages otherwise
+            counted = interchange['Počet skupin'] or interchange['Počet zpráv']
+            if declared != str(counted):
+                self._error(f"Výměna {interchange['Řídicí reference']}: UNZ uvádí {declared or '?'}, "
+                            f"nalezeno {counted}", interchange)
+            if reference != interchange['Řídicí reference']:
+                self._error(f"Výměna {interchange['Řídicí reference']}: UNZ má referenci {reference or '?'}",
+                            interchange)
+        if interchange['Segmenty mimo zprávy']:
+            self._error(f"Výměna {interchange['Řídicí reference']}: {interchange['Segmenty mimo zprávy']} "
+                        f"segmentů mimo UNH/UNT", interchange)
+        self._interchange = None
+        self._group = None
+
+    def finish(self):
+        if self._interchange is not None:
+            self._close_interchange()
+        elif self._message is not None:
+            self._error(f"Zpráva {self._message['Reference']}: chybí UNT (soubor je zřejmě neúplný)",
+                        self._message)
+            self._message = None
+        if not self.interchanges and not self.errors:
+            self.errors.append("Soubor neobsahuje UNB")
+        return {
+            'Platné': not self.errors,
+            'Chyby': list(self.errors),
+            'Výměny': self.interchanges,
+        }
+
+
+def validate_envelope_bytes(data):
+    """Envelope report straight from the raw bytes, for callers that never run
+    the sequential segment loop (parallel parse). Only the service segments are
+    matched, the segments between them are counted by their terminators."""
+    validator = EnvelopeValidator()
+    last = None
+    for match in SERVICE_SEGMENT.finditer(data):
+        if last is not None:
+            # Terminators between the previous service segment and this one, minus released ?'
+            validator.skip(data.count(b"'", last, match.start(0)) - data.count(b"?'", last, match.start(0)))
+        validator.feed(match.group(1).decode('ascii') + '+' + match.group(2).decode('latin-1').strip())
+        last = match.end()
+    return validator.finish()
+
+
+def format_envelope_report(report):
+    """Short text for the info tab and the batch markers"""
+    if report.get('Platné'):
+        return "OK"
+    return "; ".join(report.get('Chyby', []))
@@ -0,0 +1,80 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from openpyxl.styles import Font, Alignment
+from openpyxl.utils import get_column_letter
+
+# Shared by every header cell of every workbook instead of new style objects per cell
+HEADER_FONT = Font(bold=True)
+HEADER_ALIGNMENT = Alignment(horizontal='center')
+
+
+def write_rows(ws, headers, rows, max_width=30, header_alignment=HEADER_ALIGNMENT):
+    """Bold header row and data rows, with column widths taken from the longest value.
+
+    Widths are measured while the rows are appended, so the cells are never
+    walked a second time."""
+    ws.append(headers)
+    for cell in ws[1]:
+        cell.font = HEADER_FONT
+        if header_alignment is not None:
+            cell.alignment = header_alignment
+    widths = [len(str(header)) for header in headers]
+    for row in rows:
+        ws.append(row)
+        for i, value in enumerate(row):
+            length = len(str(value))
+            if length > widths[i]:
+                widths[i] = length
+    for i, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = min(width + 2, max_width)
+    return ws
+
+
+def workbook_bytes(wb):
+    """The .xlsx file content of a workbook"""
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+class WorkbookPrerender:
+    """Builds the export workbook on a background thread as soon as the data is known.
+
+    `start` is called after parsing with the options currently shown and again
+    on "Export do Excelu"; while the options (the key) stay the same the
+    already prepared bytes are reused. `save` never blocks the Tk thread: it
+    checks the future with `after` and writes the ready buffer."""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._key = None
+        self._future = None
+
+    def start(self, key, build):
+        """Future with the .xlsx bytes of `build()`; `build` must not touch Tk"""
+        if self._future is None or key != self._key or (self._future.done() and self._future.exception()):
+            self._key = key
+            self._future = self._executor.submit(lambda: workbook_bytes(build()))
+        return self._future
+
+    def save(self, root, key, build, filepath, on_saved, on_error, interval=50):
+        future = self.start(key, build)
+
+        def check():
+            if not future.done():
+                root.after(interval, check)
+                return
+            try:
+                data = future.result()
+                with open(filepath, 'wb') as f:
+                    f.write(data)
+            except Exception as e:
+                on_error(e)
+            else:
+                on_saved(filepath)
+
+        check()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,105 @@
+import copy
+from datetime import date, timedelta
+
+from edi_parser_netting import date_bound, date_sort_value
+
+# Quantity type of the cumulative series that the netting step turns into net demand
+CUMULATIVE_TYPE = 'Kumulativní'
+
+
+class ParseFilter:
+    """Which deliveries a parse keeps, checked while the segments are read.
+
+    The partner parsers skip a LIN group of an unwanted part at its LIN
+    segment and a schedule line of an unwanted quantity type at its QTY, and
+    check the SCC code and date window before the delivery record is built.
+    Cumulative quantities (Minebea/TRWKOB QTY+113) only get their net value
+    from the earlier lines of their series, so they are kept through the
+    netting and dropped afterwards (`drop_netted`).
+
+    Every criterion left at None lets everything through. Dates are
+    'DD.MM.YYYY' (or 'YYYYMMDD') strings, the window is inclusive. Quantity
+    types are the parsers' labels ('Dodávka', 'Kumulativní', ...) or the
+    QTY qualifiers ('1', '113', ...)."""
+
+    def __init__(self, date_from=None, date_to=None, scc=None, parts=None, types=None):
+        self.date_from = date_bound(date_from) if date_from else None
+        self.date_to = date_bound(date_to) if date_to else None
+        self.scc = frozenset(scc) if scc is not None else None
+        self.parts = frozenset(parts) if parts is not None else None
+        self.types = frozenset(types) if types is not None else None
+        # Set on the filter of a chunk of a file, the netting runs only after the merge
+        self.defer_netted = False
+
+    @classmethod
+    def horizon(cls, weeks, today=None, **criteria):
+        """Filter for the next `weeks` weeks from today (inclusive)"""
+        today = today or date.today()
+        end = today + timedelta(weeks=weeks)
+        return cls(date_from=today.strftime('%d.%m.%Y'), date_to=end.strftime('%d.%m.%Y'), **criteria)
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={value!r}" for name, value in vars(self).items() if value)
+        return f"ParseFilter({fields})"
+
+    def part_wanted(self, part_number):
+        return self.parts is None or part_number in self.parts
+
+    def type_wanted(self, quantity_type, qualifier=None):
+        return self.types is None or quantity_type in self.types or qualifier in self.types
+
+    def date_wanted(self, date_str):
+        if self.date_from is None and self.date_to is None:
+            return True
+        value = date_sort_value(date_str)
+        if value is None:
+            return False
+        return (self.date_from is None or value >= self.date_from) and (self.date_to is None or value <= self.date_to)
+
+    def line_wanted(self, scc_code, date_str):
+        """SCC code and date of one schedule line"""
+        return (self.scc is None or scc_code in self.scc) and self.date_wanted(date_str)
+
+    def for_chunk(self):
+        """Copy for parsing one chunk of a file: cumulative lines stay for the netting after the merge"""
+        chunk_filter = copy.copy(self)
+        chunk_filter.defer_netted = True
+        return chunk_filter
+
+    def drop_netted(self, deliveries, date_key):
+        """Deliveries without the netted cumulative lines outside the SCC set or date window"""
+        if self.defer_netted:
+            return deliveries
+        return [delivery for delivery in deliveries
+                if delivery.get('Typ') != CUMULATIVE_TYPE
+                or self.line_wanted(delivery.get('SCC', ''), delivery.get(date_key, ''))]
+
+
+def split_values(values):
+    """Set from repeated and/or comma separated command line values, None if none were given"""
+    if not values:
+        return None
+    return {value.strip() for item in values for value in item.split(',') if value.strip()}
+
+
+def add_filter_arguments(arg_parser):
+    """Parse filter options shared by the batch commands"""
+    group = arg_parser.add_argument_group("Filtr (vyhodnocuje se už při parsování)")
+    group.add_argument("--date-from", help="Jen dodávky od data (DD.MM.YYYY)")
+    group.add_argument("--date-to", help="Jen dodávky do data (DD.MM.YYYY)")
+    group.add_argument("--weeks", type=int, help="Jen dodávky na příštích N týdnů (od dneška)")
+    group.add_argument("--scc", action="append", help="Jen tyto kódy SCC (např. 1 nebo 1,4)")
+    group.add_argument("--part", action="append", help="Jen tato čísla položek")
+    group.add_argument("--type", action="append", dest="quantity_type",
+                       help="Jen tyto typy množství (např. Dodávka nebo kvalifikátor QTY 113)")
+
+
+def filter_from_args(args):
+    """ParseFilter from the add_filter_arguments options, None when no option was given"""
+    criteria = {'scc': split_values(args.scc), 'parts': split_values(args.part),
+                'types': split_values(args.quantity_type)}
+    if args.weeks is not None:
+        return ParseFilter.horizon(args.weeks, **criteria)
+    if not (args.date_from or args.date_to or any(value is not None for value in criteria.values())):
+        return None
+    return ParseFilter(date_from=args.date_from, date_to=args.date_to, **criteria)
@@ -0,0 +1,170 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+from edi_parser_charset import decode_edi, detect_encoding
+from edi_parser_main import PARSER_CLASSES, detect_file_type
+
+# End of the interchange/message header: the partner is detected from what comes before
+HEADER_END = re.compile(rb"'\s*(?:LIN|UNS|UNT)\+")
+
+# Detect anyway once this much arrived without a LIN (unusual, very long header)
+DETECT_BYTES = 64 * 1024
+
+
+class IncrementalParser:
+    """Parses a file that is still being written, reading only the bytes appended since the last poll.
+
+    Between polls it keeps the byte offset, the unterminated segment at the
+    end of what was read, and the partner parser's running segment generator,
+    which holds the header, the LIN/SCC context and pending quantities.
+    Nothing before the offset is ever read or parsed again while the object
+    lives. That state is in memory only: a new process starts from byte 0."""
+
+    def __init__(self, filepath, parse_filter=None):
+        self.filepath = filepath
+        # Optional ParseFilter handed to the partner parser
+        self.parse_filter = parse_filter
+        self.offset = 0
+        # Bytes after the last segment terminator, completed by the next poll
+        self.partial = b''
+        self.file_type = None
+        self.parser = None
+        self.encoding = None
+        self.segment_count = 0
+        # UNZ arrived, the interchange is complete
+        self.complete = False
+        self.finished = False
+        self._segments = None
+
+    def poll(self):
+        """Parse whatever was appended since the last call; returns the number of new segments"""
+        if self.finished:
+            return 0
+        with open(self.filepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self.offset:
+                raise ValueError("Soubor byl zkrácen nebo přepsán")
+            if size == self.offset:
+                return 0
+            f.seek(self.offset)
+            new = f.read(size - self.offset)
+        return self.feed(new)
+
+    def feed(self, new):
+        """Parse the next bytes of the input (from a file, a pipe or an archive member).
+
+        `new` may end in the middle of a segment; that part waits for the next call."""
+        self.offset += len(new)
+        data = self.partial + new
+
+        if self._segments is None and not self._start(data, final=False):
+            self.partial = data
+            return 0
+        end = data.rfind(b"'") + 1
+        self.partial = data[end:]
+        return self._feed(data[:end]) if end else 0
+
+    def _start(self, data, final):
+        """Create the partner parser once the header up to the first LIN is available"""
+        match = HEADER_END.search(data)
+        if match is None and len(data) < DETECT_BYTES and not final:
+            return False
+        head = data[:match.start() + 1] if match else data
+        self.encoding = detect_encoding(data)
+        self.file_type = detect_file_type(self.filepath, decode_edi(head, self.encoding))
+        if self.file_type is None:
+            raise ValueError("Nepodporovaný typ souboru")
+        self.parser = PARSER_CLASSES[self.file_type](headless=True, parse_filter=self.parse_filter)
+        self._segments = self.parser.segment_parser()
+        next(self._segments)
+        return True
+
+    def _feed(self, data):
+        count = 0
+        for segment in decode_edi(data, self.encoding).split("'"):
+            segment = segment.strip()
+            if not segment:
+                continue
+            self._segments.send(segment)
+            count += 1
+            if segment.startswith('UNZ'):
+                self.complete = True
+        self.segment_count += count
+        return count
+
+    def finish(self):
+        """End the input (including an unterminated last segment) and run the parser's final steps"""
+        if not self.finished:
+            if self._segments is None:
+                if not self.partial.strip():
+                    raise ValueError("Soubor je prázdný")
+                self._start(self.partial, final=True)
+            if self.partial.strip():
+                self._feed(self.partial)
+            self.partial = b''
+            try:
+                self._segments.send(None)
+            except StopIteration:
+                pass
+            self.finished = True
+        return self.file_type, self.parser
+
+    def progress(self):
+        """Progress summary for reports (not a resumable state)"""
+        return {
+            'Soubor': os.path.basename(self.filepath),
+            'Typ': self.file_type,
+            'Pozice': self.offset,
+            'Nedokončený segment': len(self.partial),
+            'Segmenty': self.segment_count,
+            'Počet dodávek': len(self.parser.delivery_schedules) if self.parser else 0,
+            'Kompletní': self.complete,
+        }
+
+
+def follow(filepath, interval=0.5, idle_timeout=60.0, on_progress=None, parse_filter=None):
+    """Tail a growing file until its UNZ arrives or it stops growing for `idle_timeout` seconds.
+
+    Returns (file_type, parser) of the finished parse."""
+    incremental = IncrementalParser(filepath, parse_filter)
+    last_growth = time.monotonic()
+    while True:
+        if incremental.poll():
+            last_growth = time.monotonic()
+            if on_progress:
+                on_progress(incremental.progress())
+        if incremental.complete or time.monotonic() - last_growth >= idle_timeout:
+            break
+        time.sleep(interval)
+    return incremental.finish()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="edi_parser_main.py tail",
+        description="Průběžně parsuje EDI soubor, do kterého se ještě zapisuje (jen nově přidaná data).")
+    arg_parser.add_argument("file", help="EDI soubor")
+    arg_parser.add_argument("-o", "--output", help="Po dokončení uložit export do Excelu")
+    arg_parser.add_argument("--interval", type=float, default=0.5, help="Jak často (s) kontrolovat růst souboru")
+    arg_parser.add_argument("--idle", type=float, default=60.0,
+                            help="Ukončit, když soubor bez UNZ tolik sekund neroste")
+    args = arg_parser.parse_args(argv)
+
+    def report(progress):
+        print(f"{progress['Soubor']}: {progress['Pozice']} B, {progress['Segmenty']} segmentů, "
+              f"{progress['Počet dodávek']} dodávek")
+
+    file_type, parser = follow(args.file, args.interval, args.idle, on_progress=report)
+    if not parser.envelope_report.get('Platné', True):
+        print("Obálka: " + "; ".join(parser.envelope_report['Chyby']))
+    if args.output:
+        parser.build_workbook().save(args.output)
+        print(f"Export uložen do {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
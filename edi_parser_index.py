@@ -0,0 +1,296 @@
+import argparse
+import mmap
+import os
+import sys
+
+import numpy as np
+
+from edi_parser_charset import decode_edi, detect_encoding
+from edi_parser_main import PARSER_CLASSES, detect_file_type
+
+# Cache file next to the EDI file: <file>.segidx.npz
+INDEX_SUFFIX = '.segidx.npz'
+
+WHITESPACE = np.array([9, 10, 13, 32], dtype=np.uint8)
+
+
+def tag_code(tag):
+    """Three letter segment tag packed into one integer"""
+    tag = tag.encode('ascii') if isinstance(tag, str) else tag
+    return (tag[0] << 16) | (tag[1] << 8) | tag[2]
+
+
+TAG_UNH = tag_code('UNH')
+TAG_UNT = tag_code('UNT')
+TAG_UNS = tag_code('UNS')
+TAG_LIN = tag_code('LIN')
+
+# Segments whose value a partner parser carries over from one LIN group into the next
+# (Cummins keeps the RFF+ON order and the LOC location until a later group sets them)
+CARRIED_SEGMENTS = {
+    'cummins': ('RFF+ON:', 'LOC+'),
+}
+
+
+def read_ranges(filepath, ranges, encoding=None):
+    """Read byte ranges of a file as one EDI text, every piece ending with a segment terminator"""
+    pieces = []
+    with open(filepath, 'rb') as f:
+        for start, end in ranges:
+            f.seek(start)
+            piece = f.read(end - start)
+            pieces.append(piece if piece.rstrip().endswith(b"'") else piece + b"'")
+    return decode_edi(b''.join(pieces), encoding)
+
+
+class SegmentIndex:
+    """Start/end byte offset and tag of every segment, built in one vectorized scan.
+
+    From it the message (UNH..UNT) and LIN group ranges are known without
+    parsing, so a single message or line item can be read and parsed on its
+    own. The arrays are saved beside the file and reused while the file's
+    size and mtime are unchanged."""
+
+    def __init__(self, starts, ends, tags, size, mtime_ns=0):
+        self.starts = starts
+        self.ends = ends
+        self.tags = tags
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self._groups = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def build(cls, data, mtime_ns=0):
+        buf = np.frombuffer(data, dtype=np.uint8)
+        terminators = np.flatnonzero(buf == 0x27)
+        # ?' is a released apostrophe inside a value, not a terminator
+        if len(terminators) and terminators[0] == 0:
+            released = np.concatenate(([False], buf[terminators[1:] - 1] == 0x3F))
+        else:
+            released = buf[terminators - 1] == 0x3F
+        terminators = terminators[~released]
+        starts = np.concatenate(([0], terminators + 1)).astype(np.int64)
+        ends = np.concatenate((terminators, [len(buf)])).astype(np.int64)
+        # Line breaks between segments belong to no segment
+        while True:
+            inside = starts < ends
+            leading = np.zeros(len(starts), dtype=bool)
+            leading[inside] = np.isin(buf[starts[inside]], WHITESPACE)
+            if not leading.any():
+                break
+            starts[leading] += 1
+        keep = ends - starts >= 3
+        starts, ends = starts[keep], ends[keep]
+        tags = (buf[starts].astype(np.int32) << 16) | (buf[starts + 1].astype(np.int32) << 8) | buf[starts + 2]
+        return cls(starts, ends, tags, len(buf), mtime_ns)
+
+    @classmethod
+    def for_file(cls, filepath, cache=True):
+        """Cached index of the file, built (and saved when `cache`) if missing or stale"""
+        index = cls.load_cached(filepath) if cache else None
+        if index is not None:
+            return index
+        st = os.stat(filepath)
+        with open(filepath, 'rb') as f:
+            if st.st_size == 0:
+                index = cls.build(b'', st.st_mtime_ns)
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    index = cls.build(data, st.st_mtime_ns)
+        if cache:
+            try:
+                index.save(filepath)
+            except OSError:
+                # Read-only share: the index just is not cached
+                pass
+        return index
+
+    @classmethod
+    def load_cached(cls, filepath):
+        try:
+            st = os.stat(filepath)
+            with np.load(filepath + INDEX_SUFFIX) as cached:
+                size, mtime_ns = cached['meta'].tolist()
+                if size != st.st_size or mtime_ns != st.st_mtime_ns:
+                    return None
+                return cls(cached['starts'], cached['ends'], cached['tags'], size, mtime_ns)
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, filepath):
+        tmp_path = filepath + INDEX_SUFFIX + '.tmp.npz'
+        np.savez(tmp_path, starts=self.starts, ends=self.ends, tags=self.tags,
+                 meta=np.array([self.size, self.mtime_ns], dtype=np.int64))
+        os.replace(tmp_path, filepath + INDEX_SUFFIX)
+
+    def positions(self, tag):
+        """Segment numbers with the given tag"""
+        return np.flatnonzero(self.tags == tag_code(tag))
+
+    def groups(self):
+        """(message starts, message of every LIN, LIN starts, LIN ends, header ends) as segment numbers"""
+        if self._groups is None:
+            count = len(self.tags)
+            unh = np.flatnonzero(self.tags == TAG_UNH)
+            lin = np.flatnonzero(self.tags == TAG_LIN)
+            # A LIN group ends at the next LIN, UNS, UNT or UNH
+            closing = np.flatnonzero(np.isin(self.tags, (TAG_LIN, TAG_UNS, TAG_UNT, TAG_UNH)))
+            following = np.searchsorted(closing, lin, side='right')
+            lin_ends = np.append(closing, count)[following]
+            lin_message = np.searchsorted(unh, lin, side='right') - 1
+            # The message header ends at its first LIN, or at its UNT without line items
+            header_closing = np.flatnonzero(np.isin(self.tags, (TAG_LIN, TAG_UNT, TAG_UNH)))
+            first = np.searchsorted(header_closing, unh, side='right')
+            header_ends = np.append(header_closing, count)[first]
+            self._groups = (unh, lin_message, lin, lin_ends, header_ends)
+        return self._groups
+
+    def offset(self, segment):
+        """Byte offset where a segment (or the end of the file) starts"""
+        return int(self.starts[segment]) if segment < len(self.starts) else self.size
+
+    def message_count(self):
+        return len(self.groups()[0])
+
+    def line_item_count(self):
+        return len(self.groups()[2])
+
+    def prefix_range(self):
+        unh = self.groups()[0]
+        return 0, self.offset(unh[0]) if len(unh) else self.size
+
+    def message_range(self, number):
+        """Bytes of one message from its UNH up to the next UNH (its UNT included)"""
+        unh = self.groups()[0]
+        end = self.offset(unh[number + 1]) if number + 1 < len(unh) else self.size
+        return self.offset(unh[number]), end
+
+    def line_item_ranges(self, number, carried=()):
+        """Byte ranges that parse one LIN group in context: interchange prefix, message header, the group.
+
+        `carried` are ranges of earlier segments that are replayed right after
+        the group's LIN segment (see LazyEDIFile.carried_ranges)."""
+        unh, lin_message, lin, lin_ends, header_ends = self.groups()
+        message = lin_message[number]
+        ranges = [self.prefix_range()]
+        if message >= 0:
+            ranges.append((self.offset(unh[message]), self.offset(header_ends[message])))
+        if carried:
+            ranges.append((self.offset(lin[number]), self.offset(lin[number] + 1)))
+            ranges.extend(carried)
+            ranges.append((self.offset(lin[number] + 1), self.offset(lin_ends[number])))
+        else:
+            ranges.append((self.offset(lin[number]), self.offset(lin_ends[number])))
+        return ranges
+
+    def boundaries(self):
+        """Same (prefix, messages) layout as edi_parser_parallel.scan_boundaries"""
+        unh, lin_message, lin, lin_ends, header_ends = self.groups()
+        messages = []
+        for number in range(len(unh)):
+            groups = [(self.offset(lin[i]), self.offset(lin_ends[i]))
+                      for i in np.flatnonzero(lin_message == number).tolist()]
+            messages.append({
+                'start': self.offset(unh[number]),
+                'header': (self.offset(unh[number]), self.offset(header_ends[number])),
+                'groups': groups,
+            })
+        return self.prefix_range(), messages
+
+
+class LazyEDIFile:
+    """Opens a file of any size through its segment index and parses only
+    the messages or line items that are asked for."""
+
+    def __init__(self, filepath, cache=True):
+        self.filepath = filepath
+        self.index = SegmentIndex.for_file(filepath, cache)
+        unh = self.index.groups()[0]
+        head_end = self.index.offset(self.index.groups()[4][0]) if len(unh) else self.index.size
+        with open(filepath, 'rb') as f:
+            head = f.read(head_end)
+        self.encoding = detect_encoding(head)
+        self.file_type = detect_file_type(filepath, decode_edi(head, self.encoding))
+        if self.file_type is None:
+            raise ValueError("Nepodporovaný typ souboru")
+        self._parsed = {}
+
+    def segment(self, number):
+        """Text of one segment"""
+        start, end = int(self.index.starts[number]), int(self.index.ends[number])
+        with open(self.filepath, 'rb') as f:
+            f.seek(start)
+            return decode_edi(f.read(end - start), self.encoding)
+
+    def part_number(self, number):
+        """Part number from the LIN segment of a line item, without parsing the group"""
+        elements = self.segment(int(self.index.groups()[2][number])).split('+')
+        return elements[3].split(':')[0] if len(elements) > 3 else ''
+
+    def carried_ranges(self, number):
+        """Byte ranges of the segments LIN group `number` inherits from the groups before it.
+
+        For every CARRIED_SEGMENTS entry the last such segment since the first
+        LIN of the file is taken: its value is what a full parse still holds
+        when it reaches the group's LIN. Segments of the group itself come
+        after it and override it as they would in a full parse."""
+        prefixes = CARRIED_SEGMENTS.get(self.file_type)
+        if not prefixes:
+            return []
+        lin = self.index.groups()[2]
+        start, earliest = int(lin[number]), int(lin[0])
+        ranges = []
+        for prefix in prefixes:
+            positions = self.index.positions(prefix[:3])
+            earlier = positions[(positions >= earliest) & (positions < start)]
+            for position in earlier[::-1].tolist():
+                if self.segment(position).startswith(prefix):
+                    ranges.append((int(self.index.starts[position]), int(self.index.ends[position])))
+                    break
+        return ranges
+
+    def _parse(self, key, ranges):
+        parser = self._parsed.get(key)
+        if parser is None:
+            parser = PARSER_CLASSES[self.file_type](headless=True)
+            parser.parse_edi_file(read_ranges(self.filepath, ranges, self.encoding))
+            self._parsed[key] = parser
+        return parser
+
+    def parse_line_item(self, number):
+        """Headless parser holding only the deliveries of LIN group `number`"""
+        key = ('LIN', number)
+        if key in self._parsed:
+            return self._parsed[key]
+        return self._parse(key, self.index.line_item_ranges(number, self.carried_ranges(number)))
+
+    def parse_message(self, number):
+        """Headless parser holding one whole message"""
+        return self._parse(('UNH', number), [self.index.prefix_range(), self.index.message_range(number)])
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="edi_parser_main.py index",
+        description="Sestaví (a uloží vedle souboru) index segmentů a vypíše vybranou položku bez parsování celého souboru.")
+    arg_parser.add_argument("file", help="EDI soubor")
+    arg_parser.add_argument("--lin", type=int, default=None, help="Vypsat dodávky skupiny LIN s tímto pořadím (od 0)")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Index neukládat vedle souboru")
+    args = arg_parser.parse_args(argv)
+
+    lazy = LazyEDIFile(args.file, cache=not args.no_cache)
+    print(f"{os.path.basename(args.file)}: {lazy.file_type}, {len(lazy.index)} segmentů, "
+          f"{lazy.index.message_count()} zpráv, {lazy.index.line_item_count()} položek LIN")
+    if args.lin is not None:
+        parser = lazy.parse_line_item(args.lin)
+        print(f"Položka {lazy.part_number(args.lin)}: {len(parser.delivery_schedules)} dodávek")
+        for delivery in parser.delivery_schedules:
+            print("  " + ", ".join(f"{key}: {value}" for key, value in delivery.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
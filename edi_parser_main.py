@@ -1,9 +1,69 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
+import sys
+import multiprocessing
 from edi_parser_cummins import EDIDelforCumminsParser
 from edi_parser_trwkob import EDITrwkobParser
 from edi_parser_minebea import EDIDelforParser as EDIDelforMinebeaParser
+from edi_parser_charset import read_edi_file
+
+# Parser class for each type returned by detect_file_type
+PARSER_CLASSES = {
+    "cummins": EDIDelforCumminsParser,
+    "trwkob": EDITrwkobParser,
+    "minebea": EDIDelforMinebeaParser,
+}
+
+def detect_file_type(filepath, content):
+    # Look for patterns in both filename and content
+    filename = os.path.basename(filepath).upper()
+    content_upper = content.upper()
+    
+    # Check for Cummins patterns (both in filename and content)
+    cummins_patterns = [
+        "CUMMINS", "CMI", "CMI-", "CMI_",
+        "DELFOR_CUMMINS", "CUMMINS_DELFOR"
+    ]
+    if any(pattern in filename for pattern in cummins_patterns) or \
+       any(pattern in content_upper for pattern in cummins_patterns):
+        return "cummins"
+        
+    # Check for Minebea patterns
+    minebea_patterns = [
+        "MINEBEA", "MINOL", "MINEBEA-MINOL", "MBM",
+        "DELFOR_MINEBEA", "MINEBEA_DELFOR"
+    ]
+    if any(pattern in filename for pattern in minebea_patterns) or \
+       any(pattern in content_upper for pattern in minebea_patterns):
+        return "minebea"
+        
+    # Check for Trwkob patterns
+    trwkob_patterns = [
+        "TRWKOB", "TRW-KOB", "TRW_KOB", "KOBALT",
+        "DELFOR_TRWKOB", "TRWKOB_DELFOR"
+    ]
+    if any(pattern in filename for pattern in trwkob_patterns) or \
+       any(pattern in content_upper for pattern in trwkob_patterns):
+        return "trwkob"
+        
+    # If no specific pattern found, try to detect by file structure
+    if content.startswith("UNB") or content.startswith("UNA"):
+        # This is a standard EDI file structure
+        return "minebea"  # Default to Minebea as fallback
+        
+    return None
+
+def parse_content(filepath, content, parse_filter=None):
+    """Detect the partner and parse the content headlessly; returns (file_type, parser).
+
+    An optional ParseFilter (edi_parser_filter) is applied during the parse."""
+    file_type = detect_file_type(filepath, content)
+    if file_type is None:
+        raise ValueError("Nepodporovaný typ souboru")
+    parser = PARSER_CLASSES[file_type](headless=True, parse_filter=parse_filter)
+    parser.parse_edi_file(content)
+    return file_type, parser
 
 class EDIUnifiedParser:
     def __init__(self):
@@ -22,6 +82,8 @@ class EDIUnifiedParser:
         btn_frame.pack(fill=tk.X, pady=(0, 10))
         
         ttk.Button(btn_frame, text="Načíst EDI soubor", command=self.load_file).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="Pracovní prostor", command=self.open_workspace).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(btn_frame, text="Přehled souborů", command=self.open_inbox).pack(side=tk.LEFT, padx=(10, 0))
         
         self.info_text = tk.Text(main_frame, wrap=tk.WORD, font=('Courier', 10))
         scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.info_text.yview)
@@ -37,10 +99,11 @@ class EDIUnifiedParser:
         
         if not filepath:
             return
+        return self.open_file(filepath)
 
+    def open_file(self, filepath):
         try:
-            with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-                content = f.read()
+            content = read_edi_file(filepath)
             
             # Detect file type based on both filename and content
             file_type = self.detect_file_type(filepath, content)
@@ -69,43 +132,34 @@ class EDIUnifiedParser:
             return False
 
     def detect_file_type(self, filepath, content):
-        # Look for patterns in both filename and content
-        filename = os.path.basename(filepath).upper()
-        content_upper = content.upper()
-        
-        # Check for Cummins patterns (both in filename and content)
-        cummins_patterns = [
-            "CUMMINS", "CMI", "CMI-", "CMI_",
-            "DELFOR_CUMMINS", "CUMMINS_DELFOR"
-        ]
-        if any(pattern in filename for pattern in cummins_patterns) or \
-           any(pattern in content_upper for pattern in cummins_patterns):
-            return "cummins"
-            
-        # Check for Minebea patterns
-        minebea_patterns = [
-            "MINEBEA", "MINOL", "MINEBEA-MINOL", "MBM",
-            "DELFOR_MINEBEA", "MINEBEA_DELFOR"
-        ]
-        if any(pattern in filename for pattern in minebea_patterns) or \
-           any(pattern in content_upper for pattern in minebea_patterns):
-            return "minebea"
-            
-        # Check for Trwkob patterns
-        trwkob_patterns = [
-            "TRWKOB", "TRW-KOB", "TRW_KOB", "KOBALT",
-            "DELFOR_TRWKOB", "TRWKOB_DELFOR"
-        ]
-        if any(pattern in filename for pattern in trwkob_patterns) or \
-           any(pattern in content_upper for pattern in trwkob_patterns):
-            return "trwkob"
-            
-        # If no specific pattern found, try to detect by file structure
-        if content.startswith("UNB") or content.startswith("UNA"):
-            # This is a standard EDI file structure
-            return "minebea"  # Default to Minebea as fallback
-            
-        return None
+        return detect_file_type(filepath, content)
+
+    def open_inbox(self):
+        """Sortable list of a folder's files from their headers only; a double click opens one"""
+        directory = filedialog.askdirectory(title="Vyberte složku s EDI soubory")
+        if not directory:
+            return
+        try:
+            from edi_parser_preview import InboxWindow
+            window = InboxWindow(directory, on_open=self.open_file)
+            window.root.mainloop()
+        except Exception as e:
+            messagebox.showerror("Chyba", f"Chyba při otevírání přehledu: {str(e)}")
+
+    def open_workspace(self):
+        """Combined demand of many files from all partners in one window"""
+        filepaths = filedialog.askopenfilenames(
+            title="Vyberte EDI soubory",
+            filetypes=[("EDI files", "*.edi"), ("All files", "*.*")]
+        )
+        if not filepaths:
+            return
+        try:
+            from edi_parser_workspace import WorkspaceWindow
+            window = WorkspaceWindow(filepaths)
+            window.root.mainloop()
+        except Exception as e:
+            messagebox.showerror("Chyba", f"Chyba při otevírání pracovního prostoru: {str(e)}")
 
     def run_cummins_parser(self, filepath):
         try:
@@ -177,9 +231,52 @@ class EDIUnifiedParser:
             messagebox.showerror("Chyba", f"Chyba při načítání souboru: {str(e)}")
             return False
 
-def main():
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Headless modes: "watch" monitors an inbound directory, "serve" runs the HTTP service,
+    # "workspace" combines many files (headless with -o, otherwise in its own window),
+    # "tail" parses a file that is still being written, "index" opens one LIN group of a large file,
+    # "match" compares DESADV despatches with a call-off, "inbox" lists a folder from the file headers,
+    # "duplicates" checks files against the index of received transmissions,
+    # "batch" exports many files with a resumable job ledger (optionally one shard of them),
+    # "merge" combines the partial results of batch ledgers
+    if argv and argv[0] == "watch":
+        from edi_parser_watch import main as watch_main
+        return watch_main(argv[1:])
+    if argv and argv[0] == "serve":
+        from edi_parser_service import main as serve_main
+        return serve_main(argv[1:])
+    if argv and argv[0] == "workspace":
+        from edi_parser_workspace import main as workspace_main
+        return workspace_main(argv[1:])
+    if argv and argv[0] == "tail":
+        from edi_parser_incremental import main as tail_main
+        return tail_main(argv[1:])
+    if argv and argv[0] == "index":
+        from edi_parser_index import main as index_main
+        return index_main(argv[1:])
+    if argv and argv[0] == "match":
+        from edi_parser_messages import main as match_main
+        return match_main(argv[1:])
+    if argv and argv[0] == "inbox":
+        from edi_parser_preview import main as inbox_main
+        return inbox_main(argv[1:])
+    if argv and argv[0] == "duplicates":
+        from edi_parser_duplicates import main as duplicates_main
+        return duplicates_main(argv[1:])
+    if argv and argv[0] == "batch":
+        from edi_parser_batch import main as batch_main
+        return batch_main(argv[1:])
+    if argv and argv[0] == "merge":
+        from edi_parser_batch import merge_main
+        return merge_main(argv[1:])
+
     app = EDIUnifiedParser()
     app.root.mainloop()
 
 if __name__ == "__main__":
-    main()
+    # Needed for worker processes in the frozen (PyInstaller) build
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import argparse
+import os
+import sys
+
+from edi_parser_netting import date_sort_value
+
+# Message types the partner parsers handle, by the UNH message type identifier
+MESSAGE_TYPES = {
+    'DELFOR': 'Dodací plán',
+    'DELJIT': 'Odvolávka JIT',
+    'DESADV': 'Avízo o expedici',
+}
+
+# Delivery type of the despatched quantities of a DESADV (QTY+12); never demand
+DESPATCH_TYPE = 'Odesláno'
+
+
+def message_type(segment):
+    """Message type identifier ('DELFOR', 'DELJIT', ...) of an UNH segment"""
+    parts = segment.split('+')
+    return parts[2].split(':')[0] if len(parts) > 2 else ''
+
+
+def split_datetime(value, format_code):
+    """(date value, date format, 'HH:MM') of a DTM value.
+
+    JIT call-offs carry the time (format 203, CCYYMMDDHHMM); the date part is
+    returned as format 102 so the deliveries keep plain dates and the time
+    goes into its own column."""
+    if format_code == '203' and len(value) >= 12 and value[:12].isdigit():
+        return value[:8], '102', f"{value[8:10]}:{value[10:12]}"
+    return value, format_code, ''
+
+
+def _quantity(delivery):
+    # Minebea/TRWKOB deliveries carry the netted quantity, Cummins only the reported one
+    quantity = delivery.get('Čisté množství')
+    if quantity is None:
+        quantity = delivery.get('Množství', '')
+        quantity = int(quantity) if quantity.isdigit() else 0
+    return quantity
+
+
+def match_despatch(call_offs, despatches, date_key='Datum', non_demand=()):
+    """Compare the despatched quantities of DESADV deliveries with the call-offs per part.
+
+    Only the call-off demand due up to the part's last expected arrival
+    ('Příjezd', DTM+132 of the advice, else the despatch date) is counted.
+    Returns one row per part: 'Položka', 'Požadováno', 'Odesláno', 'Rozdíl'
+    (still to be despatched, negative when over-delivered) and 'Dodací listy'."""
+    despatched = {}
+    for delivery in despatches:
+        if delivery.get('Typ') != DESPATCH_TYPE:
+            continue
+        part_number = delivery.get('Položka', '')
+        row = despatched.setdefault(part_number, {'Odesláno': 0, 'Do': 0, 'Dodací listy': []})
+        row['Odesláno'] += _quantity(delivery)
+        arrival = delivery.get('Příjezd') or delivery.get(date_key, '')
+        row['Do'] = max(row['Do'], date_sort_value(arrival) or 0)
+        note = delivery.get('Dodací list', '')
+        if note and note not in row['Dodací listy']:
+            row['Dodací listy'].append(note)
+
+    required = {}
+    for delivery in call_offs:
+        part_number = delivery.get('Položka', '')
+        if part_number not in despatched or delivery.get('Typ') in non_demand:
+            continue
+        due = date_sort_value(delivery.get(date_key, ''))
+        if due is not None and due <= despatched[part_number]['Do']:
+            required[part_number] = required.get(part_number, 0) + _quantity(delivery)
+
+    return [{
+        'Položka': part_number,
+        'Požadováno': required.get(part_number, 0),
+        'Odesláno': row['Odesláno'],
+        'Rozdíl': required.get(part_number, 0) - row['Odesláno'],
+        'Dodací listy': ', '.join(row['Dodací listy']),
+    } for part_number, row in despatched.items()]
+
+
+def main(argv=None):
+    from edi_parser_charset import read_edi_file
+    from edi_parser_main import parse_content
+    from edi_parser_workspace import NON_DEMAND_TYPES
+
+    arg_parser = argparse.ArgumentParser(
+        prog="edi_parser_main.py match",
+        description="Porovná odeslaná množství z DESADV s odvolávkami (DELJIT/DELFOR) po položkách.")
+    arg_parser.add_argument("call_off", help="Soubor s odvolávkou (DELJIT nebo DELFOR)")
+    arg_parser.add_argument("despatch", nargs='+', help="Soubory DESADV")
+    args = arg_parser.parse_args(argv)
+
+    file_type, call_off = parse_content(args.call_off, read_edi_file(args.call_off))
+    date_key = 'Datum' if file_type == 'cummins' else 'Datum od'
+    despatches = []
+    for filepath in args.despatch:
+        despatch_type, parser = parse_content(filepath, read_edi_file(filepath))
+        if parser.header_info.get('Typ zprávy') != 'DESADV':
+            print(f"{os.path.basename(filepath)}: není DESADV, přeskočeno")
+            continue
+        if despatch_type != file_type:
+            print(f"{os.path.basename(filepath)}: jiný partner ({despatch_type}), přeskočeno")
+            continue
+        despatches.extend(parser.delivery_schedules)
+
+    for row in match_despatch(call_off.delivery_schedules, despatches, date_key,
+                              NON_DEMAND_TYPES.get(file_type, ())):
+        print(f"{row['Položka']}: požadováno {row['Požadováno']}, odesláno {row['Odesláno']}, "
+              f"rozdíl {row['Rozdíl']} ({row['Dodací listy']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,62 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import re
+import sys
+import threading
 from datetime import datetime, date
 import os
 import openpyxl
-from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
+from edi_parser_pivot import ForecastPivot
+from edi_parser_netting import apply_net_quantities
+from edi_parser_table import DeliveryTable
+from edi_parser_charset import read_edi_file
+from edi_parser_envelope import EnvelopeValidator
+from edi_parser_export import WorkbookPrerender, write_rows
+from edi_parser_messages import message_type
 
 class EDIDelforParser:
-    def __init__(self, filepath=None):
-        self.root = tk.Tk()
-        self.root.title("EDI MINEBEA Parser")
-        self.root.geometry("1200x800")
-        
+    ALL_PARTS = 'Všechny položky'
+    ALL_TYPES = 'Všechny typy'
+    ALL_SCC = 'Všechna SCC'
+    # Vše, co parsování vytváří; parse_edi_file to převezme z kontextu najednou
+    PARSE_STATE = ('header_info', 'partner_info', 'delivery_schedules', 'line_items', 'forecast_pivot',
+                   'part_index', 'envelope_report')
+    # Segmenty popisující jen aktuální skupinu LIN; u položek vyřazených filtrem se přeskakují
+    LIN_GROUP_TAGS = ('PIA', 'LOC', 'RFF', 'QTY', 'SCC', 'DTM')
+    
+    def __init__(self, filepath=None, headless=False, parse_filter=None):
+        # Volitelný ParseFilter (edi_parser_filter), vyhodnocuje se už při parsování
+        self.parse_filter = parse_filter
+        # Drží ho adopt() po dobu nahrazování atributů PARSE_STATE
+        self._state_lock = threading.Lock()
         # Hlavní data
         self.header_info = {}
         self.partner_info = {}
         self.delivery_schedules = []
+        self.line_items = []
+        self.part_index = {}
+        self.forecast_pivot = ForecastPivot()
+        # Výsledek kontroly obálky (počty segmentů a zpráv, řídicí reference)
+        self.envelope_report = {}
+        
+        # Řazení a filtry tabulky dodávek
+        self.delivery_table = None
+        self.sort_column = None
+        self.sort_descending = False
+        self.scc_codes = {}
+        
+        # Bez GUI (sledování složky, dávkové zpracování) se Tk okno nevytváří
+        self.root = None
+        if headless:
+            if filepath:
+                self.parse_file(filepath)
+            return
+        
+        self.root = tk.Tk()
+        self.root.title("EDI MINEBEA Parser")
+        self.root.geometry("1200x800")
+        # Exportní sešit se sestavuje na pozadí hned po zobrazení dat
+        self.prerender = WorkbookPrerender()
         
         # Handle window close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -37,6 +77,9 @@ class EDIDelforParser:
         btn_frame.pack(fill=tk.X, pady=(0, 10))
         ttk.Button(btn_frame, text="Export do Excelu", command=self.export_to_excel).pack(side=tk.LEFT)
         ttk.Button(btn_frame, text="Zpět na hlavní okno", command=self.back_to_main).pack(side=tk.LEFT, padx=(10, 0))
+        self.pivot_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(btn_frame, text="Export s maticí položka × týden",
+                        variable=self.pivot_var).pack(side=tk.LEFT, padx=(10, 0))
         
         # Notebook pro záložky
         self.notebook = ttk.Notebook(main_frame)
@@ -81,16 +124,53 @@ class EDIDelforParser:
         return scc_mapping.get(scc_code, f'Neznámý kód: {scc_code}')
         
     def setup_delivery_tab(self):
+        # Výběr položky - zobrazení i export jen jedné položky
+        filter_frame = ttk.Frame(self.delivery_frame)
+        filter_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
+        ttk.Label(filter_frame, text="Položka:").pack(side=tk.LEFT)
+        self.part_var = tk.StringVar(value=self.ALL_PARTS)
+        self.part_combo = ttk.Combobox(filter_frame, textvariable=self.part_var, state='readonly',
+                                       values=(self.ALL_PARTS,), width=30)
+        self.part_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.part_combo.bind('<<ComboboxSelected>>', lambda event: self.show_deliveries())
+        
+        # Rychlé filtry podle typu, SCC a rozsahu data (Enter filtr použije)
+        ttk.Label(filter_frame, text="Typ:").pack(side=tk.LEFT, padx=(10, 0))
+        self.type_var = tk.StringVar(value=self.ALL_TYPES)
+        self.type_combo = ttk.Combobox(filter_frame, textvariable=self.type_var, state='readonly',
+                                       values=(self.ALL_TYPES,), width=15)
+        self.type_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.type_combo.bind('<<ComboboxSelected>>', lambda event: self.show_deliveries())
+        
+        ttk.Label(filter_frame, text="SCC:").pack(side=tk.LEFT, padx=(10, 0))
+        self.scc_var = tk.StringVar(value=self.ALL_SCC)
+        self.scc_combo = ttk.Combobox(filter_frame, textvariable=self.scc_var, state='readonly',
+                                      values=(self.ALL_SCC,), width=15)
+        self.scc_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.scc_combo.bind('<<ComboboxSelected>>', lambda event: self.show_deliveries())
+        
+        ttk.Label(filter_frame, text="Od:").pack(side=tk.LEFT, padx=(10, 0))
+        self.date_from_var = tk.StringVar()
+        date_from_entry = ttk.Entry(filter_frame, textvariable=self.date_from_var, width=12)
+        date_from_entry.pack(side=tk.LEFT, padx=(5, 0))
+        date_from_entry.bind('<Return>', lambda event: self.show_deliveries())
+        
+        ttk.Label(filter_frame, text="Do:").pack(side=tk.LEFT, padx=(10, 0))
+        self.date_to_var = tk.StringVar()
+        date_to_entry = ttk.Entry(filter_frame, textvariable=self.date_to_var, width=12)
+        date_to_entry.pack(side=tk.LEFT, padx=(5, 0))
+        date_to_entry.bind('<Return>', lambda event: self.show_deliveries())
+        
         # Treeview pro plán dodávek
         tree_frame = ttk.Frame(self.delivery_frame)
         tree_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        columns = ('Datum od', 'Datum do', 'Množství', 'Typ', 'SCC')
+        columns = ('Položka', 'Datum od', 'Datum do', 'Množství', 'Čisté množství', 'Typ', 'SCC')
         self.delivery_tree = ttk.Treeview(tree_frame, columns=columns, show='headings', height=15)
         
-        # Definice sloupců
+        # Definice sloupců (kliknutí na záhlaví řadí)
         for col in columns:
-            self.delivery_tree.heading(col, text=col)
+            self.delivery_tree.heading(col, text=col, command=lambda c=col: self.sort_deliveries(c))
             self.delivery_tree.column(col, width=120)
         
         # Scrollbary
@@ -142,19 +222,129 @@ class EDIDelforParser:
     
     def parse_edi_file(self, content):
         """Parsuje EDI DELFOR soubor"""
-        lines = content.strip().split("'")
+        # Veškerý stav parsování jde do nového kontextu bez GUI, takže jedna instance
+        # může parsovat ve více vláknech a zobrazená data se mění až po dokončení
+        context = type(self)(headless=True, parse_filter=self.parse_filter)
+        segments = context.segment_parser()
+        next(segments)
+        for line in content.strip().split("'"):
+            segments.send(line)
+        try:
+            segments.send(None)
+        except StopIteration:
+            pass
+        self.adopt(context)
+
+    def adopt(self, context):
+        """Převezme stav parsování z dokončeného kontextového parseru.
+
+        Atributy se nahrazují postupně, ale pod zámkem stavu: parsování na jedné
+        instanci se střídají a čtenář v jiném vlákně dostane ucelený stav jen
+        přes snapshot()."""
+        with self._state_lock:
+            for name in self.PARSE_STATE:
+                setattr(self, name, getattr(context, name))
+    
+    def snapshot(self):
+        """Parser bez GUI se stejným stavem parsování, převzatým celý pod zámkem stavu"""
+        snapshot = type(self)(headless=True)
+        with self._state_lock:
+            for name in self.PARSE_STATE:
+                setattr(snapshot, name, getattr(self, name))
+        return snapshot
+    
+    def preview(self, content):
+        """Jen data hlavičky a partnerů.
+
+        Čtení segmentů končí u prvního LIN nebo UNS, takže `content` stačí jako
+        začátek souboru (viz edi_parser_preview.read_head)."""
+        context = type(self)(headless=True)
+        segments = context.segment_parser()
+        next(segments)
+        for line in content.split("'"):
+            if line.lstrip()[:3] in ('LIN', 'UNS'):
+                break
+            segments.send(line)
+        # Bez závěrečného None generátor nedojde k závěrečným krokům
+        segments.close()
+        return context.header_info, context.partner_info
+    
+    def segment_parser(self):
+        """Generátor, kterému se posílají segmenty jeden po druhém (None = konec vstupu).
         
+        Veškerý stav (hlavička, kontext LIN, rozpracovaná dodávka) žije v něm,
+        takže parsování lze kdykoli přerušit a pokračovat dalšími segmenty."""
         # Reset dat
         self.header_info = {}
         self.partner_info = {}
         self.delivery_schedules = []
+        self.line_items = []
+        # Index číslo položky -> pozice jejích dodávek v delivery_schedules
+        self.part_index = {}
+        # Matice položka × týden, plní se současně s dodávkami
+        self.forecast_pivot = ForecastPivot()
+        # Obálka se kontroluje ve stejném průchodu, jen čítači a referencemi
+        envelope = EnvelopeValidator()
         
-        current_delivery = {}
+        # Data se opakují na mnoha řádcích, každé se převádí jen jednou
+        parsed_dates = {}
         
-        for line in lines:
+        current_delivery = {}
+        # Kontext aktuální skupiny LIN (položka, kód produktu, lokace, objednávka)
+        current_context = {}
+        current_line_item = None
+        parse_filter = self.parse_filter
+        # Aktuální skupina LIN patří položce, kterou filtr vyřazuje
+        skip_group = False
+        
+        def add_delivery():
+            """Uloží rozpracovanou dodávku, pokud má datum i množství"""
+            if 'Datum od' not in current_delivery or 'Množství' not in current_delivery:
+                return
+            # Kumulativní řádky se filtrují až po netování, které potřebuje celou řadu
+            if (parse_filter is not None and current_delivery.get('Typ') != 'Kumulativní'
+                    and not parse_filter.line_wanted(current_delivery.get('SCC', ''), current_delivery['Datum od'])):
+                return
+            # Jednotka, SCC, typ, položka, data... se opakují, dodávky sdílí jeden objekt na hodnotu
+            delivery = {key: sys.intern(value) for key, value in current_delivery.items()}
+            for key, value in current_context.items():
+                delivery[key] = sys.intern(value)
+            part_number = delivery.get('Položka', '')
+            self.part_index.setdefault(part_number, []).append(len(self.delivery_schedules))
+            self.delivery_schedules.append(delivery)
+            if current_line_item is not None:
+                current_line_item['Počet dodávek'] += 1
+        
+        line_items_by_part = {}
+        
+        def get_line_item(part_number):
+            """Vrátí položku podle čísla, při prvním výskytu ji založí"""
+            line_item = line_items_by_part.get(part_number)
+            if line_item is None:
+                line_item = {
+                    'Položka': part_number,
+                    'Kód produktu': '',
+                    'Lokace': '',
+                    'Objednávka': '',
+                    'Počet dodávek': 0,
+                    'Množství': 0,
+                }
+                line_items_by_part[part_number] = line_item
+                self.line_items.append(line_item)
+                self.part_index.setdefault(part_number, [])
+            return line_item
+        
+        while True:
+            line = yield
+            # None = konec vstupu
+            if line is None:
+                break
             line = line.strip()
             if not line:
                 continue
+            envelope.feed(line)
+            if skip_group and line.startswith(self.LIN_GROUP_TAGS):
+                continue
                 
             # UNB - Interchange header
             if line.startswith('UNB'):
@@ -165,6 +355,10 @@ class EDIDelforParser:
                     self.header_info['Příjemce_kód'] = parts[3]
                     self.header_info['Datum/Čas'] = self.parse_edi_datetime(parts[4])
                     
+            # UNH - Message header, typ zprávy (DELFOR, DELJIT, DESADV)
+            elif line.startswith('UNH'):
+                self.header_info['Typ zprávy'] = message_type(line) or 'DELFOR'
+
             # BGM - Beginning of message
             elif line.startswith('BGM'):
                 parts = line.split('+')
@@ -177,13 +371,19 @@ class EDIDelforParser:
                 if len(parts) >= 2:
                     dtm_parts = parts[1].split(':')
                     if len(dtm_parts) >= 3:
-                        date_formatted = self.parse_date(dtm_parts[1], dtm_parts[2])
+                        date_key = (dtm_parts[1], dtm_parts[2])
+                        date_formatted = parsed_dates.get(date_key)
+                        if date_formatted is None:
+                            date_formatted = parsed_dates[date_key] = self.parse_date(*date_key)
                         if dtm_parts[0] == '137':
                             self.header_info['Datum dokumentu'] = date_formatted
                         elif dtm_parts[0] == '63':
                             current_delivery['Datum do'] = date_formatted
                         elif dtm_parts[0] == '64':
                             current_delivery['Datum od'] = date_formatted
+                        elif dtm_parts[0] == '51':
+                            # Počátek kumulace, od něj se kumulativní množství počítají znovu
+                            current_context['Kumulace od'] = date_formatted
                             
             # NAD - Name and address
             elif line.startswith('NAD'):
@@ -228,22 +428,54 @@ class EDIDelforParser:
                         else:
                             self.partner_info['Dodací adresa'] = name
                         
-            # LIN - Line item
+            # LIN - Line item, začíná novou skupinu dodávek
             elif line.startswith('LIN'):
                 parts = line.split('+')
                 if len(parts) >= 4:
-                    self.header_info['Číslo položky'] = parts[3]
+                    add_delivery()
+                    current_delivery = {}
+                    part_number = parts[3].split(':')[0]
+                    skip_group = parse_filter is not None and not parse_filter.part_wanted(part_number)
+                    if skip_group:
+                        current_context = {}
+                        current_line_item = None
+                    else:
+                        current_context = {'Položka': part_number}
+                        current_line_item = get_line_item(part_number)
                     
             # PIA - Product identification
             elif line.startswith('PIA'):
                 parts = line.split('+')
                 if len(parts) >= 3:
-                    self.header_info['Kód produktu'] = parts[2]
+                    product_code = parts[2].split(':')[0]
+                    current_context['Kód produktu'] = product_code
+                    if current_line_item is not None and not current_line_item['Kód produktu']:
+                        current_line_item['Kód produktu'] = product_code
+                    
+            # LOC - Místo dodání (11), případně další lokace
+            elif line.startswith('LOC'):
+                parts = line.split('+')
+                if len(parts) >= 3 and (parts[1] == '11' or 'Lokace' not in current_context):
+                    current_context['Lokace'] = parts[2].split(':')[0]
+                    if current_line_item is not None and not current_line_item['Lokace']:
+                        current_line_item['Lokace'] = current_context['Lokace']
+                    
+            # RFF+ON - Číslo objednávky, platí pro následující množství
+            elif line.startswith('RFF'):
+                parts = line.split('+')
+                if len(parts) >= 2:
+                    ref_parts = parts[1].split(':')
+                    if len(ref_parts) >= 2 and ref_parts[0] == 'ON':
+                        current_context['Objednávka'] = ref_parts[1]
+                        if current_line_item is not None and not current_line_item['Objednávka']:
+                            current_line_item['Objednávka'] = ref_parts[1]
                     
-            # QTY - Quantity
+            # QTY - Quantity, začíná novou dodávku (QTY, SCC, DTM)
             elif line.startswith('QTY'):
                 parts = line.split('+')
                 if len(parts) >= 2:
+                    add_delivery()
+                    current_delivery = {}
                     qty_parts = parts[1].split(':')
                     if len(qty_parts) >= 3:
                         qty_type = qty_parts[0]
@@ -262,6 +494,9 @@ class EDIDelforParser:
                             current_delivery['Množství'] = quantity
                             current_delivery['Jednotka'] = unit
                             current_delivery['Typ'] = 'Maximální'
+                        # Řádek nežádaného typu množství se zahodí dřív, než se načte jeho SCC a data
+                        if parse_filter is not None and not parse_filter.type_wanted(current_delivery.get('Typ'), qty_type):
+                            current_delivery = {}
                             
             # SCC - Scheduling conditions
             elif line.startswith('SCC'):
@@ -269,10 +504,62 @@ class EDIDelforParser:
                 if len(parts) >= 2:
                     current_delivery['SCC'] = parts[1]
                     
-                    # Pokud máme kompletní dodávku, přidáme ji
-                    if 'Datum od' in current_delivery and 'Množství' in current_delivery:
-                        self.delivery_schedules.append(current_delivery.copy())
-                        current_delivery = {'SCC': parts[1]}  # Zachováme SCC pro další dodávky
+            # UNS/UNT - Konec části s položkami, resp. konec zprávy
+            elif line.startswith('UNS') or line.startswith('UNT'):
+                add_delivery()
+                current_delivery = {}
+                current_context = {}
+                current_line_item = None
+                skip_group = False
+        
+        # Poslední dodávka souboru
+        add_delivery()
+        self.apply_netting()
+        self.envelope_report = envelope.finish()
+        
+        # U souboru s jedinou položkou ji necháme i v hlavičce
+        if len(self.line_items) == 1:
+            self.header_info['Číslo položky'] = self.line_items[0]['Položka']
+            if self.line_items[0]['Kód produktu']:
+                self.header_info['Kód produktu'] = self.line_items[0]['Kód produktu']
+    
+    def apply_netting(self):
+        """Převede kumulativní množství (QTY+113) na čistou poptávku za období
+        a z ní přepočítá součty položek a matici položka × týden"""
+        apply_net_quantities(self.delivery_schedules, 'Datum od')
+        # S filtrem se vyřazené kumulativní řádky zahodí až teď a index i počty dodávek se přepočítají
+        filtered = self.parse_filter is not None and not self.parse_filter.defer_netted
+        if filtered:
+            self.delivery_schedules = self.parse_filter.drop_netted(self.delivery_schedules, 'Datum od')
+            self.part_index = {item['Položka']: [] for item in self.line_items}
+        
+        line_items_by_part = {item['Položka']: item for item in self.line_items}
+        for line_item in self.line_items:
+            line_item['Množství'] = 0
+            if filtered:
+                line_item['Počet dodávek'] = 0
+        self.forecast_pivot = ForecastPivot()
+        for position, delivery in enumerate(self.delivery_schedules):
+            part_number = delivery.get('Položka', '')
+            if filtered:
+                self.part_index.setdefault(part_number, []).append(position)
+                if part_number in line_items_by_part:
+                    line_items_by_part[part_number]['Počet dodávek'] += 1
+            if part_number in line_items_by_part:
+                line_items_by_part[part_number]['Množství'] += delivery['Čisté množství']
+            # Minimální/maximální množství nejsou poptávka do matice
+            if delivery.get('Typ') not in ('Minimální', 'Maximální'):
+                self.forecast_pivot.add(part_number, delivery['Datum od'],
+                                        self.get_scc_description(delivery.get('SCC', '')),
+                                        delivery['Čisté množství'])
+    
+    def get_part_deliveries(self, part_number):
+        """Vrátí dodávky jedné položky přes index, bez procházení celého plánu"""
+        return [self.delivery_schedules[i] for i in self.part_index.get(part_number, [])]
+    
+    def parse_file(self, filepath):
+        """Načte a naparsuje EDI soubor bez zobrazení, chyby propouští volajícímu"""
+        self.parse_edi_file(read_edi_file(filepath))
     
     def load_file(self, filepath):
         """Načte EDI soubor"""
@@ -281,10 +568,7 @@ class EDIDelforParser:
             if not hasattr(self, 'root') or not self.root.winfo_exists():
                 return False
                 
-            with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-                content = f.read()
-                
-            self.parse_edi_file(content)
+            self.parse_file(filepath)
             
             # Check again before updating UI
             if hasattr(self, 'root') and self.root.winfo_exists():
@@ -325,29 +609,32 @@ class EDIDelforParser:
         for key, value in self.partner_info.items():
             info_content += f"{key}: {value}\n"
         
+        if len(self.line_items) > 1:
+            info_content += f"\n=== POLOŽKY ({len(self.line_items)}) ===\n"
+            for line_item in self.line_items:
+                info_content += (f"{line_item['Položka']}: kód {line_item['Kód produktu']}, "
+                                 f"lokace {line_item['Lokace']}, objednávka {line_item['Objednávka']}\n")
+        
+        # Kontrola obálky (UNB/UNZ, UNH/UNT) z průchodu parserem
+        if self.envelope_report:
+            info_content += "\n=== KONTROLA OBÁLKY ===\n"
+            info_content += "\n".join(self.envelope_report['Chyby']) if self.envelope_report['Chyby'] else "OK"
+            info_content += "\n"
         self.info_text.insert(1.0, info_content)
         
         # Plán dodávek
-        for item in self.delivery_tree.get_children():
-            self.delivery_tree.delete(item)
-            
-        for delivery in self.delivery_schedules:
-            scc_code = delivery.get('SCC', '')
-            scc_desc = self.get_scc_description(scc_code)
-            self.delivery_tree.insert('', tk.END, values=(
-                delivery.get('Datum od', ''),
-                delivery.get('Datum do', ''),
-                delivery.get('Množství', ''),
-                delivery.get('Typ', ''),
-                scc_desc
-            ))
+        self.part_combo.configure(values=(self.ALL_PARTS,) + tuple(item['Položka'] for item in self.line_items))
+        self.part_var.set(self.ALL_PARTS)
+        self.build_delivery_table()
+        self.show_deliveries()
         
         # Statistiky
         self.stats_text.delete(1.0, tk.END)
         stats_content = "=== STATISTIKY ===\n"
         stats_content += f"Celkový počet dodávek: {len(self.delivery_schedules)}\n"
         
-        total_qty = sum(int(d.get('Množství', 0)) for d in self.delivery_schedules if d.get('Množství', '').isdigit())
+        # Čistá poptávka - kumulativní množství jsou převedena na množství za období
+        total_qty = sum(d.get('Čisté množství', 0) for d in self.delivery_schedules)
         stats_content += f"Celkové množství: {total_qty:,} kusů\n"
         
         # Statistiky podle typu
@@ -357,14 +644,99 @@ class EDIDelforParser:
             if delivery_type not in type_stats:
                 type_stats[delivery_type] = {'počet': 0, 'množství': 0}
             type_stats[delivery_type]['počet'] += 1
-            if delivery.get('Množství', '').isdigit():
-                type_stats[delivery_type]['množství'] += int(delivery.get('Množství', 0))
+            type_stats[delivery_type]['množství'] += delivery.get('Čisté množství', 0)
         
         stats_content += "\n=== STATISTIKY PODLE TYPU ===\n"
         for delivery_type, stats in type_stats.items():
             stats_content += f"{delivery_type}: {stats['počet']} dodávek, {stats['množství']:,} kusů\n"
         
+        # Součty položek se počítají už při parsování
+        if len(self.line_items) > 1:
+            stats_content += "\n=== STATISTIKY PODLE POLOŽEK ===\n"
+            for line_item in self.line_items:
+                stats_content += (f"{line_item['Položka']}: {line_item['Počet dodávek']} dodávek, "
+                                  f"{line_item['Množství']:,} kusů\n")
+        
         self.stats_text.insert(1.0, stats_content)
+        self.prerender.start(*self.export_job())
+    
+    def get_selected_part(self):
+        """Vrátí vybranou položku, nebo None pro všechny"""
+        part_number = self.part_var.get() if hasattr(self, 'part_var') else self.ALL_PARTS
+        return None if part_number == self.ALL_PARTS else part_number
+    
+    def build_delivery_table(self):
+        """Připraví řazení a filtry pro nově načtená data a naplní výběry filtrů"""
+        self.delivery_table = DeliveryTable(self.delivery_schedules, date_columns=('Datum od', 'Datum do'),
+                                            number_columns=('Množství', 'Čisté množství'))
+        self.sort_column = None
+        self.sort_descending = False
+        self.update_sort_headings()
+        
+        self.type_combo.configure(values=(self.ALL_TYPES,) + tuple(self.delivery_table.distinct('Typ')))
+        self.type_var.set(self.ALL_TYPES)
+        # SCC se zobrazuje popisem, filtruje se podle kódu
+        self.scc_codes = {self.get_scc_description(code): code for code in self.delivery_table.distinct('SCC')}
+        self.scc_combo.configure(values=(self.ALL_SCC,) + tuple(self.scc_codes))
+        self.scc_var.set(self.ALL_SCC)
+        self.date_from_var.set('')
+        self.date_to_var.set('')
+    
+    def sort_deliveries(self, column):
+        """Seřadí tabulku podle sloupce, opakované kliknutí obrátí směr"""
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self.update_sort_headings()
+        self.show_deliveries()
+    
+    def update_sort_headings(self):
+        for col in self.delivery_tree['columns']:
+            arrow = (' ▼' if self.sort_descending else ' ▲') if col == self.sort_column else ''
+            self.delivery_tree.heading(col, text=col + arrow)
+    
+    def get_filtered_deliveries(self):
+        """Dodávky podle výběru položky, rychlých filtrů a řazení"""
+        if self.delivery_table is None or self.delivery_table.deliveries is not self.delivery_schedules:
+            self.build_delivery_table()
+        
+        part_number = self.get_selected_part()
+        values = {}
+        if self.type_var.get() != self.ALL_TYPES:
+            values['Typ'] = {self.type_var.get()}
+        if self.scc_var.get() != self.ALL_SCC:
+            values['SCC'] = {self.scc_codes.get(self.scc_var.get(), '')}
+        return self.delivery_table.rows(
+            self.sort_column, self.sort_descending,
+            within=self.part_index.get(part_number, []) if part_number else None,
+            values=values, date_column='Datum od',
+            date_from=self.date_from_var.get().strip(), date_to=self.date_to_var.get().strip())
+    
+    def show_deliveries(self):
+        """Naplní tabulku dodávek (všech, nebo jen vybrané položky) podle filtrů a řazení"""
+        try:
+            deliveries = self.get_filtered_deliveries()
+        except ValueError as e:
+            # Nečitelné datum ve filtru, tabulka zůstane beze změny
+            messagebox.showwarning("Upozornění", str(e))
+            return
+        for item in self.delivery_tree.get_children():
+            self.delivery_tree.delete(item)
+        
+        for delivery in deliveries:
+            scc_code = delivery.get('SCC', '')
+            scc_desc = self.get_scc_description(scc_code)
+            self.delivery_tree.insert('', tk.END, values=(
+                delivery.get('Položka', ''),
+                delivery.get('Datum od', ''),
+                delivery.get('Datum do', ''),
+                delivery.get('Množství', ''),
+                delivery.get('Čisté množství', ''),
+                delivery.get('Typ', ''),
+                scc_desc
+            ))
     
     def get_week_number(self, date_str):
         """Převede řetězec s datem na číslo kalendářního týdne (WW)"""
@@ -375,74 +747,75 @@ class EDIDelforParser:
         except (ValueError, AttributeError):
             return ""
 
+    def build_workbook(self, part_number=None, include_pivot=False):
+        """Sestaví sešit s dodávkami a kalendářními týdny (bez ukládání), případně jen pro jednu položku"""
+        deliveries = self.get_part_deliveries(part_number) if part_number else self.delivery_schedules
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Dodávky"
+
+        headers = ["Týden", "Položka", "Datum od", "Datum do", "Množství", "Čisté množství", "Typ", "SCC"]
+
+        # Řádky dat; šířky sloupců se měří už při zápisu
+        def rows():
+            for delivery in deliveries:
+                date_from = delivery.get('Datum od', '')
+                week_num = self.get_week_number(date_from) if date_from else ""
+                yield [week_num, delivery.get('Položka', ''), date_from, delivery.get('Datum do', ''),
+                       delivery.get('Množství', ''), delivery.get('Čisté množství', ''), delivery.get('Typ', ''),
+                       self.get_scc_description(delivery.get('SCC', ''))]
+
+        write_rows(ws, headers, rows())
+
+        # List s maticí položka × týden z indexu sestaveného při parsování
+        if include_pivot and self.forecast_pivot:
+            self.forecast_pivot.write_sheet(wb, part_numbers=[part_number] if part_number else None)
+
+        return wb
+
     def export_to_excel(self):
         """Exportuje data o dodávkách do Excelu s kalendářními týdny"""
         if not self.delivery_schedules:
             messagebox.showwarning("Upozornění", "Žádná data k exportu")
             return
 
-        try:
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Dodávky"
+        # Exportuje se to, co je zobrazené - všechny položky, nebo jen vybraná.
+        # Sešit se mezitím dál sestavuje na pozadí, dialog na něj nečeká.
+        part_number = self.get_selected_part()
+        key, build = self.export_job()
+        self.prerender.start(key, build)
 
-            # Hlavičky
-            headers = ["Týden", "Datum od", "Datum do", "Množství", "Typ", "SCC"]
-            for col_num, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col_num, value=header)
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-
-            # Data
-            row_num = 2
-            for delivery in self.delivery_schedules:
-                date_from = delivery.get('Datum od', '')
-                week_num = self.get_week_number(date_from) if date_from else ""
-                scc_code = delivery.get('SCC', '')
-                scc_desc = self.get_scc_description(scc_code)
-                
-                ws.cell(row=row_num, column=1, value=week_num)
-                ws.cell(row=row_num, column=2, value=date_from)
-                ws.cell(row=row_num, column=3, value=delivery.get('Datum do', ''))
-                ws.cell(row=row_num, column=4, value=delivery.get('Množství', ''))
-                ws.cell(row=row_num, column=5, value=delivery.get('Typ', ''))
-                ws.cell(row=row_num, column=6, value=scc_desc)
-                row_num += 1
-
-            # Automatické přizpůsobení šířky sloupců
-            for column in ws.columns:
-                max_length = 0
-                column_letter = get_column_letter(column[0].column)
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)
-                ws.column_dimensions[column_letter].width = min(adjusted_width, 30)
-
-            # Uložení souboru
-            filename = f"dodavky_minebea_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            filepath = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
-                initialfile=filename
-            )
-            
-            if filepath:
-                wb.save(filepath)
-                messagebox.showinfo("Hotovo", f"Data byla úspěšně exportována do souboru:\n{filepath}")
+        part_suffix = f"_{part_number}" if part_number else ""
+        filename = f"dodavky_minebea{part_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
+            initialfile=filename
+        )
+        if filepath:
+            self.prerender.save(
+                self.root, key, build, filepath,
+                on_saved=lambda path: messagebox.showinfo(
+                    "Hotovo", f"Data byla úspěšně exportována do souboru:\n{path}"),
+                on_error=lambda e: messagebox.showerror("Chyba", f"Chyba při exportu do Excelu: {str(e)}"))
 
-        except Exception as e:
-            messagebox.showerror("Chyba", f"Chyba při exportu do Excelu: {str(e)}")
+    def export_job(self):
+        """(klíč, sestavení) exportu s právě zobrazenými volbami"""
+        part_number = self.get_selected_part()
+        include_pivot = self.pivot_var.get()
+        # Sestavení běží ve vlákně předběžného exportu, nad uceleným stavem
+        snapshot = self.snapshot()
+        key = (id(snapshot.delivery_schedules), part_number, include_pivot)
+        return key, lambda: snapshot.build_workbook(part_number, include_pivot=include_pivot)
 
     def on_closing(self):
         """Handle window close event"""
+        self.prerender.shutdown()
         self.root.destroy()  # Close the current window
         
     def back_to_main(self):
         """Closes the current window"""
+        self.prerender.shutdown()
         self.root.destroy()
     
     def run(self):
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+import numpy as np
+
+
+def date_sort_value(date_str):
+    """'DD.MM.YYYY[ ...]' or 'YYYYMMDD[...]' as a sortable YYYYMMDD integer, None if unparsable"""
+    try:
+        if '.' in date_str:
+            return int(date_str[6:10] + date_str[3:5] + date_str[0:2])
+        return int(date_str[0:8])
+    except (ValueError, TypeError):
+        return None
+
+
+def date_bound(date_str):
+    """Strictly read 'DD.MM.YYYY' or 'YYYYMMDD' (a time after a space is ignored) as
+    the YYYYMMDD integer date_sort_value gives; raises ValueError if it is not a date"""
+    day = date_str.strip().split(' ')[0]
+    for fmt in ('%d.%m.%Y', '%Y%m%d'):
+        try:
+            return int(datetime.strptime(day, fmt).strftime('%Y%m%d'))
+        except ValueError:
+            continue
+    raise ValueError(f"Neplatné datum: {date_str}")
+
+
+def net_cumulative(group_keys, dates, quantities):
+    """Per-period net demand from cumulative quantities.
+
+    All three arguments are equally long integer arrays; every group key is one
+    cumulative series (a part, split at its cumulative start dates). Each series
+    is sorted by date and differenced; its first value is taken as is. A series
+    that goes down is not cumulative at all and keeps its reported quantities.
+    Returns (net, is_cumulative) in the input order."""
+    count = len(quantities)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+
+    order = np.lexsort((dates, group_keys))
+    keys = group_keys[order]
+    cumulative = quantities[order]
+
+    starts = np.empty(count, dtype=bool)
+    starts[0] = True
+    starts[1:] = keys[1:] != keys[:-1]
+
+    net_sorted = np.empty_like(cumulative)
+    net_sorted[0] = cumulative[0]
+    np.subtract(cumulative[1:], cumulative[:-1], out=net_sorted[1:])
+    net_sorted[starts] = cumulative[starts]
+
+    # A negative difference anywhere in a series disqualifies the whole series
+    series = np.cumsum(starts) - 1
+    decreasing = np.zeros(series[-1] + 1, dtype=bool)
+    decreasing[series[net_sorted < 0]] = True
+    not_cumulative = decreasing[series]
+    net_sorted[not_cumulative] = cumulative[not_cumulative]
+
+    net = np.empty_like(net_sorted)
+    net[order] = net_sorted
+    is_cumulative = np.empty(count, dtype=bool)
+    is_cumulative[order] = ~not_cumulative
+    return net, is_cumulative
+
+
+def apply_net_quantities(deliveries, date_key, cumulative_type='Kumulativní'):
+    """Store 'Čisté množství' (net demand) in every delivery.
+
+    Deliveries of `cumulative_type` are netted per part and cumulative start
+    date ('Kumulace od'); all others keep their quantity."""
+    positions = []
+    group_keys = []
+    dates = []
+    quantities = []
+    groups = {}
+    for position, delivery in enumerate(deliveries):
+        quantity = delivery.get('Množství', '')
+        quantity = int(quantity) if quantity.isdigit() else 0
+        delivery['Čisté množství'] = quantity
+        if delivery.get('Typ') != cumulative_type:
+            continue
+        date_value = date_sort_value(delivery.get(date_key, ''))
+        if date_value is None:
+            continue
+        group = (delivery.get('Položka', ''), delivery.get('Kumulace od', ''))
+        positions.append(position)
+        group_keys.append(groups.setdefault(group, len(groups)))
+        dates.append(date_value)
+        quantities.append(quantity)
+
+    if not positions:
+        return
+    net, _ = net_cumulative(np.array(group_keys, dtype=np.int64), np.array(dates, dtype=np.int64),
+                            np.array(quantities, dtype=np.int64))
+    for position, quantity in zip(positions, net.tolist()):
+        deliveries[position]['Čisté množství'] = quantity
@@ -0,0 +1,209 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from edi_parser_charset import decode_edi, detect_encoding
+from edi_parser_columnar import ColumnarDeliveries
+from edi_parser_envelope import validate_envelope_bytes
+from edi_parser_index import CARRIED_SEGMENTS, SegmentIndex, read_ranges
+from edi_parser_main import PARSER_CLASSES, detect_file_type, parse_content
+from edi_parser_messages import message_type
+
+# Start of the segments that delimit messages and LIN groups (segments end with ')
+SEGMENT_BOUNDARY = re.compile(rb"(?:^|')\s*(UNH|LIN|UNS|UNT)\+")
+
+# Position indexes (key -> positions in delivery_schedules) that the parsers may keep
+POSITION_INDEXES = ('part_index', 'release_index', 'scc_index')
+
+# Below this size the sequential parse is faster than starting the workers
+MIN_PARALLEL_BYTES = 1024 * 1024
+
+
+def scan_boundaries(data):
+    """Cheap scan for UNH/UNT and LIN boundaries in the raw bytes.
+
+    Returns the interchange prefix range (UNA/UNB up to the first UNH) and for
+    every message its header range (UNH up to the first LIN) and the list of
+    LIN group ranges. A LIN group ends at the next LIN, UNS or UNT."""
+    messages = []
+    message = None
+    group_start = None
+    for match in SEGMENT_BOUNDARY.finditer(data):
+        tag = match.group(1)
+        pos = match.start(1)
+        if tag == b'UNH':
+            message = {'start': pos, 'header': None, 'groups': []}
+            messages.append(message)
+            group_start = None
+        elif message is None:
+            continue
+        elif tag == b'LIN':
+            if group_start is None:
+                message['header'] = (message['start'], pos)
+            else:
+                message['groups'].append((group_start, pos))
+            group_start = pos
+        else:
+            # UNS/UNT closes the running LIN group
+            if group_start is not None:
+                message['groups'].append((group_start, pos))
+                group_start = None
+            if tag == b'UNT' and message['header'] is None:
+                message['header'] = (message['start'], pos)
+    # Truncated file without UNT
+    if message is not None:
+        if group_start is not None:
+            message['groups'].append((group_start, len(data)))
+        if message['header'] is None:
+            message['header'] = (message['start'], len(data))
+
+    prefix = (0, messages[0]['start'] if messages else len(data))
+    return prefix, messages
+
+
+def plan_chunks(prefix, messages, chunk_count):
+    """Split the LIN groups into about `chunk_count` jobs, each a list of byte ranges.
+
+    Every job starts with the interchange prefix and the header of its message,
+    so the partner parser sees the same UNB/BGM/NAD context as in a full parse.
+    State carried over between LIN groups is not part of it, see chunks_self_contained."""
+    total_groups = sum(len(message['groups']) for message in messages)
+    groups_per_chunk = max(1, -(-total_groups // max(1, chunk_count)))
+    chunks = []
+    for message in messages:
+        context = [prefix, message['header']]
+        groups = message['groups']
+        if not groups:
+            chunks.append(context)
+            continue
+        for i in range(0, len(groups), groups_per_chunk):
+            batch = groups[i:i + groups_per_chunk]
+            # Consecutive LIN groups are one contiguous range
+            chunks.append(context + [(batch[0][0], batch[-1][1])])
+    return chunks
+
+
+def chunks_self_contained(data, file_type, messages, chunks):
+    """Whether the first LIN group of every chunk sets all the state its partner
+    parser would otherwise carry over from the group before it (CARRIED_SEGMENTS)"""
+    prefixes = CARRIED_SEGMENTS.get(file_type)
+    if not prefixes:
+        return True
+    markers = [re.compile(rb"'\s*" + re.escape(prefix.encode('ascii'))) for prefix in prefixes]
+    group_end = {start: end for message in messages for start, end in message['groups']}
+    # The first group of the file starts from the initial state in a full parse too
+    first_group = min(group_end, default=None)
+    for chunk in chunks:
+        if len(chunk) < 3 or chunk[2][0] == first_group:
+            continue
+        start = chunk[2][0]
+        group = data[start:group_end[start]]
+        if not all(marker.search(group) for marker in markers):
+            return False
+    return True
+
+
+def _parse_ranges(file_type, filepath, ranges, encoding=None, parse_filter=None):
+    """Read the given byte ranges of the file and parse them (runs in a worker process)"""
+    # Every chunk starts with the UNB prefix, but the caller passes the encoding it already found
+    content = read_ranges(filepath, ranges, encoding)
+    parser = PARSER_CLASSES[file_type](headless=True, parse_filter=parse_filter)
+    parser.parse_edi_file(content)
+    result = {
+        'header_info': parser.header_info,
+        'partner_info': parser.partner_info,
+        # Columns pickle as a few buffers instead of one dict per delivery
+        'delivery_schedules': ColumnarDeliveries.from_deliveries(parser.delivery_schedules),
+        'line_items': getattr(parser, 'line_items', []),
+        'forecast_pivot': parser.forecast_pivot,
+    }
+    for name in POSITION_INDEXES:
+        result[name] = getattr(parser, name, None)
+    return result
+
+
+def merge_chunk_results(file_type, results, parse_filter=None):
+    """Merge chunk results in their original order into one headless parser.
+
+    The chunks were parsed with `parse_filter.for_chunk()`; the full filter
+    drops the cumulative lines only after the netting of the merged series."""
+    parser = PARSER_CLASSES[file_type](headless=True, parse_filter=parse_filter)
+    line_items_by_part = {}
+    for result in results:
+        # Later messages overwrite header values, same as in a sequential parse
+        parser.header_info.update(result['header_info'])
+        parser.partner_info.update(result['partner_info'])
+
+        offset = len(parser.delivery_schedules)
+        parser.delivery_schedules.extend(result['delivery_schedules'].to_deliveries())
+        parser.forecast_pivot.merge(result['forecast_pivot'])
+        for name in POSITION_INDEXES:
+            if result[name] is None:
+                continue
+            index = getattr(parser, name)
+            for key, positions in result[name].items():
+                index.setdefault(key, []).extend(p + offset for p in positions)
+
+        for line_item in result['line_items']:
+            known = line_items_by_part.get(line_item['Položka'])
+            if known is None:
+                line_items_by_part[line_item['Položka']] = line_item
+                parser.line_items.append(line_item)
+            elif 'Počet dodávek' in known:
+                known['Počet dodávek'] += line_item['Počet dodávek']
+                known['Množství'] += line_item['Množství']
+
+    # Netting needs whole series, a part can be split over several chunks
+    if hasattr(parser, 'apply_netting'):
+        parser.apply_netting()
+
+    # Parsers with a part index keep the part in the header only for single-part files
+    if hasattr(parser, 'part_index') and len(parser.line_items) != 1:
+        parser.header_info.pop('Číslo položky', None)
+        parser.header_info.pop('Kód produktu', None)
+    return parser
+
+
+def parse_file_parallel(filepath, workers=None, executor=None, min_bytes=MIN_PARALLEL_BYTES, parse_filter=None):
+    """Opt-in parse of one large file split on UNH/LIN boundaries; returns (file_type, parser).
+
+    Small files and files with a single LIN group are parsed sequentially."""
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    # A segment index cached beside the file already knows the boundaries
+    index = SegmentIndex.load_cached(filepath)
+    prefix, messages = index.boundaries() if index is not None else scan_boundaries(data)
+
+    # Partner detection only needs the interchange and the first message header
+    head_end = messages[0]['header'][1] if messages else len(data)
+    encoding = detect_encoding(data)
+    file_type = detect_file_type(filepath, decode_edi(data[:head_end], encoding))
+    if file_type is None:
+        raise ValueError("Nepodporovaný typ souboru")
+
+    group_count = sum(len(message['groups']) for message in messages)
+    workers = workers or os.cpu_count() or 1
+    # DELJIT SEQ and DESADV CPS/PAC segments sit between LIN groups and would land in the wrong chunk
+    delfor = not messages or message_type(decode_edi(data[messages[0]['start']:head_end], encoding)) == 'DELFOR'
+    if len(data) < min_bytes or group_count < 2 or (workers < 2 and executor is None) or not delfor:
+        return parse_content(filepath, decode_edi(data, encoding), parse_filter)
+
+    # A few chunks per worker keeps the pool busy when LIN groups differ in size
+    chunks = plan_chunks(prefix, messages, workers * 4)
+    if not chunks_self_contained(data, file_type, messages, chunks):
+        return parse_content(filepath, decode_edi(data, encoding), parse_filter)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        chunk_filter = parse_filter.for_chunk() if parse_filter is not None else None
+        results = list(executor.map(_parse_ranges, [file_type] * len(chunks),
+                                    [filepath] * len(chunks), chunks, [encoding] * len(chunks),
+                                    [chunk_filter] * len(chunks)))
+    finally:
+        if own_executor:
+            executor.shutdown()
+    parser = merge_chunk_results(file_type, results, parse_filter)
+    # Chunks never see a whole message, so the envelope is checked on the raw bytes
+    parser.envelope_report = validate_envelope_bytes(data)
+    return file_type, parser
@@ -0,0 +1,93 @@
+from datetime import date
+from openpyxl.styles import Font
+
+
+def iso_week_key(date_str):
+    """ISO (year, week) for 'DD.MM.YYYY[ HH:MM:SS]' or 'YYYYMMDD[HHMM]' dates, None if unparsable"""
+    try:
+        if '.' in date_str:
+            day, month, year = int(date_str[0:2]), int(date_str[3:5]), int(date_str[6:10])
+        else:
+            year, month, day = int(date_str[0:4]), int(date_str[4:6]), int(date_str[6:8])
+        iso = date(year, month, day).isocalendar()
+        return iso[0], iso[1]
+    except (ValueError, TypeError):
+        return None
+
+
+class ForecastPivot:
+    """Part x ISO week quantity matrix, filled while parsing.
+
+    Weeks get a column number in order of first appearance and every
+    (part, SCC) row is a plain list indexed by that number, so adding a
+    delivery is O(1) and writing the sheet touches every cell once."""
+
+    def __init__(self):
+        # (iso_year, iso_week) -> column number
+        self.weeks = {}
+        # part -> {scc: [quantity per week column]}, in order of first appearance
+        self.part_rows = {}
+
+    def add(self, part_number, date_str, scc, quantity):
+        if isinstance(quantity, str):
+            if not quantity.isdigit():
+                return
+            quantity = int(quantity)
+        week = iso_week_key(date_str)
+        if week is None:
+            return
+        column = self.weeks.setdefault(week, len(self.weeks))
+        row = self.part_rows.setdefault(part_number, {}).setdefault(scc, [])
+        if len(row) <= column:
+            row.extend([0] * (column + 1 - len(row)))
+        row[column] += quantity
+
+    def merge(self, other):
+        """Add another pivot (e.g. from a parallel chunk) into this one"""
+        remap = [0] * len(other.weeks)
+        for week, column in other.weeks.items():
+            remap[column] = self.weeks.setdefault(week, len(self.weeks))
+        for part_number, scc_rows in other.part_rows.items():
+            own_rows = self.part_rows.setdefault(part_number, {})
+            for scc, values in scc_rows.items():
+                row = own_rows.setdefault(scc, [])
+                if len(row) < len(self.weeks):
+                    row.extend([0] * (len(self.weeks) - len(row)))
+                for column, quantity in enumerate(values):
+                    row[remap[column]] += quantity
+
+    def __bool__(self):
+        return bool(self.part_rows)
+
+    def iter_rows(self, part_numbers=None):
+        """Yield the header row and then one row per (part, SCC) plus a per-part total"""
+        week_order = sorted(self.weeks.items())
+        columns = [column for _, column in week_order]
+        yield ["Položka", "SCC"] + [f"{year}-T{week:02d}" for (year, week), _ in week_order] + ["Celkem"]
+
+        for part_number in (part_numbers or self.part_rows):
+            scc_rows = self.part_rows.get(part_number, {})
+            totals = [0] * len(columns)
+            for scc, row in scc_rows.items():
+                values = [row[c] if c < len(row) else 0 for c in columns]
+                for i, quantity in enumerate(values):
+                    totals[i] += quantity
+                # Empty cells instead of zeros keep the matrix readable
+                yield [part_number, scc] + [q or None for q in values] + [sum(values)]
+            if len(scc_rows) > 1:
+                yield [part_number, "Celkem"] + [q or None for q in totals] + [sum(totals)]
+
+    def write_sheet(self, wb, title="Matice týdnů", part_numbers=None):
+        """Append the matrix (optionally only some parts) to the workbook as a new sheet, row by row"""
+        ws = wb.create_sheet(title)
+        rows = self.iter_rows(part_numbers)
+        ws.append(next(rows))
+        bold = Font(bold=True)
+        for cell in ws[1]:
+            cell.font = bold
+        for row in rows:
+            ws.append(row)
+        ws.freeze_panes = "C2"
+        ws.column_dimensions['A'].width = 20
+        ws.column_dimensions['B'].width = 12
+        return ws
@@ -0,0 +1,169 @@
+import argparse
+import os
+import sys
+import tkinter as tk
+from tkinter import ttk, filedialog
+
+from edi_parser_charset import decode_edi, detect_encoding
+from edi_parser_incremental import DETECT_BYTES, HEADER_END
+from edi_parser_main import PARSER_CLASSES, detect_file_type
+from edi_parser_table import DeliveryTable
+
+# Read size for the header; the UNB..NAD part of a DELFOR is usually a few hundred bytes
+HEAD_BLOCK = 1024
+
+INBOX_COLUMNS = ('Soubor', 'Partner', 'Zpráva', 'Odesílatel', 'Kupující', 'Číslo zprávy', 'Datum dokumentu')
+
+
+def read_head(filepath):
+    """Bytes from the start of the file up to the first LIN/UNS/UNT segment"""
+    head = b''
+    with open(filepath, 'rb') as f:
+        while len(head) < DETECT_BYTES:
+            block = f.read(HEAD_BLOCK)
+            if not block:
+                break
+            head += block
+            # The match starts at the ' that ends the last header segment
+            match = HEADER_END.search(head)
+            if match:
+                return head[:match.start() + 1]
+    return head
+
+
+def preview_file(filepath):
+    """Inbox row of one file from its header only, without parsing any line items"""
+    head = read_head(filepath)
+    content = decode_edi(head, detect_encoding(head))
+    file_type = detect_file_type(filepath, content)
+    if file_type is None:
+        raise ValueError("Nepodporovaný typ souboru")
+    header_info, partner_info = PARSER_CLASSES[file_type](headless=True).preview(content)
+    return {
+        'Soubor': os.path.basename(filepath),
+        'Cesta': filepath,
+        'Partner': file_type,
+        'Zpráva': header_info.get('Typ zprávy', ''),
+        'Odesílatel': header_info.get('Odesílatel', ''),
+        # Minebea/TRWKOB name the buyer (NAD+BY), Cummins the ship-to party (NAD+ST)
+        'Kupující': partner_info.get('Kupující') or partner_info.get('Příjemce') or header_info.get('Příjemce_kód', ''),
+        'Číslo zprávy': header_info.get('Číslo zprávy', ''),
+        'Datum dokumentu': header_info.get('Datum dokumentu', ''),
+    }
+
+
+def scan_inbox(filepaths, on_error=None):
+    """Inbox rows of many files; unreadable or unknown files are reported through `on_error`"""
+    rows = []
+    for filepath in filepaths:
+        try:
+            rows.append(preview_file(filepath))
+        except Exception as e:
+            if on_error:
+                on_error(filepath, e)
+    return rows
+
+
+def list_edi_files(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith('.edi') and os.path.isfile(os.path.join(directory, name)))
+
+
+class InboxWindow:
+    """Sortable list of the files in a folder, built from the headers only.
+    A double click opens the file through `on_open`."""
+
+    def __init__(self, directory=None, on_open=None):
+        self.on_open = on_open
+        self.table = DeliveryTable([], date_columns=('Datum dokumentu',))
+        self.sort_column = 'Datum dokumentu'
+        self.sort_descending = True
+
+        self.root = tk.Tk()
+        self.root.title("EDI přehled souborů")
+        self.root.geometry("1200x600")
+        self.setup_ui()
+        if directory:
+            self.load_directory(directory)
+
+    def setup_ui(self):
+        main_frame = ttk.Frame(self.root)
+        main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        btn_frame = ttk.Frame(main_frame)
+        btn_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Button(btn_frame, text="Vybrat složku", command=self.choose_directory).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="Zavřít", command=self.root.destroy).pack(side=tk.LEFT, padx=(10, 0))
+        self.status_var = tk.StringVar(value="Žádné soubory")
+        ttk.Label(btn_frame, textvariable=self.status_var).pack(side=tk.LEFT, padx=(20, 0))
+
+        tree_frame = ttk.Frame(main_frame)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=INBOX_COLUMNS, show='headings', height=25)
+        for col in INBOX_COLUMNS:
+            self.tree.heading(col, text=col, command=lambda c=col: self.sort_rows(c))
+            self.tree.column(col, width=200 if col == 'Soubor' else 140)
+        v_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=v_scrollbar.set)
+        v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.tree.bind('<Double-1>', self.open_selected)
+
+    def choose_directory(self):
+        directory = filedialog.askdirectory(title="Vyberte složku s EDI soubory")
+        if directory:
+            self.load_directory(directory)
+
+    def load_directory(self, directory):
+        errors = []
+        rows = scan_inbox(list_edi_files(directory),
+                          on_error=lambda filepath, e: errors.append(f"{os.path.basename(filepath)}: {e}"))
+        self.table = DeliveryTable(rows, date_columns=('Datum dokumentu',))
+        self.status_var.set(f"Souborů: {len(rows)}" + (f", nečitelných: {len(errors)}" if errors else ""))
+        self.update_sort_headings()
+        self.show_rows()
+
+    def sort_rows(self, column):
+        """Sort by a column, clicking the same column again reverses the order"""
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self.update_sort_headings()
+        self.show_rows()
+
+    def update_sort_headings(self):
+        for col in INBOX_COLUMNS:
+            arrow = (' ▼' if self.sort_descending else ' ▲') if col == self.sort_column else ''
+            self.tree.heading(col, text=col + arrow)
+
+    def show_rows(self):
+        self.tree.delete(*self.tree.get_children())
+        for position in self.table.view(self.sort_column, self.sort_descending):
+            row = self.table.deliveries[position]
+            self.tree.insert('', tk.END, iid=str(position), values=[row[col] for col in INBOX_COLUMNS])
+
+    def open_selected(self, event=None):
+        selection = self.tree.selection()
+        if selection and self.on_open:
+            self.on_open(self.table.deliveries[int(selection[0])]['Cesta'])
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="edi_parser_main.py inbox",
+        description="Přehled EDI souborů ve složce jen z jejich hlaviček (bez parsování položek).")
+    arg_parser.add_argument("directory", help="Složka s EDI soubory")
+    arg_parser.add_argument("--sort", default='Datum dokumentu', choices=INBOX_COLUMNS, help="Řadit podle sloupce")
+    args = arg_parser.parse_args(argv)
+
+    rows = scan_inbox(list_edi_files(args.directory),
+                      on_error=lambda filepath, e: print(f"CHYBA {os.path.basename(filepath)}: {e}"))
+    table = DeliveryTable(rows, date_columns=('Datum dokumentu',))
+    for row in table.rows(args.sort, descending=args.sort == 'Datum dokumentu'):
+        print(" | ".join(row[col] for col in INBOX_COLUMNS))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
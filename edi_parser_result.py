@@ -0,0 +1,143 @@
+import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+from edi_parser_archive import expand_inputs, is_streamed, parse_input
+from edi_parser_charset import read_edi_file
+from edi_parser_columnar import ColumnarDeliveries
+from edi_parser_main import PARSER_CLASSES, detect_file_type
+
+
+def _freeze(value):
+    """Read-only view of nested dicts/lists; the dicts are wrapped, not copied"""
+    if isinstance(value, dict):
+        if all(isinstance(item, (str, int)) for item in value.values()):
+            return MappingProxyType(value)
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class ParseResult:
+    """Immutable outcome of one parse.
+
+    It is built from a context parser that only the parsing call ever saw, so
+    wrapping its dicts and lists in read-only views is enough: nobody else
+    holds a reference through which they could still change. Results can be
+    handed between threads freely; `to_parser` gives a mutable headless parser
+    (GUI, Excel export) with its own copies, `to_numpy`/`to_dataframe` the
+    deliveries as arrays for analysis."""
+
+    __slots__ = ('file_type', 'filepath', 'header_info', 'partner_info', 'delivery_schedules',
+                 'line_items', 'envelope_report', 'indexes', '_pivot', '_columns')
+
+    # Parse state with its own attribute; the rest of PARSE_STATE are the position indexes
+    FIELDS = ('header_info', 'partner_info', 'delivery_schedules', 'line_items', 'envelope_report')
+
+    def __init__(self, file_type, filepath, parser):
+        # The whole parse state at one moment, even if the parser is adopting another parse
+        parser = parser.snapshot()
+        values = {name: _freeze(getattr(parser, name)) for name in self.FIELDS}
+        values['file_type'] = file_type
+        values['filepath'] = filepath
+        # Part / release / SCC -> positions in delivery_schedules
+        values['indexes'] = MappingProxyType({
+            name: _freeze(getattr(parser, name)) for name in parser.PARSE_STATE
+            if name not in self.FIELDS and name != 'forecast_pivot'})
+        values['_pivot'] = parser.forecast_pivot
+        values['_columns'] = None
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ParseResult je neměnný")
+
+    def __delattr__(self, name):
+        raise AttributeError("ParseResult je neměnný")
+
+    @property
+    def forecast_pivot(self):
+        """Copy of the part x week matrix (the pivot itself is mutable)"""
+        return copy.deepcopy(self._pivot)
+
+    @property
+    def columns(self):
+        """Columnar store of the deliveries, encoded once on first use"""
+        if self._columns is None:
+            object.__setattr__(self, '_columns', ColumnarDeliveries.from_deliveries(self.delivery_schedules))
+        return self._columns
+
+    def to_numpy(self):
+        """Deliveries as a dict of arrays (see ColumnarDeliveries.to_numpy)"""
+        return self.columns.to_numpy()
+
+    def categories(self, name):
+        """Values behind the codes of a categorical column of to_numpy()"""
+        return self.columns.categorical(name)[1]
+
+    def to_dataframe(self):
+        """Deliveries as a pandas DataFrame; needs pandas, which is imported only here"""
+        return self.columns.to_dataframe()
+
+    def to_parser(self):
+        """Mutable headless parser with copies of the data, e.g. for build_workbook"""
+        parser = PARSER_CLASSES[self.file_type](headless=True)
+        for name in self.FIELDS:
+            setattr(parser, name, _thaw(getattr(self, name)))
+        for name, index in self.indexes.items():
+            setattr(parser, name, _thaw(index))
+        parser.forecast_pivot = self.forecast_pivot
+        return parser
+
+
+def parse_result(filepath, content=None, parse_filter=None):
+    """Parse one file (or its already read content) into a ParseResult.
+
+    Every call parses into its own headless context parser and never touches
+    Tk or shared state, so it can run on any number of threads at once.
+    Zip members ("archive.zip!member") and .gz files are streamed from the archive.
+    An optional ParseFilter drops unwanted parts and lines during the parse."""
+    if content is None and is_streamed(filepath):
+        file_type, parser = parse_input(filepath, parse_filter)
+        return ParseResult(file_type, filepath, parser)
+    if content is None:
+        content = read_edi_file(filepath)
+    file_type = detect_file_type(filepath, content)
+    if file_type is None:
+        raise ValueError("Nepodporovaný typ souboru")
+    context = PARSER_CLASSES[file_type](headless=True, parse_filter=parse_filter)
+    context.parse_edi_file(content)
+    return ParseResult(file_type, filepath, context)
+
+
+def _parse_or_error(filepath):
+    try:
+        return filepath, parse_result(filepath), None
+    except Exception as e:
+        return filepath, None, e
+
+
+def parse_files_threaded(filepaths, workers=None, executor=None):
+    """Parse many files on a thread pool; yields (filepath, result, error) in input order.
+
+    Threads avoid pickling the results between processes; the parse itself
+    runs truly in parallel on a free-threaded (no GIL) Python. A zip archive
+    yields one entry per member."""
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+    try:
+        yield from executor.map(_parse_or_error, expand_inputs(filepaths))
+    finally:
+        if own_executor:
+            executor.shutdown()
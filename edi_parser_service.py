@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from edi_parser_charset import decode_edi
+from edi_parser_main import parse_content
+
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    422: 'Unprocessable Entity',
+}
+
+
+def parse_payload(filename, payload):
+    """Decode and parse one EDI payload; runs in a worker process"""
+    started = time.perf_counter()
+    content = decode_edi(payload)
+    file_type, parser = parse_content(filename, content)
+    result = {
+        'type': file_type,
+        'header': parser.header_info,
+        'partners': parser.partner_info,
+        'deliveries': parser.delivery_schedules,
+        'envelope': parser.envelope_report,
+    }
+    if hasattr(parser, 'line_items'):
+        result['line_items'] = parser.line_items
+    result['parse_seconds'] = round(time.perf_counter() - started, 6)
+    return result
+
+
+def _warm_up():
+    """Runs once per worker so the parser modules are imported before the first request"""
+    return os.getpid()
+
+
+class EDIParseService:
+    def __init__(self, host='127.0.0.1', port=8765, workers=None):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = None
+        self.server = None
+        self.started_at = time.monotonic()
+        self.metrics = {
+            'requests': 0,
+            'parsed': 0,
+            'failed': 0,
+            'in_flight': 0,
+            'bytes_in': 0,
+            'deliveries': 0,
+            'parse_seconds': 0.0,
+        }
+
+    async def start(self):
+        """Start the worker pool and the listening socket; returns the bound port"""
+        loop = asyncio.get_running_loop()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        # Start every worker now instead of on the first requests
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _warm_up) for _ in range(self.workers)))
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started_at = time.monotonic()
+        return self.port
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.pool:
+            self.pool.shutdown(wait=True)
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"EDI služba naslouchá na http://{self.host}:{self.port} ({self.workers} procesů)")
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.send_json(writer, 400, {'error': 'Neplatný požadavek'}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.send_json(writer, 400, {'error': 'Neplatná hlavička Content-Length'}, keep_alive=False)
+                    break
+                if length > MAX_BODY_SIZE:
+                    await self.send_json(writer, 413, {'error': 'Soubor je příliš velký'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.dispatch(method, target, body)
+                await self.send_json(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        self.metrics['requests'] += 1
+
+        if url.path == '/health':
+            return 200, {'status': 'ok', 'workers': self.workers}
+        if url.path == '/metrics':
+            return 200, self.snapshot_metrics()
+        if url.path != '/parse':
+            return 404, {'error': 'Neznámá adresa'}
+        if method != 'POST':
+            return 405, {'error': 'Použijte POST'}
+        if not body:
+            return 400, {'error': 'Prázdný EDI soubor'}
+
+        # Filename is only a hint for partner detection, the content decides otherwise
+        filename = parse_qs(url.query).get('filename', [''])[0]
+        loop = asyncio.get_running_loop()
+        self.metrics['in_flight'] += 1
+        self.metrics['bytes_in'] += len(body)
+        try:
+            result = await loop.run_in_executor(self.pool, parse_payload, filename, body)
+        except Exception as e:
+            self.metrics['failed'] += 1
+            return 422, {'error': str(e)}
+        finally:
+            self.metrics['in_flight'] -= 1
+
+        self.metrics['parsed'] += 1
+        self.metrics['deliveries'] += len(result['deliveries'])
+        self.metrics['parse_seconds'] += result['parse_seconds']
+        return 200, result
+
+    def snapshot_metrics(self):
+        uptime = time.monotonic() - self.started_at
+        metrics = dict(self.metrics)
+        metrics['uptime_seconds'] = round(uptime, 3)
+        metrics['parse_seconds'] = round(metrics['parse_seconds'], 6)
+        metrics['files_per_second'] = round(metrics['parsed'] / uptime, 3) if uptime else 0.0
+        metrics['avg_parse_ms'] = (round(1000 * metrics['parse_seconds'] / metrics['parsed'], 3)
+                                   if metrics['parsed'] else 0.0)
+        return metrics
+
+    async def send_json(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="edi_parser_main.py serve",
+        description="Lokální HTTP služba: POST /parse vrací naparsovaný DELFOR jako JSON.")
+    arg_parser.add_argument("--host", default="127.0.0.1", help="Adresa pro naslouchání")
+    arg_parser.add_argument("--port", type=int, default=8765, help="Port (0 = libovolný volný)")
+    arg_parser.add_argument("--workers", type=int, default=None,
+                            help="Počet parsovacích procesů (výchozí: počet jader)")
+    args = arg_parser.parse_args(argv)
+
+    service = EDIParseService(args.host, args.port, args.workers)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
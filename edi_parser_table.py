@@ -0,0 +1,105 @@
+import numpy as np
+
+from edi_parser_netting import date_bound, date_sort_value
+
+# Sort key for a missing or unparsable date / quantity, so such rows go last
+MISSING_KEY = np.iinfo(np.int64).max
+
+
+class DeliveryTable:
+    """Sort and filter view over a delivery list for the delivery tab.
+
+    Every column gets one int64 key array, built the first time the column is
+    sorted or filtered on: dates as YYYYMMDD, quantities as numbers and text as
+    its rank among the distinct values. Sort permutations are cached per
+    (column, direction), so re-sorting or re-filtering is an index operation
+    and display strings are never parsed again."""
+
+    def __init__(self, deliveries, date_columns=(), number_columns=()):
+        self.deliveries = deliveries
+        self.date_columns = set(date_columns)
+        self.number_columns = set(number_columns)
+        self._keys = {}
+        # text column -> sorted distinct values (the key is an index into it)
+        self._distinct = {}
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.deliveries)
+
+    def keys(self, column):
+        keys = self._keys.get(column)
+        if keys is not None:
+            return keys
+        values = [delivery.get(column, '') for delivery in self.deliveries]
+        if column in self.date_columns:
+            keys = np.array([date_sort_value(value) or MISSING_KEY for value in values], dtype=np.int64)
+        elif column in self.number_columns:
+            keys = np.array([value if isinstance(value, int) else int(value) if value.isdigit() else MISSING_KEY
+                             for value in values], dtype=np.int64)
+        else:
+            distinct, keys = np.unique(np.array(values, dtype=object).astype(str), return_inverse=True)
+            self._distinct[column] = distinct.tolist()
+            keys = keys.astype(np.int64)
+        self._keys[column] = keys
+        return keys
+
+    def distinct(self, column):
+        """Sorted distinct values of a text column (for the filter lists)"""
+        self.keys(column)
+        return list(self._distinct.get(column, []))
+
+    def order(self, column, descending=False):
+        """Cached stable permutation that sorts the whole table by `column`"""
+        order = self._orders.get((column, descending))
+        if order is None:
+            keys = self.keys(column)
+            if descending:
+                # Missing values (MISSING_KEY) stay last in this direction too
+                order = np.lexsort((-keys, keys == MISSING_KEY))
+            else:
+                order = np.argsort(keys, kind='stable')
+            self._orders[(column, descending)] = order
+        return order
+
+    def mask(self, within=None, values=None, date_column=None, date_from=None, date_to=None):
+        """Boolean row mask for the quick filters.
+
+        `within` is a position list from one of the parser indexes, `values`
+        maps a text column to the set of allowed values and the date range is
+        inclusive, given as 'DD.MM.YYYY' strings (an empty bound is open). Rows
+        without a readable date never match a date range; a bound that is not
+        a date raises ValueError."""
+        mask = np.ones(len(self.deliveries), dtype=bool)
+        if within is not None:
+            mask[:] = False
+            mask[np.asarray(within, dtype=np.int64)] = True
+        for column, allowed in (values or {}).items():
+            if not allowed:
+                continue
+            keys = self.keys(column)
+            distinct = self._distinct[column]
+            codes = [i for i, value in enumerate(distinct) if value in allowed]
+            mask &= np.isin(keys, codes)
+        if date_column:
+            keys = self.keys(date_column)
+            low = date_bound(date_from) if date_from else None
+            high = date_bound(date_to) if date_to else None
+            if low is not None or high is not None:
+                mask &= keys != MISSING_KEY
+            if low is not None:
+                mask &= keys >= low
+            if high is not None:
+                mask &= keys <= high
+        return mask
+
+    def view(self, sort_column=None, descending=False, **filters):
+        """Positions of the rows to show, filtered and in display order"""
+        mask = self.mask(**filters)
+        if sort_column is None:
+            return np.flatnonzero(mask).tolist()
+        order = self.order(sort_column, descending)
+        return order[mask[order]].tolist()
+
+    def rows(self, sort_column=None, descending=False, **filters):
+        return [self.deliveries[i] for i in self.view(sort_column, descending, **filters)]
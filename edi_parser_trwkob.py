@@ -1,21 +1,60 @@
+import sys
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from datetime import datetime, date
 import os
 import openpyxl
-from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
+from edi_parser_pivot import ForecastPivot
+from edi_parser_netting import apply_net_quantities
+from edi_parser_table import DeliveryTable
+from edi_parser_charset import read_edi_file
+from edi_parser_envelope import EnvelopeValidator
+from edi_parser_export import WorkbookPrerender, write_rows
+from edi_parser_messages import DESPATCH_TYPE, message_type, split_datetime
 
 class EDITrwkobParser:
-    def __init__(self, filepath=None):
-        self.root = tk.Tk()
-        self.root.title("EDI TRWKOB Parser")
-        self.root.geometry("1200x800")
+    ALL_PARTS = 'Všechny položky'
+    ALL_TYPES = 'Všechny typy'
+    ALL_SCC = 'Všechna SCC'
+    # Everything a parse produces; parse_edi_file takes it over from its context in one step
+    PARSE_STATE = ('header_info', 'partner_info', 'delivery_schedules', 'line_items', 'forecast_pivot',
+                   'part_index', 'envelope_report')
+
+    # Segments that only describe the current LIN group; skipped for parts a parse filter excludes
+    LIN_GROUP_TAGS = ('PIA', 'LOC', 'RFF', 'QTY', 'SCC', 'DTM')
+
+    def __init__(self, filepath=None, headless=False, parse_filter=None):
+        # Optional ParseFilter (edi_parser_filter), applied while parsing
+        self.parse_filter = parse_filter
+        # Held while adopt() replaces the PARSE_STATE attributes
+        self._state_lock = threading.Lock()
         self.header_info = {}
         self.partner_info = {}
         self.delivery_schedules = []
-        self.setup_ui()
+        self.line_items = []
+        self.part_index = {}
+        self.forecast_pivot = ForecastPivot()
+        # Envelope check result (segment and message counts, control references)
+        self.envelope_report = {}
+        # Sorting and quick filters of the delivery table
+        self.delivery_table = None
+        self.sort_column = None
+        self.sort_descending = False
+        self.scc_codes = {}
         self.main_window = None
+        # Headless mode (folder watcher, batch runs) never creates a Tk window
+        self.root = None
+        if headless:
+            if filepath:
+                self.parse_file(filepath)
+            return
+        self.root = tk.Tk()
+        self.root.title("EDI TRWKOB Parser")
+        self.root.geometry("1200x800")
+        # The export workbook is built on a worker as soon as the data is shown
+        self.prerender = WorkbookPrerender()
+        self.setup_ui()
 
     def setup_ui(self):
         main_frame = ttk.Frame(self.root)
@@ -24,6 +63,9 @@ class EDITrwkobParser:
         btn_frame.pack(fill=tk.X, pady=(0, 10))
         ttk.Button(btn_frame, text="Export do Excelu", command=self.export_to_excel).pack(side=tk.LEFT)
         ttk.Button(btn_frame, text="Zpět na hlavní okno", command=self.back_to_main).pack(side=tk.LEFT, padx=(10, 0))
+        self.pivot_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(btn_frame, text="Export s maticí položka × týden",
+                        variable=self.pivot_var).pack(side=tk.LEFT, padx=(10, 0))
         self.notebook = ttk.Notebook(main_frame)
         self.notebook.pack(fill=tk.BOTH, expand=True)
         self.info_frame = ttk.Frame(self.notebook)
@@ -46,12 +88,44 @@ class EDITrwkobParser:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
     def setup_delivery_tab(self):
+        # Part selector - the table and the export show one part or all of them
+        filter_frame = ttk.Frame(self.delivery_frame)
+        filter_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
+        ttk.Label(filter_frame, text="Položka:").pack(side=tk.LEFT)
+        self.part_var = tk.StringVar(value=self.ALL_PARTS)
+        self.part_combo = ttk.Combobox(filter_frame, textvariable=self.part_var, state='readonly',
+                                       values=(self.ALL_PARTS,), width=30)
+        self.part_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.part_combo.bind('<<ComboboxSelected>>', lambda event: self.show_deliveries())
+        # Quick filters by type, SCC and date range (Enter applies the dates)
+        ttk.Label(filter_frame, text="Typ:").pack(side=tk.LEFT, padx=(10, 0))
+        self.type_var = tk.StringVar(value=self.ALL_TYPES)
+        self.type_combo = ttk.Combobox(filter_frame, textvariable=self.type_var, state='readonly',
+                                       values=(self.ALL_TYPES,), width=15)
+        self.type_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.type_combo.bind('<<ComboboxSelected>>', lambda event: self.show_deliveries())
+        ttk.Label(filter_frame, text="SCC:").pack(side=tk.LEFT, padx=(10, 0))
+        self.scc_var = tk.StringVar(value=self.ALL_SCC)
+        self.scc_combo = ttk.Combobox(filter_frame, textvariable=self.scc_var, state='readonly',
+                                      values=(self.ALL_SCC,), width=15)
+        self.scc_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.scc_combo.bind('<<ComboboxSelected>>', lambda event: self.show_deliveries())
+        ttk.Label(filter_frame, text="Od:").pack(side=tk.LEFT, padx=(10, 0))
+        self.date_from_var = tk.StringVar()
+        date_from_entry = ttk.Entry(filter_frame, textvariable=self.date_from_var, width=12)
+        date_from_entry.pack(side=tk.LEFT, padx=(5, 0))
+        date_from_entry.bind('<Return>', lambda event: self.show_deliveries())
+        ttk.Label(filter_frame, text="Do:").pack(side=tk.LEFT, padx=(10, 0))
+        self.date_to_var = tk.StringVar()
+        date_to_entry = ttk.Entry(filter_frame, textvariable=self.date_to_var, width=12)
+        date_to_entry.pack(side=tk.LEFT, padx=(5, 0))
+        date_to_entry.bind('<Return>', lambda event: self.show_deliveries())
         tree_frame = ttk.Frame(self.delivery_frame)
         tree_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        columns = ('Datum od', 'Datum do', 'Množství', 'Typ', 'SCC')
+        columns = ('Položka', 'Datum od', 'Datum do', 'Množství', 'Čisté množství', 'Typ', 'SCC')
         self.delivery_tree = ttk.Treeview(tree_frame, columns=columns, show='headings', height=15)
         for col in columns:
-            self.delivery_tree.heading(col, text=col)
+            self.delivery_tree.heading(col, text=col, command=lambda c=col: self.sort_deliveries(c))
             self.delivery_tree.column(col, width=120)
         v_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.delivery_tree.yview)
         h_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.HORIZONTAL, command=self.delivery_tree.xview)
@@ -91,12 +165,14 @@ class EDITrwkobParser:
         except:
             return datetime_str
 
+    def parse_file(self, filepath):
+        """Read and parse the EDI file without touching the UI; errors propagate"""
+        self.parse_edi_file(read_edi_file(filepath))
+
     def load_file(self, filepath):
         """Load and parse the specified EDI file"""
         try:
-            with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-                content = f.read()
-            self.parse_edi_file(content)
+            self.parse_file(filepath)
             self.display_data()
             return True
         except Exception as e:
@@ -104,21 +180,140 @@ class EDITrwkobParser:
             return False
 
     def parse_edi_file(self, content):
-        lines = content.strip().split("'")
+        # All parse state goes into a fresh headless context, so one instance can
+        # parse on several threads and the data it shows is only replaced when complete
+        context = type(self)(headless=True, parse_filter=self.parse_filter)
+        segments = context.segment_parser()
+        next(segments)
+        for line in content.strip().split("'"):
+            segments.send(line)
+        try:
+            segments.send(None)
+        except StopIteration:
+            pass
+        self.adopt(context)
+
+    def adopt(self, context):
+        """Take over the parse state of a finished context parser.
+
+        The attributes are replaced one by one, under the state lock: parses
+        on one instance take turns, and a reader on another thread gets a
+        consistent state only through snapshot()."""
+        with self._state_lock:
+            for name in self.PARSE_STATE:
+                setattr(self, name, getattr(context, name))
+
+    def snapshot(self):
+        """Headless parser sharing the current parse state, taken as a whole under the state lock"""
+        snapshot = type(self)(headless=True)
+        with self._state_lock:
+            for name in self.PARSE_STATE:
+                setattr(snapshot, name, getattr(self, name))
+        return snapshot
+
+    def preview(self, content):
+        """Header and partner data only.
+
+        Tokenizing stops at the first LIN or UNS segment, so `content` only needs
+        to be the start of the file (see edi_parser_preview.read_head)."""
+        context = type(self)(headless=True)
+        segments = context.segment_parser()
+        next(segments)
+        for line in content.split("'"):
+            if line.lstrip()[:3] in ('LIN', 'UNS'):
+                break
+            segments.send(line)
+        # Without the closing None the generator never reaches its final steps
+        segments.close()
+        return context.header_info, context.partner_info
+
+    def segment_parser(self):
+        """Generator fed one segment at a time with send(); None ends the input.
+
+        All parsing state (header, LIN context, pending deliveries) lives in
+        the generator, so parsing can stop at any segment and continue later."""
         self.header_info = {}
         self.partner_info = {}
         self.delivery_schedules = []
+        self.line_items = []
+        # Part number -> positions of its deliveries in delivery_schedules
+        self.part_index = {}
+        # Part x week matrix, filled together with the deliveries
+        self.forecast_pivot = ForecastPivot()
+        # The envelope is checked in the same pass, with counters and references only
+        envelope = EnvelopeValidator()
+        line_items_by_part = {}
+        # Dates repeat on many lines, each one is converted only once
+        parsed_dates = {}
         current_delivery = {}
-        for line in lines:
+        # Context of the current LIN group (part, product code, location, order)
+        current_context = {}
+        current_line_item = None
+        # DELFOR, DELJIT or DESADV, from the UNH of the current message
+        current_message = 'DELFOR'
+        # Context above the LIN groups: DELJIT sequence (SEQ), DESADV packing level (CPS) and packages (PAC)
+        group_context = {}
+        despatch_date = ''
+        parse_filter = self.parse_filter
+        # The current LIN group is of a part the filter excludes
+        skip_group = False
+
+        def add_delivery():
+            # A delivery is complete once it has both a date and a quantity
+            if 'Datum od' not in current_delivery or 'Množství' not in current_delivery:
+                return
+            # Cumulative lines are filtered after the netting, which needs the whole series
+            if (parse_filter is not None and current_delivery.get('Typ') != 'Kumulativní'
+                    and not parse_filter.line_wanted(current_delivery.get('SCC', ''), current_delivery['Datum od'])):
+                return
+            # Unit, SCC, type, part, dates... repeat, so deliveries share one object per value
+            delivery = {key: sys.intern(value) for key, value in current_delivery.items()}
+            for key, value in current_context.items():
+                delivery[key] = sys.intern(value)
+            part_number = delivery.get('Položka', '')
+            self.part_index.setdefault(part_number, []).append(len(self.delivery_schedules))
+            self.delivery_schedules.append(delivery)
+            if current_line_item is not None:
+                current_line_item['Počet dodávek'] += 1
+
+        def get_line_item(part_number):
+            line_item = line_items_by_part.get(part_number)
+            if line_item is None:
+                line_item = {
+                    'Položka': part_number,
+                    'Kód produktu': '',
+                    'Lokace': '',
+                    'Objednávka': '',
+                    'Počet dodávek': 0,
+                    'Množství': 0,
+                }
+                line_items_by_part[part_number] = line_item
+                self.line_items.append(line_item)
+                self.part_index.setdefault(part_number, [])
+            return line_item
+
+        while True:
+            line = yield
+            # None marks the end of the input
+            if line is None:
+                break
             line = line.strip()
             if not line:
                 continue
+            envelope.feed(line)
+            if skip_group and line.startswith(self.LIN_GROUP_TAGS):
+                continue
             if line.startswith('UNB'):
                 parts = line.split('+')
                 if len(parts) >= 5:
                     self.header_info['Odesílatel'] = parts[2]
                     self.header_info['Příjemce_kód'] = parts[3]
                     self.header_info['Datum/Čas'] = self.parse_edi_datetime(parts[4])
+            elif line.startswith('UNH'):
+                current_message = message_type(line) or 'DELFOR'
+                self.header_info['Typ zprávy'] = current_message
+                group_context = {}
+                despatch_date = ''
             elif line.startswith('BGM'):
                 parts = line.split('+')
                 if len(parts) >= 3:
@@ -128,13 +323,32 @@ class EDITrwkobParser:
                 if len(parts) >= 2:
                     dtm_parts = parts[1].split(':')
                     if len(dtm_parts) >= 2:
-                        date_formatted = self.parse_date(dtm_parts[1], dtm_parts[2] if len(dtm_parts) > 2 else '')
+                        # JIT call-offs are timed (format 203), the time is kept apart from the date
+                        value, fmt, delivery_time = split_datetime(dtm_parts[1], dtm_parts[2] if len(dtm_parts) > 2 else '')
+                        date_key = (value, fmt)
+                        date_formatted = parsed_dates.get(date_key)
+                        if date_formatted is None:
+                            date_formatted = parsed_dates[date_key] = self.parse_date(*date_key)
                         if dtm_parts[0] == '137':
                             self.header_info['Datum dokumentu'] = date_formatted
                         elif dtm_parts[0] == '63':
                             current_delivery['Datum do'] = date_formatted
                         elif dtm_parts[0] == '64':
                             current_delivery['Datum od'] = date_formatted
+                        elif dtm_parts[0] == '51':
+                            # Cumulative start date, cumulative quantities restart from here
+                            current_context['Kumulace od'] = date_formatted
+                        elif current_message == 'DELJIT' and dtm_parts[0] in ('2', '10'):
+                            # Requested delivery / shipment date of a call-off
+                            current_delivery['Datum od'] = date_formatted
+                            if delivery_time:
+                                current_delivery['Čas'] = delivery_time
+                        elif current_message == 'DESADV' and dtm_parts[0] == '11':
+                            despatch_date = date_formatted
+                            self.header_info['Datum odeslání'] = date_formatted
+                        elif current_message == 'DESADV' and dtm_parts[0] == '132':
+                            group_context['Příjezd'] = date_formatted
+                            self.header_info['Předpokládaný příjezd'] = date_formatted
             elif line.startswith('NAD'):
                 parts = line.split('+')
                 if len(parts) >= 3:
@@ -165,16 +379,49 @@ class EDITrwkobParser:
                         else:
                             self.partner_info['Dodací adresa'] = name if name else code
             elif line.startswith('LIN'):
+                # A new LIN starts a new group of deliveries
                 parts = line.split('+')
                 if len(parts) >= 4:
-                    self.header_info['Číslo položky'] = parts[3]
+                    add_delivery()
+                    current_delivery = {}
+                    part_number = parts[3].split(':')[0]
+                    skip_group = parse_filter is not None and not parse_filter.part_wanted(part_number)
+                    if skip_group:
+                        current_context = {}
+                        current_line_item = None
+                    else:
+                        current_context = {'Položka': part_number, **group_context}
+                        if current_message == 'DESADV':
+                            current_context['Dodací list'] = self.header_info.get('Číslo zprávy', '')
+                        current_line_item = get_line_item(part_number)
             elif line.startswith('PIA'):
                 parts = line.split('+')
                 if len(parts) >= 3:
-                    self.header_info['Kód produktu'] = parts[2]
+                    product_code = parts[2].split(':')[0]
+                    current_context['Kód produktu'] = product_code
+                    if current_line_item is not None and not current_line_item['Kód produktu']:
+                        current_line_item['Kód produktu'] = product_code
+            elif line.startswith('LOC'):
+                # Place of delivery (11) wins over the other locations
+                parts = line.split('+')
+                if len(parts) >= 3 and (parts[1] == '11' or 'Lokace' not in current_context):
+                    current_context['Lokace'] = parts[2].split(':')[0]
+                    if current_line_item is not None and not current_line_item['Lokace']:
+                        current_line_item['Lokace'] = current_context['Lokace']
+            elif line.startswith('RFF'):
+                parts = line.split('+')
+                if len(parts) >= 2:
+                    ref_parts = parts[1].split(':')
+                    if len(ref_parts) >= 2 and ref_parts[0] == 'ON':
+                        current_context['Objednávka'] = ref_parts[1]
+                        if current_line_item is not None and not current_line_item['Objednávka']:
+                            current_line_item['Objednávka'] = ref_parts[1]
             elif line.startswith('QTY'):
+                # Each QTY opens a new delivery group (QTY, SCC, DTM)
                 parts = line.split('+')
                 if len(parts) >= 2:
+                    add_delivery()
+                    current_delivery = {}
                     qty_parts = parts[1].split(':')
                     if len(qty_parts) >= 3:
                         qty_type = qty_parts[0]
@@ -192,13 +439,98 @@ class EDITrwkobParser:
                             current_delivery['Množství'] = quantity
                             current_delivery['Jednotka'] = unit
                             current_delivery['Typ'] = 'Maximální'
+                        elif qty_type == '1' and current_message == 'DELJIT':
+                            current_delivery['Množství'] = quantity
+                            current_delivery['Jednotka'] = unit
+                            current_delivery['Typ'] = 'Dodávka'
+                        elif qty_type == '12' and current_message == 'DESADV':
+                            # Despatched quantity, dated by the despatch date of the advice (DTM+11)
+                            current_delivery['Množství'] = quantity
+                            current_delivery['Jednotka'] = unit
+                            current_delivery['Typ'] = DESPATCH_TYPE
+                            if despatch_date:
+                                current_delivery['Datum od'] = despatch_date
+                        # A line of an unwanted quantity type is dropped before its SCC and dates are read
+                        if parse_filter is not None and not parse_filter.type_wanted(current_delivery.get('Typ'), qty_type):
+                            current_delivery = {}
+            elif line.startswith('SEQ'):
+                # DELJIT delivery sequence, the LIN groups after it belong to it
+                parts = line.split('+')
+                add_delivery()
+                current_delivery = {}
+                skip_group = False
+                group_context = {'Sekvence': parts[2].split(':')[0]} if len(parts) >= 3 else {}
+            elif line.startswith('CPS'):
+                # DESADV packing level (consignment, pallet, ...)
+                parts = line.split('+')
+                add_delivery()
+                current_delivery = {}
+                skip_group = False
+                group_context = {key: value for key, value in group_context.items() if key == 'Příjezd'}
+                if len(parts) >= 2:
+                    group_context['Zásilka'] = parts[1]
+            elif line.startswith('PAC'):
+                # Number and type of packages, e.g. PAC+4++BOX; before the LIN in a DESADV, inside it in a DELJIT
+                parts = line.split('+')
+                if len(parts) >= 2 and parts[1]:
+                    package_type = parts[3].split(':')[0] if len(parts) >= 4 else ''
+                    packaging = f"{parts[1]} {package_type}".strip()
+                    if current_message == 'DESADV':
+                        group_context['Balení'] = packaging
+                    else:
+                        current_context['Balení'] = packaging
             elif line.startswith('SCC'):
                 parts = line.split('+')
                 if len(parts) >= 2:
                     current_delivery['SCC'] = parts[1]
-                    if 'Datum od' in current_delivery and 'Množství' in current_delivery:
-                        self.delivery_schedules.append(current_delivery.copy())
-                        current_delivery = {'SCC': parts[1]}
+            elif line.startswith('UNS') or line.startswith('UNT'):
+                # End of the detail section or of the message
+                add_delivery()
+                current_delivery = {}
+                current_context = {}
+                current_line_item = None
+                skip_group = False
+        add_delivery()
+        self.apply_netting()
+        self.envelope_report = envelope.finish()
+        # Single-part files keep the part in the header as before
+        if len(self.line_items) == 1:
+            self.header_info['Číslo položky'] = self.line_items[0]['Položka']
+            if self.line_items[0]['Kód produktu']:
+                self.header_info['Kód produktu'] = self.line_items[0]['Kód produktu']
+
+    def apply_netting(self):
+        """Turn cumulative QTY+113 quantities into per-period net demand and
+        recompute the per-part totals and the part x week matrix from it"""
+        apply_net_quantities(self.delivery_schedules, 'Datum od')
+        # With a filter the excluded cumulative lines go only now, and the index and counts are rebuilt
+        filtered = self.parse_filter is not None and not self.parse_filter.defer_netted
+        if filtered:
+            self.delivery_schedules = self.parse_filter.drop_netted(self.delivery_schedules, 'Datum od')
+            self.part_index = {item['Položka']: [] for item in self.line_items}
+        line_items_by_part = {item['Položka']: item for item in self.line_items}
+        for line_item in self.line_items:
+            line_item['Množství'] = 0
+            if filtered:
+                line_item['Počet dodávek'] = 0
+        self.forecast_pivot = ForecastPivot()
+        for position, delivery in enumerate(self.delivery_schedules):
+            part_number = delivery.get('Položka', '')
+            if filtered:
+                self.part_index.setdefault(part_number, []).append(position)
+                if part_number in line_items_by_part:
+                    line_items_by_part[part_number]['Počet dodávek'] += 1
+            if part_number in line_items_by_part:
+                line_items_by_part[part_number]['Množství'] += delivery['Čisté množství']
+            # Minimum/maximum and despatched quantities are not demand
+            if delivery.get('Typ') not in ('Minimální', 'Maximální', DESPATCH_TYPE):
+                self.forecast_pivot.add(part_number, delivery['Datum od'],
+                                        self.get_scc_description(delivery.get('SCC', '')),
+                                        delivery['Čisté množství'])
+
+    def get_part_deliveries(self, part_number):
+        """Deliveries of one part looked up through the index, without scanning the schedule"""
+        return [self.delivery_schedules[i] for i in self.part_index.get(part_number, [])]
 
     def display_data(self):
         self.info_text.delete(1.0, tk.END)
@@ -211,23 +543,26 @@ class EDITrwkobParser:
         info_content += "\n=== INFORMACE O PARTNERECH ===\n"
         for key, value in self.partner_info.items():
             info_content += f"{key}: {value}\n"
+        if len(self.line_items) > 1:
+            info_content += f"\n=== POLOŽKY ({len(self.line_items)}) ===\n"
+            for line_item in self.line_items:
+                info_content += (f"{line_item['Položka']}: kód {line_item['Kód produktu']}, "
+                                 f"lokace {line_item['Lokace']}, objednávka {line_item['Objednávka']}\n")
+        # Envelope check (UNB/UNZ, UNH/UNT) from the parse pass
+        if self.envelope_report:
+            info_content += "\n=== KONTROLA OBÁLKY ===\n"
+            info_content += "\n".join(self.envelope_report['Chyby']) if self.envelope_report['Chyby'] else "OK"
+            info_content += "\n"
         self.info_text.insert(1.0, info_content)
-        for item in self.delivery_tree.get_children():
-            self.delivery_tree.delete(item)
-        for delivery in self.delivery_schedules:
-            scc_code = delivery.get('SCC', '')
-            scc_desc = self.get_scc_description(scc_code)
-            self.delivery_tree.insert('', tk.END, values=(
-                delivery.get('Datum od', ''),
-                delivery.get('Datum do', ''),
-                delivery.get('Množství', ''),
-                delivery.get('Typ', ''),
-                scc_desc
-            ))
+        self.part_combo.configure(values=(self.ALL_PARTS,) + tuple(item['Položka'] for item in self.line_items))
+        self.part_var.set(self.ALL_PARTS)
+        self.build_delivery_table()
+        self.show_deliveries()
         self.stats_text.delete(1.0, tk.END)
         stats_content = "=== STATISTIKY ===\n"
         stats_content += f"Celkový počet dodávek: {len(self.delivery_schedules)}\n"
-        total_qty = sum(int(d.get('Množství', 0)) for d in self.delivery_schedules if d.get('Množství', '').isdigit())
+        # Net demand - cumulative quantities are converted to per-period quantities
+        total_qty = sum(d.get('Čisté množství', 0) for d in self.delivery_schedules)
         stats_content += f"Celkové množství: {total_qty:,} kusů\n"
         type_stats = {}
         for delivery in self.delivery_schedules:
@@ -235,12 +570,92 @@ class EDITrwkobParser:
             if delivery_type not in type_stats:
                 type_stats[delivery_type] = {'počet': 0, 'množství': 0}
             type_stats[delivery_type]['počet'] += 1
-            if delivery.get('Množství', '').isdigit():
-                type_stats[delivery_type]['množství'] += int(delivery.get('Množství', 0))
+            type_stats[delivery_type]['množství'] += delivery.get('Čisté množství', 0)
         stats_content += "\n=== STATISTIKY PODLE TYPU ===\n"
         for delivery_type, stats in type_stats.items():
             stats_content += f"{delivery_type}: {stats['počet']} dodávek, {stats['množství']:,} kusů\n"
+        # Per-part totals are accumulated while parsing
+        if len(self.line_items) > 1:
+            stats_content += "\n=== STATISTIKY PODLE POLOŽEK ===\n"
+            for line_item in self.line_items:
+                stats_content += (f"{line_item['Položka']}: {line_item['Počet dodávek']} dodávek, "
+                                  f"{line_item['Množství']:,} kusů\n")
         self.stats_text.insert(1.0, stats_content)
+        self.prerender.start(*self.export_job())
+
+    def get_selected_part(self):
+        """Selected part number, or None when all parts are shown"""
+        part_number = self.part_var.get() if hasattr(self, 'part_var') else self.ALL_PARTS
+        return None if part_number == self.ALL_PARTS else part_number
+
+    def build_delivery_table(self):
+        """Prepare sorting and filtering for freshly loaded data and fill the filter lists"""
+        self.delivery_table = DeliveryTable(self.delivery_schedules, date_columns=('Datum od', 'Datum do'),
+                                            number_columns=('Množství', 'Čisté množství'))
+        self.sort_column = None
+        self.sort_descending = False
+        self.update_sort_headings()
+        self.type_combo.configure(values=(self.ALL_TYPES,) + tuple(self.delivery_table.distinct('Typ')))
+        self.type_var.set(self.ALL_TYPES)
+        # SCC is shown by its description but filtered by its code
+        self.scc_codes = {self.get_scc_description(code): code for code in self.delivery_table.distinct('SCC')}
+        self.scc_combo.configure(values=(self.ALL_SCC,) + tuple(self.scc_codes))
+        self.scc_var.set(self.ALL_SCC)
+        self.date_from_var.set('')
+        self.date_to_var.set('')
+
+    def sort_deliveries(self, column):
+        """Sort the table by a column, clicking the same column again reverses the order"""
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self.update_sort_headings()
+        self.show_deliveries()
+
+    def update_sort_headings(self):
+        for col in self.delivery_tree['columns']:
+            arrow = (' ▼' if self.sort_descending else ' ▲') if col == self.sort_column else ''
+            self.delivery_tree.heading(col, text=col + arrow)
+
+    def get_filtered_deliveries(self):
+        """Deliveries of the selected part, narrowed by the quick filters and sorted"""
+        if self.delivery_table is None or self.delivery_table.deliveries is not self.delivery_schedules:
+            self.build_delivery_table()
+        part_number = self.get_selected_part()
+        values = {}
+        if self.type_var.get() != self.ALL_TYPES:
+            values['Typ'] = {self.type_var.get()}
+        if self.scc_var.get() != self.ALL_SCC:
+            values['SCC'] = {self.scc_codes.get(self.scc_var.get(), '')}
+        return self.delivery_table.rows(
+            self.sort_column, self.sort_descending,
+            within=self.part_index.get(part_number, []) if part_number else None,
+            values=values, date_column='Datum od',
+            date_from=self.date_from_var.get().strip(), date_to=self.date_to_var.get().strip())
+
+    def show_deliveries(self):
+        try:
+            deliveries = self.get_filtered_deliveries()
+        except ValueError as e:
+            # An unreadable date bound in the quick filter; the table stays as it was
+            messagebox.showwarning("Upozornění", str(e))
+            return
+        for item in self.delivery_tree.get_children():
+            self.delivery_tree.delete(item)
+        for delivery in deliveries:
+            scc_code = delivery.get('SCC', '')
+            scc_desc = self.get_scc_description(scc_code)
+            self.delivery_tree.insert('', tk.END, values=(
+                delivery.get('Položka', ''),
+                delivery.get('Datum od', ''),
+                delivery.get('Datum do', ''),
+                delivery.get('Množství', ''),
+                delivery.get('Čisté množství', ''),
+                delivery.get('Typ', ''),
+                scc_desc
+            ))
 
     def get_week_number(self, date_str):
         """Convert date string to ISO week number (WW)"""
@@ -261,70 +676,71 @@ class EDITrwkobParser:
         }
         return scc_mapping.get(scc_code, f'Neznámý kód: {scc_code}')
 
+    def build_workbook(self, part_number=None, include_pivot=False):
+        """Build the delivery workbook with calendar weeks (does not save it), optionally for one part"""
+        deliveries = self.get_part_deliveries(part_number) if part_number else self.delivery_schedules
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Dodávky"
+
+        headers = ["Týden", "Položka", "Datum", "Množství", "Čisté množství", "Typ", "SCC"]
+
+        # Data rows; the column widths are measured while they are written
+        def rows():
+            for delivery in deliveries:
+                date_str = delivery.get('Datum od', '')
+                week_num = self.get_week_number(date_str) if date_str else ""
+                yield [week_num, delivery.get('Položka', ''), date_str, delivery.get('Množství', ''),
+                       delivery.get('Čisté množství', ''), delivery.get('Typ', ''),
+                       self.get_scc_description(delivery.get('SCC', ''))]
+
+        write_rows(ws, headers, rows())
+
+        # Part x week matrix sheet from the index built while parsing
+        if include_pivot and self.forecast_pivot:
+            self.forecast_pivot.write_sheet(wb, part_numbers=[part_number] if part_number else None)
+
+        return wb
+
     def export_to_excel(self):
         """Export delivery data to Excel with calendar weeks"""
         if not self.delivery_schedules:
             messagebox.showwarning("Upozornění", "Žádná data k exportu")
             return
 
-        try:
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Dodávky"
-
-            # Headers
-            headers = ["Týden", "Datum", "Množství", "Typ", "SCC"]
-            for col_num, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col_num, value=header)
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-
-            # Data
-            row_num = 2
-            for delivery in self.delivery_schedules:
-                date_str = delivery.get('Datum od', '')
-                week_num = self.get_week_number(date_str) if date_str else ""
-                scc_code = delivery.get('SCC', '')
-                scc_desc = self.get_scc_description(scc_code)
-                
-                ws.cell(row=row_num, column=1, value=week_num)
-                ws.cell(row=row_num, column=2, value=date_str)
-                ws.cell(row=row_num, column=3, value=delivery.get('Množství', ''))
-                ws.cell(row=row_num, column=4, value=delivery.get('Typ', ''))
-                ws.cell(row=row_num, column=5, value=scc_desc)
-                row_num += 1
-
-            # Auto-adjust column widths
-            for column in ws.columns:
-                max_length = 0
-                column_letter = get_column_letter(column[0].column)
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)
-                ws.column_dimensions[column_letter].width = min(adjusted_width, 30)
-
-            # Save the file
-            filename = f"dodavky_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            filepath = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
-                initialfile=filename
-            )
-            
-            if filepath:
-                wb.save(filepath)
-                messagebox.showinfo("Hotovo", f"Data byla úspěšně exportována do souboru:\n{filepath}")
+        # Export what is shown - all parts or just the selected one. The workbook
+        # keeps building in the background while the save dialog is open.
+        part_number = self.get_selected_part()
+        key, build = self.export_job()
+        self.prerender.start(key, build)
 
-        except Exception as e:
-            messagebox.showerror("Chyba", f"Chyba při exportu do Excelu: {str(e)}")
+        part_suffix = f"_{part_number}" if part_number else ""
+        filename = f"dodavky{part_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
+            initialfile=filename
+        )
+        if filepath:
+            self.prerender.save(
+                self.root, key, build, filepath,
+                on_saved=lambda path: messagebox.showinfo(
+                    "Hotovo", f"Data byla úspěšně exportována do souboru:\n{path}"),
+                on_error=lambda e: messagebox.showerror("Chyba", f"Chyba při exportu do Excelu: {str(e)}"))
+
+    def export_job(self):
+        """(key, build) of the export with the options currently shown"""
+        part_number = self.get_selected_part()
+        include_pivot = self.pivot_var.get()
+        # The build runs on the prerender thread, from a consistent copy of the state
+        snapshot = self.snapshot()
+        key = (id(snapshot.delivery_schedules), part_number, include_pivot)
+        return key, lambda: snapshot.build_workbook(part_number, include_pivot=include_pivot)
 
     def back_to_main(self):
         """Closes the current window and returns to the main application"""
         # Close current window
+        self.prerender.shutdown()
         self.root.destroy()
         # Return to main window
         if self.main_window:
@@ -0,0 +1,349 @@
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import stat
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from edi_parser_charset import decode_edi
+from edi_parser_duplicates import DUPLICATE, INDEX_NAME, NEAR_DUPLICATE, TransmissionIndex, transmission_key
+from edi_parser_envelope import format_envelope_report
+from edi_parser_main import parse_content
+
+PROCESSED_SUFFIX = '.processed'
+FAILED_SUFFIX = '.failed'
+
+# Files the gateway is still writing under a temporary name
+IGNORED_SUFFIXES = ('.tmp', '.part', '.partial', '.filepart', '.crdownload')
+# What the watcher writes itself, never an input even if it lands in the inbound folder
+OUTPUT_SUFFIXES = ('.xlsx', PROCESSED_SUFFIX, FAILED_SUFFIX)
+
+
+def process_file(filepath, output_dir, include_pivot=False, strict=False, duplicates=None):
+    """Parse one EDI file headlessly and save its Excel export (runs in a worker process).
+
+    With `strict` a file whose envelope check failed (truncated transfer,
+    wrong UNT/UNZ counts or references) is rejected instead of exported.
+    `duplicates` is the path of a transmission index: an exact resend of a
+    known transmission is skipped before parsing, a near duplicate is flagged."""
+    started = time.perf_counter()
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    if duplicates is None:
+        return _export(filepath, data, output_dir, include_pivot, strict, started)
+
+    key = transmission_key(data)
+    with TransmissionIndex(duplicates) as index:
+        status, files = index.claim(key, os.path.basename(filepath))
+    if status == DUPLICATE:
+        return {
+            'Soubor': os.path.basename(filepath),
+            'Duplikát': files[0],
+            'Doba (s)': round(time.perf_counter() - started, 3),
+        }
+    try:
+        summary = _export(filepath, data, output_dir, include_pivot, strict, started)
+    except BaseException:
+        # Not processed after all, so a resend of it must not be skipped
+        with TransmissionIndex(duplicates) as index:
+            index.forget(key)
+        raise
+    if status == NEAR_DUPLICATE:
+        summary['Podobné'] = files
+    return summary
+
+
+def _export(filepath, data, output_dir, include_pivot, strict, started):
+    file_type, parser = parse_content(filepath, decode_edi(data))
+    return export_parsed(filepath, file_type, parser, output_dir, include_pivot, strict, started)
+
+
+def export_parsed(filepath, file_type, parser, output_dir, include_pivot, strict, started):
+    """Save the Excel export of a parsed file as <output_dir>/<file name>.xlsx and return its summary"""
+    envelope = format_envelope_report(parser.envelope_report)
+    if strict and not parser.envelope_report['Platné']:
+        raise ValueError(f"Neplatná obálka: {envelope}")
+    if not parser.delivery_schedules:
+        raise ValueError("Žádná data k exportu")
+
+    # Save under a temporary name first so nobody picks up a half written workbook
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    export_path = os.path.join(output_dir, stem + '.xlsx')
+    tmp_path = export_path + '.tmp'
+    parser.build_workbook(include_pivot=include_pivot).save(tmp_path)
+    os.replace(tmp_path, export_path)
+
+    return {
+        'Soubor': os.path.basename(filepath),
+        'Typ': file_type,
+        'Počet dodávek': len(parser.delivery_schedules),
+        'Obálka': envelope,
+        'Export': export_path,
+        'Doba (s)': round(time.perf_counter() - started, 3),
+    }
+
+
+def _warm_up():
+    """No-op task used to start worker processes before the first file arrives"""
+    return os.getpid()
+
+
+class _InotifySource:
+    """Linux inotify watch on a single directory, read through ctypes"""
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 selhalo")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"Nelze sledovat složku {directory}")
+
+    def wait(self, timeout):
+        """Block up to `timeout` seconds and return names of files that changed"""
+        names = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return names
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _PollingSource:
+    """Fallback for platforms without inotify (Windows, network shares)"""
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        with os.scandir(self.directory) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+
+    def close(self):
+        pass
+
+
+class FolderWatcher:
+    def __init__(self, inbound_dir, output_dir, workers=None, settle=0.3,
+                 poll_interval=0.25, use_inotify=True, include_pivot=False, strict=False,
+                 skip_duplicates=False):
+        self.inbound_dir = os.path.abspath(inbound_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.include_pivot = include_pivot
+        self.strict = strict
+        # Transmission index in the output folder, shared by all worker processes
+        self.duplicates = os.path.join(self.output_dir, INDEX_NAME) if skip_duplicates else None
+
+        # name -> (size, mtime_ns, time of last change); files wait here until they stop growing
+        self._pending = {}
+        self._in_flight = set()
+        # At most two queued files per worker; the watch loop blocks when the pool is saturated
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _open_source(self):
+        if self.use_inotify and sys.platform.startswith('linux'):
+            try:
+                return _InotifySource(self.inbound_dir)
+            except (OSError, AttributeError) as e:
+                print(f"inotify není k dispozici ({e}), přecházím na pravidelné procházení složky")
+        return _PollingSource(self.inbound_dir, self.poll_interval)
+
+    def _is_candidate(self, name):
+        if name.startswith('.') or name.lower().endswith(IGNORED_SUFFIXES + OUTPUT_SUFFIXES):
+            return False
+        if name.startswith(INDEX_NAME):
+            return False
+        if name in self._in_flight:
+            return False
+        path = os.path.join(self.inbound_dir, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        # Subfolders (e.g. an output folder inside the inbound one) are not inputs
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        mtime = st.st_mtime_ns
+        # Already handled unless the file was rewritten after its marker
+        for suffix in (PROCESSED_SUFFIX, FAILED_SUFFIX):
+            try:
+                if os.stat(os.path.join(self.output_dir, name + suffix)).st_mtime_ns >= mtime:
+                    return False
+            except FileNotFoundError:
+                pass
+        return True
+
+    def _note_changes(self, names):
+        now = time.monotonic()
+        for name in names:
+            if not self._is_candidate(name):
+                continue
+            try:
+                st = os.stat(os.path.join(self.inbound_dir, name))
+            except FileNotFoundError:
+                self._pending.pop(name, None)
+                continue
+            signature = (st.st_size, st.st_mtime_ns)
+            previous = self._pending.get(name)
+            if previous is None or previous[:2] != signature:
+                self._pending[name] = signature + (now,)
+
+    def _settled_files(self):
+        """Return pending files whose size and mtime did not change for `settle` seconds"""
+        now = time.monotonic()
+        ready = []
+        for name, (size, mtime_ns, changed_at) in list(self._pending.items()):
+            try:
+                st = os.stat(os.path.join(self.inbound_dir, name))
+            except FileNotFoundError:
+                del self._pending[name]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self._pending[name] = (st.st_size, st.st_mtime_ns, now)
+            elif now - changed_at >= self.settle and st.st_size > 0:
+                del self._pending[name]
+                ready.append(name)
+        return ready
+
+    def _write_marker(self, name, suffix, payload):
+        other = FAILED_SUFFIX if suffix == PROCESSED_SUFFIX else PROCESSED_SUFFIX
+        try:
+            os.remove(os.path.join(self.output_dir, name + other))
+        except FileNotFoundError:
+            pass
+        with open(os.path.join(self.output_dir, name + suffix), 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+
+    def _submit(self, pool, name):
+        self._slots.acquire()
+        self._in_flight.add(name)
+        submitted = time.monotonic()
+        try:
+            future = pool.submit(process_file, os.path.join(self.inbound_dir, name), self.output_dir,
+                                 self.include_pivot, self.strict, self.duplicates)
+        except BaseException:
+            # A broken or shut down pool never calls on_done, the slot would be lost
+            self._in_flight.discard(name)
+            self._slots.release()
+            raise
+
+        def on_done(fut):
+            try:
+                summary = fut.result()
+                summary['Latence (s)'] = round(time.monotonic() - submitted, 3)
+                self._write_marker(name, PROCESSED_SUFFIX, summary)
+                if 'Duplikát' in summary:
+                    print(f"DUPL {name}: stejný přenos jako {summary['Duplikát']}, přeskočeno")
+                    return
+                print(f"OK   {name}: {summary['Typ']}, {summary['Počet dodávek']} dodávek, "
+                      f"{summary['Doba (s)']} s, obálka: {summary['Obálka']}")
+                if 'Podobné' in summary:
+                    print(f"     {name}: podobný přenosům {', '.join(summary['Podobné'])}")
+            except Exception as e:
+                self._write_marker(name, FAILED_SUFFIX, {'Soubor': name, 'Chyba': str(e)})
+                print(f"CHYBA {name}: {e}")
+            finally:
+                self._in_flight.discard(name)
+                self._slots.release()
+
+        future.add_done_callback(on_done)
+
+    def run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        source = self._open_source()
+        print(f"Sleduji {self.inbound_dir} -> {self.output_dir} "
+              f"({type(source).__name__.strip('_')}, {self.workers} procesů)")
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for _ in range(self.workers):
+                pool.submit(_warm_up)
+            try:
+                # Files that arrived while the watcher was not running
+                with os.scandir(self.inbound_dir) as entries:
+                    changed = {entry.name for entry in entries if entry.is_file()}
+                while not self._stop.is_set():
+                    self._note_changes(changed)
+                    for name in self._settled_files():
+                        self._submit(pool, name)
+                    # Wake up often enough to notice when pending files have settled
+                    timeout = self.settle / 2 if self._pending else 1.0
+                    changed = source.wait(timeout)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                source.close()
+        print("Sledování ukončeno")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="edi_parser_main.py watch",
+        description="Sleduje vstupní složku a každý nový EDI soubor naparsuje a vyexportuje do Excelu.")
+    arg_parser.add_argument("inbound", help="Vstupní složka s EDI soubory")
+    arg_parser.add_argument("output", help="Výstupní složka pro exporty a značky .processed/.failed")
+    arg_parser.add_argument("--workers", type=int, default=None,
+                            help="Počet paralelních procesů (výchozí: počet jader)")
+    arg_parser.add_argument("--settle", type=float, default=0.3,
+                            help="Jak dlouho (s) se soubor nesmí měnit, než se zpracuje")
+    arg_parser.add_argument("--poll", action="store_true",
+                            help="Nepoužívat inotify, jen pravidelně procházet složku")
+    arg_parser.add_argument("--pivot", action="store_true",
+                            help="Přidat do exportu list s maticí položka × týden")
+    arg_parser.add_argument("--strict", action="store_true",
+                            help="Odmítnout soubory s chybnou obálkou (UNT/UNZ počty, řídicí reference)")
+    arg_parser.add_argument("--skip-duplicates", action="store_true",
+                            help="Přeskočit opakovaně zaslané přenosy (index ve výstupní složce)")
+    args = arg_parser.parse_args(argv)
+    inbound = os.path.realpath(args.inbound)
+    output = os.path.realpath(args.output)
+    if os.path.commonpath([inbound, output]) == inbound:
+        arg_parser.error("Výstupní složka nesmí být vstupní složka ani ležet v ní")
+
+    watcher = FolderWatcher(args.inbound, args.output, workers=args.workers,
+                            settle=args.settle, use_inotify=not args.poll,
+                            include_pivot=args.pivot, strict=args.strict,
+                            skip_duplicates=args.skip_duplicates)
+    watcher.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import openpyxl
+from openpyxl.styles import Font
+
+from edi_parser_archive import ARCHIVE_FILETYPES, expand_inputs, input_name, parse_input
+from edi_parser_columnar import ColumnarDeliveries
+from edi_parser_filter import add_filter_arguments, filter_from_args
+from edi_parser_messages import DESPATCH_TYPE
+from edi_parser_pivot import iso_week_key
+
+PARTNER_NAMES = {
+    'cummins': 'Cummins',
+    'trwkob': 'TRW Koblenz',
+    'minebea': 'Minebea',
+}
+
+# Quantity types that are not demand: cumulative Cummins figures (Minebea/TRWKOB
+# cumulative quantities are already netted), minimum/maximum stock levels and
+# DESADV despatched quantities
+NON_DEMAND_TYPES = {
+    'cummins': ('Kumulativní', DESPATCH_TYPE),
+    'trwkob': ('Minimální', 'Maximální', DESPATCH_TYPE),
+    'minebea': ('Minimální', 'Maximální'),
+}
+
+
+def normalize_deliveries(file_type, parser, filename):
+    """Deliveries of any partner parser in the shared workspace record model"""
+    partner = PARTNER_NAMES.get(file_type, file_type)
+    non_demand = NON_DEMAND_TYPES.get(file_type, ())
+    records = []
+    for delivery in parser.delivery_schedules:
+        if file_type == 'cummins':
+            date_str = delivery.get('Datum', '')
+            quantity = int(delivery['Množství']) if delivery.get('Množství', '').isdigit() else 0
+            scc = delivery.get('SCC', '')
+        else:
+            # Minebea/TRWKOB: net demand, SCC code translated like in their exports
+            date_str = delivery.get('Datum od', '')
+            quantity = delivery.get('Čisté množství', 0)
+            scc = parser.get_scc_description(delivery.get('SCC', ''))
+        records.append({
+            'Partner': partner,
+            'Soubor': filename,
+            'Položka': delivery.get('Položka', ''),
+            'Datum': date_str[:10],
+            'Množství': quantity,
+            'Typ': delivery.get('Typ', ''),
+            'SCC': scc,
+            'Poptávka': delivery.get('Typ', '') not in non_demand,
+        })
+    return records
+
+
+def weekly_demand(records):
+    """(partner, part, (iso_year, iso_week)) -> quantity for one file's records"""
+    totals = {}
+    for record in records:
+        if not record['Poptávka'] or not record['Množství']:
+            continue
+        week = iso_week_key(record['Datum'])
+        if week is None:
+            continue
+        key = (record['Partner'], record['Položka'], week)
+        totals[key] = totals.get(key, 0) + record['Množství']
+    return totals
+
+
+def load_workspace_file(filepath, parse_filter=None):
+    """Parse one file or archive member and reduce it to workspace records (runs in a worker process)"""
+    started = time.perf_counter()
+    file_type, parser = parse_input(filepath, parse_filter)
+    return reduce_parsed(filepath, file_type, parser, started)
+
+
+def reduce_parsed(filepath, file_type, parser, started):
+    """Workspace result of an already parsed file: its records and weekly totals"""
+    records = normalize_deliveries(file_type, parser, input_name(filepath))
+    return {
+        'Soubor': filepath,
+        'Partner': PARTNER_NAMES.get(file_type, file_type),
+        # Records travel back to the parent as columns, the weekly totals are small already
+        'Záznamy': ColumnarDeliveries.from_deliveries(records),
+        'Týdny': weekly_demand(records),
+        'Obálka': parser.envelope_report.get('Platné', True),
+        'Doba (s)': round(time.perf_counter() - started, 3),
+    }
+
+
+def iter_loaded_files(filepaths, workers=None, parse_filter=None):
+    """Yield (filepath, result, error) for every file in order of completion.
+
+    Zip archives are expanded to their members, which load like separate files."""
+    filepaths = expand_inputs(filepaths)
+    workers = min(workers or os.cpu_count() or 1, len(filepaths) or 1)
+    if workers < 2:
+        for filepath in filepaths:
+            try:
+                yield filepath, load_workspace_file(filepath, parse_filter), None
+            except Exception as e:
+                yield filepath, None, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(load_workspace_file, filepath, parse_filter): filepath for filepath in filepaths}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+class DemandWorkspace:
+    """All loaded files of all partners with a combined (partner, part, ISO week) index.
+
+    Every file keeps its own weekly totals, so adding a file only adds its
+    totals to the index and reloading or removing one subtracts its old
+    contribution; nothing is recomputed from the other files."""
+
+    def __init__(self):
+        # filepath -> {'Partner', 'Záznamy', 'Týdny', ...} in loading order
+        self.files = {}
+        # (partner, part, (iso_year, iso_week)) -> quantity
+        self.demand = {}
+        # (partner, part) -> number of contributing (file, week) entries, for the row list
+        self.row_refs = {}
+        self.week_refs = {}
+
+    def __len__(self):
+        return len(self.files)
+
+    def add_result(self, result):
+        """Merge a load_workspace_file() result; a reloaded file replaces its previous version"""
+        filepath = result['Soubor']
+        if filepath in self.files:
+            self.remove_file(filepath)
+        self.files[filepath] = result
+        self._apply(result['Týdny'], 1)
+
+    def add_file(self, filepath):
+        """Load one file in this process"""
+        self.add_result(load_workspace_file(filepath))
+
+    def remove_file(self, filepath):
+        result = self.files.pop(filepath, None)
+        if result is not None:
+            self._apply(result['Týdny'], -1)
+
+    def _apply(self, totals, sign):
+        for key, quantity in totals.items():
+            partner, part_number, week = key
+            value = self.demand.get(key, 0) + sign * quantity
+            if value:
+                self.demand[key] = value
+            else:
+                self.demand.pop(key, None)
+            for refs, ref_key in ((self.row_refs, (partner, part_number)), (self.week_refs, week)):
+                count = refs.get(ref_key, 0) + sign
+                if count > 0:
+                    refs[ref_key] = count
+                else:
+                    refs.pop(ref_key, None)
+
+    def load_files(self, filepaths, workers=None, on_loaded=None, on_error=None, parse_filter=None):
+        """Parse files in parallel and merge each one as soon as it finishes.
+
+        `on_loaded(result)` / `on_error(filepath, exception)` run in the calling
+        thread after every file, so a view can refresh incrementally."""
+        for filepath, result, error in iter_loaded_files(filepaths, workers, parse_filter):
+            if error is not None:
+                if on_error is None:
+                    raise error
+                on_error(filepath, error)
+                continue
+            self.add_result(result)
+            if on_loaded:
+                on_loaded(result)
+
+    def weeks(self):
+        return sorted(self.week_refs)
+
+    def records(self):
+        """All records of all files in loading order"""
+        for result in self.files.values():
+            yield from result['Záznamy'].to_deliveries()
+
+    def iter_rows(self):
+        """Header row and one row per (partner, part) with quantities per ISO week"""
+        weeks = self.weeks()
+        yield ["Partner", "Položka"] + [f"{year}-T{week:02d}" for year, week in weeks] + ["Celkem"]
+        for partner, part_number in sorted(self.row_refs):
+            values = [self.demand.get((partner, part_number, week), 0) for week in weeks]
+            yield [partner, part_number] + [q or None for q in values] + [sum(values)]
+
+    def build_workbook(self):
+        """Workbook with the combined week matrix and all normalized records"""
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Souhrn"
+        bold = Font(bold=True)
+        rows = self.iter_rows()
+        ws.append(next(rows))
+        for cell in ws[1]:
+            cell.font = bold
+        for row in rows:
+            ws.append(row)
+        ws.freeze_panes = "C2"
+        ws.column_dimensions['A'].width = 15
+        ws.column_dimensions['B'].width = 20
+
+        ws = wb.create_sheet("Dodávky")
+        headers = ["Partner", "Soubor", "Položka", "Datum", "Množství", "Typ", "SCC"]
+        ws.append(headers)
+        for cell in ws[1]:
+            cell.font = bold
+        for record in self.records():
+            ws.append([record.get(header, '') for header in headers])
+        ws.freeze_panes = "A2"
+        return wb
+
+
+class WorkspaceWindow:
+    """One window with the consolidated demand of all loaded files"""
+
+    def __init__(self, filepaths=None, workers=None, parse_filter=None):
+        self.workspace = DemandWorkspace()
+        self.workers = workers
+        self.parse_filter = parse_filter
+        # Results of the background loader, handed over to the Tk thread
+        self.results = queue.Queue()
+        self.loading = 0
+
+        self.root = tk.Tk()
+        self.root.title("EDI pracovní prostor")
+        self.root.geometry("1200x800")
+        self.setup_ui()
+        if filepaths:
+            self.start_loading(filepaths)
+
+    def setup_ui(self):
+        main_frame = ttk.Frame(self.root)
+        main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        btn_frame = ttk.Frame(main_frame)
+        btn_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Button(btn_frame, text="Přidat soubory", command=self.add_files).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="Export do Excelu", command=self.export_to_excel).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(btn_frame, text="Zavřít", command=self.root.destroy).pack(side=tk.LEFT, padx=(10, 0))
+        self.status_var = tk.StringVar(value="Žádné soubory")
+        ttk.Label(btn_frame, textvariable=self.status_var).pack(side=tk.LEFT, padx=(20, 0))
+
+        tree_frame = ttk.Frame(main_frame)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(tree_frame, show='headings', height=25)
+        v_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        h_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    def add_files(self):
+        filepaths = filedialog.askopenfilenames(
+            title="Vyberte EDI soubory",
+            filetypes=[("EDI files", "*.edi")] + ARCHIVE_FILETYPES + [("All files", "*.*")]
+        )
+        if filepaths:
+            self.start_loading(filepaths)
+
+    def start_loading(self, filepaths):
+        """Load files in a background thread; the window keeps responding meanwhile"""
+        # Counted per zip member, every member comes back as its own result
+        filepaths = expand_inputs(filepaths)
+        self.loading += len(filepaths)
+        self.update_status()
+
+        def worker():
+            # Runs outside the Tk thread, so results only go through the queue
+            for filepath, result, error in iter_loaded_files(filepaths, self.workers, self.parse_filter):
+                self.results.put((filepath, result, error))
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, self.poll_results)
+
+    def poll_results(self):
+        changed = False
+        errors = []
+        while True:
+            try:
+                filepath, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.loading -= 1
+            if error is None:
+                self.workspace.add_result(result)
+                changed = True
+            else:
+                errors.append(f"{input_name(filepath)}: {error}")
+        if changed:
+            self.show_matrix()
+        self.update_status()
+        if errors:
+            messagebox.showerror("Chyba", "Nelze načíst:\n" + "\n".join(errors))
+        if self.loading > 0:
+            self.root.after(100, self.poll_results)
+
+    def update_status(self):
+        status = f"Souborů: {len(self.workspace)}"
+        if self.loading > 0:
+            status += f", načítá se {self.loading}"
+        self.status_var.set(status)
+
+    def show_matrix(self):
+        rows = self.workspace.iter_rows()
+        header = next(rows)
+        self.tree.delete(*self.tree.get_children())
+        self.tree.configure(columns=header)
+        for i, col in enumerate(header):
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=120 if i < 2 else 70, anchor=tk.W if i < 2 else tk.E)
+        for row in rows:
+            self.tree.insert('', tk.END, values=['' if value is None else value for value in row])
+
+    def export_to_excel(self):
+        if not len(self.workspace):
+            messagebox.showwarning("Upozornění", "Žádná data k exportu")
+            return
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx")],
+            initialfile="EDI_souhrn.xlsx"
+        )
+        if not filepath:
+            return
+        try:
+            self.workspace.build_workbook().save(filepath)
+            messagebox.showinfo("Úspěch", f"Data byla exportována do {filepath}")
+        except Exception as e:
+            messagebox.showerror("Chyba", f"Chyba při exportu: {str(e)}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog="edi_parser_main.py workspace",
+        description="Sloučí poptávku ze souborů všech partnerů do jedné matice partner × položka × týden.")
+    arg_parser.add_argument("files", nargs='+', help="EDI soubory nebo archivy (.zip, .gz)")
+    arg_parser.add_argument("-o", "--output", help="Uložit souhrn do Excelu místo otevření okna")
+    arg_parser.add_argument("--workers", type=int, default=None,
+                            help="Počet paralelních procesů (výchozí: počet jader)")
+    add_filter_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+    try:
+        parse_filter = filter_from_args(args)
+    except ValueError as e:
+        arg_parser.error(str(e))
+
+    if not args.output:
+        window = WorkspaceWindow(args.files, workers=args.workers, parse_filter=parse_filter)
+        window.root.mainloop()
+        return 0
+
+    workspace = DemandWorkspace()
+    failed = []
+
+    def report(result):
+        print(f"OK   {input_name(result['Soubor'])}: {result['Partner']}, "
+              f"{len(result['Záznamy'])} dodávek, {result['Doba (s)']} s")
+
+    def report_error(filepath, e):
+        failed.append(filepath)
+        print(f"CHYBA {input_name(filepath)}: {e}")
+
+    workspace.load_files(args.files, workers=args.workers, on_loaded=report, on_error=report_error,
+                         parse_filter=parse_filter)
+    workspace.build_workbook().save(args.output)
+    print(f"Souhrn {len(workspace)} souborů uložen do {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
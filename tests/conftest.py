@@ -0,0 +1,64 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from edi_parser_charset import read_edi_file  # noqa: E402
+from edi_parser_main import parse_content  # noqa: E402
+
+SAMPLE_FILES = sorted(os.path.join(REPO_ROOT, name) for name in os.listdir(REPO_ROOT) if name.endswith('.edi'))
+CUMMINS_SAMPLE = next(path for path in SAMPLE_FILES if 'CUMMINS' in os.path.basename(path))
+
+# Segments Cummins carries over from the previous LIN group when a group leaves them out
+CARRIED_PREFIXES = ('LOC+', 'RFF+ON:')
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def parse_quietly(path, parse_filter=None):
+    """Sequential parse of a file; returns (file_type, parser)"""
+    content = read_edi_file(path)
+    # The Minebea parser prints debug lines while parsing
+    with contextlib.redirect_stdout(io.StringIO()):
+        return parse_content(path, content, parse_filter)
+
+
+def parsed_records(parser):
+    """What a parse produced, without the envelope report (checked separately)"""
+    return {
+        'header_info': parser.header_info,
+        'delivery_schedules': parser.delivery_schedules,
+        'line_items': parser.line_items,
+    }
+
+
+@pytest.fixture(params=SAMPLE_FILES, ids=os.path.basename)
+def sample_path(request):
+    return request.param
+
+
+@pytest.fixture
+def stripped_cummins(tmp_path):
+    """The Cummins sample with LOC and RFF+ON left out of every LIN group after the first.
+
+    The name keeps CUMMINS in it, partner detection goes by the file name."""
+    segments = read_bytes(CUMMINS_SAMPLE).decode('latin-1').split("'")
+    kept = []
+    lin_groups = 0
+    for segment in segments:
+        if segment.startswith('LIN+'):
+            lin_groups += 1
+        if lin_groups > 1 and segment.startswith(CARRIED_PREFIXES):
+            continue
+        kept.append(segment)
+    path = tmp_path / 'DELFOR_CUMMINS_stripped.edi'
+    path.write_bytes("'".join(kept).encode('latin-1'))
+    return str(path)
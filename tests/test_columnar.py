@@ -0,0 +1,29 @@
+from conftest import parse_quietly
+from edi_parser_columnar import ColumnarDeliveries, dumps, loads
+
+
+def test_round_trip(sample_path):
+    _, parser = parse_quietly(sample_path)
+    columnar = ColumnarDeliveries.from_deliveries(parser.delivery_schedules)
+    assert len(columnar) == len(parser.delivery_schedules)
+    assert columnar.to_deliveries() == parser.delivery_schedules
+
+
+def test_round_trip_out_of_band(sample_path):
+    _, parser = parse_quietly(sample_path)
+    header, buffers = dumps(ColumnarDeliveries.from_deliveries(parser.delivery_schedules))
+    assert buffers
+    assert loads(header, buffers).to_deliveries() == parser.delivery_schedules
+
+
+def test_missing_keys_stay_missing():
+    deliveries = [
+        {'Položka': 'A1', 'Datum': '01.02.2025', 'Množství': '10'},
+        {'Položka': 'A2', 'Množství': '5', 'Release': '1370'},
+        {'Položka': 'A1', 'Datum': '15.02.2025'},
+    ]
+    assert ColumnarDeliveries.from_deliveries(deliveries).to_deliveries() == deliveries
+
+
+def test_empty():
+    assert ColumnarDeliveries.from_deliveries([]).to_deliveries() == []
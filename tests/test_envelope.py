@@ -0,0 +1,54 @@
+import os
+import re
+
+import pytest
+
+from conftest import parse_quietly, read_bytes
+from edi_parser_envelope import format_envelope_report, validate_envelope_bytes
+
+
+@pytest.fixture
+def broken_copy(sample_path, tmp_path):
+    """Writes a changed copy of the sample under the same name (the partner is detected from it)"""
+    def write(change):
+        path = tmp_path / os.path.basename(sample_path)
+        path.write_bytes(change(read_bytes(sample_path)))
+        return str(path)
+    return write
+
+
+def reports(path):
+    """Envelope report of the parse pass and of the raw byte scan"""
+    _, parser = parse_quietly(path)
+    return parser.envelope_report, validate_envelope_bytes(read_bytes(path))
+
+
+def test_samples_are_valid(sample_path):
+    parsed, scanned = reports(sample_path)
+    assert parsed['Platné']
+    assert format_envelope_report(parsed) == "OK"
+    assert scanned == parsed
+
+
+def test_truncated_file(broken_copy):
+    path = broken_copy(lambda data: data[:data.rfind(b'UNT+')])
+    for report in reports(path):
+        assert not report['Platné']
+        assert any('chybí UNT' in error for error in report['Chyby'])
+
+
+def test_segment_count_mismatch(broken_copy):
+    # One more segment inside the message than UNT declares
+    path = broken_copy(lambda data: re.sub(rb"'(\s*)UNT\+", rb"'\1FTX+AAI+++X'\1UNT+", data, count=1))
+    parsed, scanned = reports(path)
+    assert not parsed['Platné']
+    assert any('UNT uvádí' in error for error in parsed['Chyby'])
+    assert scanned['Chyby'] == parsed['Chyby']
+
+
+def test_interchange_reference_mismatch(broken_copy):
+    path = broken_copy(lambda data: re.sub(rb"UNZ\+(\d+)\+[^']*", rb"UNZ+\1+WRONG", data))
+    parsed, scanned = reports(path)
+    assert not parsed['Platné']
+    assert any('UNZ má referenci WRONG' in error for error in parsed['Chyby'])
+    assert scanned == parsed
@@ -0,0 +1,53 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from conftest import parse_quietly, parsed_records, read_bytes
+from edi_parser_incremental import IncrementalParser
+
+
+def feed_in_chunks(path, data, chunk_size):
+    incremental = IncrementalParser(path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for start in range(0, len(data), chunk_size):
+            incremental.feed(data[start:start + chunk_size])
+        return incremental.finish()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 1 << 20])
+def test_incremental_matches_full_parse(sample_path, chunk_size):
+    file_type, full = parse_quietly(sample_path)
+    incremental_type, incremental = feed_in_chunks(sample_path, read_bytes(sample_path), chunk_size)
+    assert incremental_type == file_type
+    assert parsed_records(incremental) == parsed_records(full)
+    assert incremental.envelope_report == full.envelope_report
+
+
+def test_poll_reads_only_appended_bytes(sample_path, tmp_path):
+    data = read_bytes(sample_path)
+    path = tmp_path / os.path.basename(sample_path)
+    path.write_bytes(b'')
+    incremental = IncrementalParser(str(path))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for start in range(0, len(data), 500):
+            with open(path, 'ab') as f:
+                f.write(data[start:start + 500])
+            incremental.poll()
+            assert incremental.offset == min(start + 500, len(data))
+        assert incremental.poll() == 0
+        _, parser = incremental.finish()
+    _, full = parse_quietly(sample_path)
+    assert parsed_records(parser) == parsed_records(full)
+
+
+def test_poll_rejects_truncated_file(sample_path, tmp_path):
+    path = tmp_path / os.path.basename(sample_path)
+    path.write_bytes(read_bytes(sample_path))
+    incremental = IncrementalParser(str(path))
+    with contextlib.redirect_stdout(io.StringIO()):
+        incremental.poll()
+    path.write_bytes(b'')
+    with pytest.raises(ValueError):
+        incremental.poll()
@@ -0,0 +1,62 @@
+import os
+import shutil
+
+from conftest import CUMMINS_SAMPLE, parse_quietly, read_bytes
+from edi_parser_index import INDEX_SUFFIX, LazyEDIFile, SegmentIndex
+
+
+def parse_line_items(lazy):
+    """Deliveries and line items of every LIN group parsed on its own, in file order"""
+    deliveries, line_items = [], []
+    for number in range(lazy.index.line_item_count()):
+        parser = lazy.parse_line_item(number)
+        deliveries.extend(parser.delivery_schedules)
+        line_items.extend(parser.line_items)
+    return deliveries, line_items
+
+
+def test_line_items_match_full_parse(sample_path):
+    _, full = parse_quietly(sample_path)
+    lazy = LazyEDIFile(sample_path, cache=False)
+    assert parse_line_items(lazy) == (full.delivery_schedules, full.line_items)
+
+
+def test_messages_match_full_parse(sample_path):
+    _, full = parse_quietly(sample_path)
+    lazy = LazyEDIFile(sample_path, cache=False)
+    deliveries = []
+    for number in range(lazy.index.message_count()):
+        deliveries.extend(lazy.parse_message(number).delivery_schedules)
+    assert deliveries == full.delivery_schedules
+
+
+def test_line_items_keep_carried_order_and_location(stripped_cummins):
+    _, full = parse_quietly(stripped_cummins)
+    lazy = LazyEDIFile(stripped_cummins, cache=False)
+    deliveries, line_items = parse_line_items(lazy)
+    assert (deliveries, line_items) == (full.delivery_schedules, full.line_items)
+    # Only the first LIN group states RFF+ON, the later ones inherit it as in the original sample
+    _, original = parse_quietly(CUMMINS_SAMPLE)
+    orders = [(delivery['Položka'], delivery.get('Objednávka')) for delivery in deliveries]
+    assert orders == [(delivery['Položka'], delivery.get('Objednávka')) for delivery in original.delivery_schedules]
+    assert any(order for part, order in orders if part != line_items[0]['Položka'])
+
+
+def test_part_number_without_parse(sample_path):
+    _, full = parse_quietly(sample_path)
+    lazy = LazyEDIFile(sample_path, cache=False)
+    parts = [lazy.part_number(number) for number in range(lazy.index.line_item_count())]
+    assert parts == [item['Položka'] for item in full.line_items]
+    assert not lazy._parsed
+
+
+def test_cached_index_matches_fresh_scan(sample_path, tmp_path):
+    path = str(tmp_path / os.path.basename(sample_path))
+    shutil.copy(sample_path, path)
+    LazyEDIFile(path)
+    assert os.path.exists(path + INDEX_SUFFIX)
+    cached = SegmentIndex.load_cached(path)
+    fresh = SegmentIndex.build(read_bytes(path))
+    assert (cached.starts == fresh.starts).all()
+    assert (cached.ends == fresh.ends).all()
+    assert (cached.tags == fresh.tags).all()
@@ -0,0 +1,58 @@
+import contextlib
+import io
+import pickle
+
+import pytest
+
+from conftest import SAMPLE_FILES
+from edi_parser_batch import JobLedger, decode_result, encode_result
+from edi_parser_workspace import load_workspace_file
+
+
+def load_quietly(path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return load_workspace_file(path)
+
+
+def plain(result):
+    """A workspace result with its records as a list, for comparing"""
+    return {**result, 'Záznamy': result['Záznamy'].to_deliveries()}
+
+
+def run_jobs(ledger):
+    """Process every job of the ledger as one worker; returns the results by input"""
+    results = {}
+    filepath = ledger.claim('test')
+    while filepath is not None:
+        results[filepath] = load_quietly(filepath)
+        ledger.done(filepath, 'test', results[filepath])
+        filepath = ledger.claim('test')
+    return results
+
+
+def test_result_json_round_trip(sample_path):
+    result = load_quietly(sample_path)
+    assert plain(decode_result(encode_result(result))) == plain(result)
+
+
+def test_result_is_not_pickle(sample_path):
+    blob = pickle.dumps(plain(load_quietly(sample_path)))
+    with pytest.raises(ValueError):
+        decode_result(blob)
+
+
+def test_ledger_keeps_results(tmp_path):
+    with JobLedger(str(tmp_path / 'ledger.db')) as ledger:
+        assert ledger.add(SAMPLE_FILES) == len(SAMPLE_FILES)
+        expected = run_jobs(ledger)
+        assert ledger.done_inputs() == SAMPLE_FILES
+        assert [plain(result) for result in ledger.results()] == [plain(expected[path]) for path in SAMPLE_FILES]
+
+
+def test_ledger_skips_unreadable_result(tmp_path):
+    with JobLedger(str(tmp_path / 'ledger.db')) as ledger:
+        ledger.add(SAMPLE_FILES)
+        run_jobs(ledger)
+        ledger.connection.execute("UPDATE ulohy SET vysledek = ? WHERE vstup = ?",
+                                  (b'\x80\x04not json', SAMPLE_FILES[0]))
+        assert [result['Soubor'] for result in ledger.results()] == SAMPLE_FILES[1:]
@@ -0,0 +1,34 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from conftest import parse_quietly, parsed_records, read_bytes
+from edi_parser_parallel import chunks_self_contained, parse_file_parallel, plan_chunks, scan_boundaries
+
+
+@pytest.fixture(scope='module')
+def executor():
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+
+def test_parallel_matches_sequential(sample_path, executor):
+    file_type, sequential = parse_quietly(sample_path)
+    parallel_type, parallel = parse_file_parallel(sample_path, executor=executor, min_bytes=0)
+    assert parallel_type == file_type
+    assert parsed_records(parallel) == parsed_records(sequential)
+    assert parallel.envelope_report['Platné'] == sequential.envelope_report['Platné']
+
+
+def test_chunks_without_carried_segments_are_not_split(stripped_cummins):
+    data = read_bytes(stripped_cummins)
+    prefix, messages = scan_boundaries(data)
+    chunks = plan_chunks(prefix, messages, 8)
+    assert len(chunks) > 1
+    assert not chunks_self_contained(data, 'cummins', messages, chunks)
+
+
+def test_parallel_matches_sequential_with_carried_segments(stripped_cummins, executor):
+    _, sequential = parse_quietly(stripped_cummins)
+    _, parallel = parse_file_parallel(stripped_cummins, executor=executor, min_bytes=0)
+    assert parsed_records(parallel) == parsed_records(sequential)